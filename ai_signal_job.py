@@ -1,11 +1,11 @@
 import os
 import re
-from supabase import create_client
+from ingesters.db import get_supabase
 from openai import OpenAI
 from datetime import datetime, timedelta
 
 # === Supabase setup ===
-sb = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+sb = get_supabase()
 
 # === OpenAI setup ===
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -1,17 +1,19 @@
 import os
 import json
 import re
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 from datetime import datetime, timezone
 from openai import OpenAI
 
+from ingesters.writer import get_writer
+
 # ========= ENV =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 client = OpenAI(api_key=OPENAI_API_KEY)
+writer = get_writer("ai_signals", mode="upsert")
 
 # ========= FETCH =========
 def fetch_signals():
@@ -84,8 +86,8 @@ def store_ai_signal(signal, ai_json):
     }
 
     print(f"⬆️ Upserting row into ai_signals: {row}")
-    sb.table("ai_signals").upsert(row).execute()
-    print(f"✅ Stored AI signal for {signal['coin_symbol']}")
+    writer.put(row)
+    print(f"✅ Queued AI signal for {signal['coin_symbol']}")
 
 # ========= RUN =========
 def run_job():
@@ -96,6 +98,7 @@ def run_job():
             store_ai_signal(sig, ai_json)
         except Exception as e:
             print(f"❌ Error with {sig.get('coin_symbol', 'UNKNOWN')}: {e}")
+    writer.flush()
 
 if __name__ == "__main__":
     run_job()
@@ -2,7 +2,8 @@ import os
 import time
 import re
 from datetime import datetime, timedelta, timezone
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 from openai import OpenAI
 
 # ========= ENV VARS =========
@@ -14,7 +15,7 @@ LOOKBACK_HOURS = int(os.getenv("LOOKBACK_HOURS", "24"))  # default 24h
 if not SUPABASE_URL or not SUPABASE_KEY or not OPENAI_API_KEY:
     raise RuntimeError("Missing required environment variables")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 client = OpenAI(api_key=OPENAI_API_KEY)
 
 # ========= SIGNAL TYPES =========
@@ -143,19 +144,21 @@ Tasks:
 
     return label, confidence, detailed_summary, simple_summary, fdv_adj
 
+def run_cycle():
+    signals = fetch_recent_signals()
+    print(f"[fetch] {len(signals)} mid/long signals found in last {LOOKBACK_HOURS}h")
+
+    for row in signals:
+        try:
+            label, conf, detailed, simple, fdv_adj = score_signal(row)
+            upsert_ai_signal(row, conf, label, detailed, simple, fdv_adj)
+        except Exception as e:
+            print(f"[error scoring] {row}: {e}")
+
 def main():
     while True:
         try:
-            signals = fetch_recent_signals()
-            print(f"[fetch] {len(signals)} mid/long signals found in last {LOOKBACK_HOURS}h")
-
-            for row in signals:
-                try:
-                    label, conf, detailed, simple, fdv_adj = score_signal(row)
-                    upsert_ai_signal(row, conf, label, detailed, simple, fdv_adj)
-                except Exception as e:
-                    print(f"[error scoring] {row}: {e}")
-
+            run_cycle()
         except Exception as e:
             print("Fatal error:", e)
 
@@ -1,15 +1,8 @@
-import os
-from supabase import create_client
+from ingesters.db import get_supabase
 from datetime import datetime, timezone, date
 
 # ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing Supabase credentials")
-
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb = get_supabase()
 
 # ========= WEIGHTS =========
 WEIGHTS = {
@@ -141,7 +134,7 @@ def insert_signal(symbol, scores, vwap=None, delta=None, cvd=None):
 
 
 # ========= MAIN =========
-if __name__ == "__main__":
+def run():
     # get all distinct symbols from vwap table
     symbols_resp = sb.table("binance_vwap_agg").select("symbol").execute()
     all_symbols = sorted({row["symbol"] for row in symbols_resp.data if "symbol" in row})
@@ -152,6 +145,9 @@ if __name__ == "__main__":
         scores, vwap, delta, cvd = get_daybias_inputs(s, timeframe="1h")
         insert_signal(s, scores, vwap=vwap, delta=delta, cvd=cvd)
 
+if __name__ == "__main__":
+    run()
+
 
 
 
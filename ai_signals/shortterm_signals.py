@@ -1,15 +1,8 @@
-import os
-from supabase import create_client
+from ingesters.db import get_supabase
 from datetime import datetime, timezone
 
 # ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing Supabase credentials")
-
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb = get_supabase()
 
 # ========= WEIGHTS =========
 WEIGHTS = {
@@ -129,7 +122,7 @@ def insert_signal(symbol, timeframe, scores, trades):
     return sb.table("ai_signals_shortterm").insert(row).execute()
 
 # ========= MAIN =========
-if __name__ == "__main__":
+def run():
     symbols = get_all_symbols()  # ✅ fetch all Binance USDT pairs dynamically
     for s in symbols:
         try:
@@ -138,3 +131,6 @@ if __name__ == "__main__":
             print(f"[OK] {s} inserted")
         except Exception as e:
             print(f"[ERROR] {s}: {e}")
+
+if __name__ == "__main__":
+    run()
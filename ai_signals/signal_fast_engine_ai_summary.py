@@ -1,7 +1,8 @@
 import os
 import json
 import re
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 from datetime import datetime, timezone
 from openai import OpenAI
 import time
@@ -17,7 +18,7 @@ if not SUPABASE_URL or not SUPABASE_KEY or not OPENAI_API_KEY:
     raise ValueError("❌ Missing SUPABASE_URL, SUPABASE_KEY, or OPENAI_API_KEY in environment variables")
 
 # Create Supabase and OpenAI clients
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 client = OpenAI(api_key=OPENAI_API_KEY)
 
 # =========================================================
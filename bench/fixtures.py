@@ -0,0 +1,130 @@
+# bench/fixtures.py
+"""
+Seeded, deterministic inputs for the hot-path benchmarks, shaped like the
+Binance / Deribit / Supabase payloads each function normally receives.
+"""
+import random
+from datetime import datetime, timezone, timedelta
+
+import pandas as pd
+
+SEED = 1337
+T0_MS = 1_717_200_000_000  # fixed epoch (2024-06-01) so buckets are stable run to run
+
+
+def symbols(n: int) -> list[str]:
+    return [f"SYM{i:03d}USDT" for i in range(n)]
+
+
+def spot_trades(n: int, seed: int = SEED, span_ms: int = 3_600_000) -> list[dict]:
+    """/api/v3/trades response: n trades spread over span_ms."""
+    rnd = random.Random(seed)
+    px = 100.0
+    out = []
+    for i in range(n):
+        px *= 1 + rnd.gauss(0, 0.0005)
+        qty = round(rnd.expovariate(2.0), 6)
+        out.append({
+            "id": 1_000_000 + i,
+            "price": f"{px:.4f}",
+            "qty": f"{qty:.6f}",
+            "quoteQty": f"{px * qty:.6f}",
+            "time": T0_MS + i * span_ms // max(n, 1),
+            "isBuyerMaker": rnd.random() < 0.5,
+            "isBestMatch": True,
+        })
+    return out
+
+
+def trade_rows(n_symbols: int, per_symbol: int, seed: int = SEED) -> list[dict]:
+    """binance_trades rows as the backfill reads them back from Supabase."""
+    rows = []
+    for s_i, sym in enumerate(symbols(n_symbols)):
+        for t in spot_trades(per_symbol, seed + s_i, span_ms=6 * 3_600_000):
+            price, qty = float(t["price"]), float(t["qty"])
+            rows.append({
+                "symbol": sym,
+                "trade_id": t["id"],
+                "price": price,
+                "qty": qty,
+                "quote_qty": price * qty,
+                "side": "SELL" if t["isBuyerMaker"] else "BUY",
+                "is_buyer_maker": t["isBuyerMaker"],
+                "ts": datetime.fromtimestamp(t["time"] / 1000, tz=timezone.utc).isoformat(),
+            })
+    return rows
+
+
+def depth_levels(n: int, mid: float, seed: int = SEED, tick: float = 0.01):
+    rnd = random.Random(seed)
+    bids = [[f"{mid - tick * (i + 1):.2f}", f"{rnd.uniform(0.01, 50):.4f}"] for i in range(n)]
+    asks = [[f"{mid + tick * (i + 1):.2f}", f"{rnd.uniform(0.01, 50):.4f}"] for i in range(n)]
+    return bids, asks
+
+
+def depth_snapshot(levels: int = 1000, mid: float = 65_000.0, seed: int = SEED) -> dict:
+    """/fapi/v1/depth response."""
+    bids, asks = depth_levels(levels, mid, seed, tick=0.1)
+    return {"lastUpdateId": 1, "E": T0_MS, "T": T0_MS, "bids": bids, "asks": asks}
+
+
+def depth10_frames(n_symbols: int, per_symbol: int, seed: int = SEED) -> list[tuple[str, dict]]:
+    """(symbol, payload) pairs as stream_orderbook hands them to handle_message."""
+    out = []
+    for s_i, sym in enumerate(symbols(n_symbols)):
+        for k in range(per_symbol):
+            bids, asks = depth_levels(10, 100.0 + s_i, seed + s_i * 1000 + k)
+            out.append((sym.lower(), {
+                "e": "depthUpdate", "E": T0_MS + k * 500, "T": T0_MS + k * 500,
+                "s": sym, "U": k, "u": k + 1, "pu": k, "b": bids, "a": asks,
+            }))
+    return out
+
+
+def depth_diffs(n: int, mid: float = 65_000.0, seed: int = SEED, levels: int = 1000) -> list[dict]:
+    """@depth@100ms diff events continuing depth_snapshot(levels, mid) (lastUpdateId 1)."""
+    rnd = random.Random(seed)
+    out, u = [], 1
+    for k in range(n):
+        sides = {"b": [], "a": []}
+        for _ in range(rnd.randint(5, 30)):
+            side = rnd.choice("ba")
+            off = rnd.randint(1, levels) * 0.1
+            px = mid - off if side == "b" else mid + off
+            qty = 0.0 if rnd.random() < 0.3 else rnd.uniform(0.01, 50)
+            sides[side].append([f"{px:.1f}", f"{qty:.4f}"])
+        out.append({"e": "depthUpdate", "E": T0_MS + k * 100, "T": T0_MS + k * 100, "s": "BTCUSDT",
+                    "U": u if k else 1, "u": u + 3, "pu": u, "b": sides["b"], "a": sides["a"]})
+        u += 3
+    return out
+
+
+def option_chain(n_strikes: int = 200, seed: int = SEED):
+    """(expiration, {expiration: [instrument names]}, [book summaries]) for maxpain."""
+    rnd = random.Random(seed)
+    exp = datetime(2024, 6, 28, tzinfo=timezone.utc).date()
+    names, summaries = [], []
+    for i in range(n_strikes):
+        strike = 20_000 + i * 500
+        for kind in ("C", "P"):
+            name = f"BTC-28JUN24-{strike}-{kind}"
+            names.append(name)
+            summaries.append({"instrument_name": name, "open_interest": round(rnd.uniform(0, 500), 1)})
+    return exp, {exp: names}, summaries
+
+
+def klines_df(n: int = 1000, symbol: str = "BTCUSDT", interval: str = "1h", seed: int = SEED) -> pd.DataFrame:
+    """fetch_klines() output."""
+    rnd = random.Random(seed)
+    t0 = datetime.fromtimestamp(T0_MS / 1000, tz=timezone.utc)
+    px, rows = 65_000.0, []
+    for i in range(n):
+        o = px
+        c = px = px * (1 + rnd.gauss(0, 0.004))
+        rows.append({
+            "symbol": symbol, "interval": interval,
+            "ts": (t0 + timedelta(hours=i)).isoformat(),
+            "open": o, "high": max(o, c) * 1.002, "low": min(o, c) * 0.998, "close": c,
+            "volume": rnd.uniform(10, 1000),
+        })
+    return pd.DataFrame(rows)
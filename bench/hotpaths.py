@@ -0,0 +1,399 @@
+# bench/hotpaths.py
+"""
+Throughput benchmarks for the aggregation hot paths.
+
+Every benchmark feeds seeded fixtures (bench/fixtures.py) straight into the
+function under test, with Binance/Deribit fetches and Supabase writes swapped
+for in-memory fakes, so the numbers are pure CPU and repeatable offline.
+
+    python -m bench.hotpaths                          # JSON to stdout
+    python -m bench.hotpaths --symbols 200 --out bench/results.json
+    python -m bench.hotpaths --compare bench/baseline.json --tolerance 0.2
+
+--compare exits 1 when any benchmark's items/sec drops more than
+--tolerance below the baseline, so it can gate CI.
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import contextlib
+
+# Keep the writer's spool, symbol cache and checkpoints out of the real dirs and never
+# touch Supabase: ingesters.db hands every module the fake below.
+os.environ.setdefault("WRITER_SPOOL", "0")
+os.environ.setdefault("SYMBOL_CACHE_DIR", tempfile.mkdtemp(prefix="bench_symbols_"))
+os.environ.setdefault("CHECKPOINT_DIR", tempfile.mkdtemp(prefix="bench_checkpoints_"))
+
+from bench import fixtures  # noqa: E402
+
+
+# ========= FAKES =========
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self._range = None
+        self._op = "select"
+
+    def select(self, *_a, **_k):
+        return self
+
+    def order(self, *_a, **_k):
+        return self  # fixtures are already in time order
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def upsert(self, rows, **_k):
+        self._op, self._rows = "write", rows
+        return self
+
+    insert = upsert
+
+    def execute(self):
+        if self._op == "write":
+            rows = self._rows if isinstance(self._rows, list) else [self._rows]
+            self.db.written[self.table] = self.db.written.get(self.table, 0) + len(rows)
+            return _Result(rows)
+        data = self.db.tables.get(self.table, [])
+        if self._range:
+            data = data[self._range[0]:self._range[1] + 1]
+        return _Result(data)
+
+
+class FakeSupabase:
+    """Just enough of supabase-py for the code paths benchmarked here."""
+
+    def __init__(self):
+        self.tables = {}
+        self.written = {}
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+class NullWriter:
+    """Stands in for a TableWriter: counts rows, writes nothing."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def put_many(self, rows):
+        self.rows += len(rows)
+
+    async def aput_many(self, rows):
+        self.rows += len(rows)
+
+    async def aput(self, row):
+        self.rows += 1
+
+    def flush(self, timeout=None):
+        return True
+
+    def losses(self):
+        return 0
+
+    def flush_committed(self, since, timeout=None):
+        return True
+
+
+FAKE_DB = FakeSupabase()
+import ingesters.db  # noqa: E402
+ingesters.db._client = FAKE_DB
+
+
+# ========= BENCHMARKS =========
+# Each returns (fn, items, unit): fn() runs one full pass over `items` units.
+
+def _async_runner(coro_factory):
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(coro_factory())
+
+
+def bench_trades_agg(scale):
+    from ingesters import binance_trades_agg_ingest as mod
+    from ingesters.footprint import Footprint
+    from ingesters.trade_buckets import TradeBuckets
+    from ingesters.vwap import VwapEngine
+    trades = {s: fixtures.spot_trades(1000, fixtures.SEED + i) for i, s in enumerate(fixtures.symbols(scale))}
+
+    async def fetch(symbol="BTCUSDT", limit=1000):
+        return trades[symbol]
+    mod.get_binance_trades = fetch
+    mod.writer, mod.writer_5m, mod.buckets_writer = NullWriter(), NullWriter(), NullWriter()
+    mod.footprint_writer = NullWriter()
+
+    async def run():
+        # fresh state each pass, or the seen-id filter skips every trade
+        mod.tb, mod.fp, mod.vwap = TradeBuckets(), Footprint(), VwapEngine()
+        for s in trades:
+            await mod.process_trades(symbol=s)
+    return _async_runner(run), 1000 * scale, "trades"
+
+
+def bench_trade_buckets(scale):
+    from ingesters.trade_buckets import TradeBuckets, bucket_rows
+    trades = {s: fixtures.spot_trades(1000, fixtures.SEED + i) for i, s in enumerate(fixtures.symbols(scale))}
+
+    def run():
+        tb = TradeBuckets()
+        for s, ts in trades.items():
+            tb.add_trades(s, ts)
+        bucket_rows(tb.drain())
+    return run, 1000 * scale, "trades"
+
+
+def bench_footprint(scale):
+    from ingesters.footprint import Footprint
+    trades = {s: fixtures.spot_trades(1000, fixtures.SEED + i) for i, s in enumerate(fixtures.symbols(scale))}
+
+    def run():
+        fp = Footprint()
+        for s, ts in trades.items():
+            fp.add_trades(s, ts)
+        fp.drain()
+    return run, 1000 * scale, "trades"
+
+
+def bench_vwap(scale):
+    from ingesters.vwap import VwapEngine
+    trades = {s: fixtures.spot_trades(1000, fixtures.SEED + i) for i, s in enumerate(fixtures.symbols(scale))}
+
+    def run():
+        vw = VwapEngine()
+        for s, ts in trades.items():
+            vw.add_trades(s, ts)
+        vw.drain(max(t["time"] for ts in trades.values() for t in ts))
+    return run, 1000 * scale, "trades"
+
+
+def bench_trades_agg_backfill(scale):
+    import bisect
+    from ingesters import checkpoint
+    from ingesters import binance_trades_agg_backfill as mod
+    rows = fixtures.trade_rows(scale, 1000)
+    by_symbol, keys = {}, {}
+    for r in rows:
+        by_symbol.setdefault(r["symbol"], []).append(r)
+        keys.setdefault(r["symbol"], []).append((_ms(r["ts"]), r["trade_id"]))
+
+    def fetch_page(symbol, start, end, after):
+        # keyset page over the in-memory table, like the (ts, trade_id) index scan
+        k = keys[symbol]
+        i = bisect.bisect_left(k, (_ms(start), -1))
+        if after:
+            i = max(i, bisect.bisect_right(k, (_ms(after[0]), after[1])))
+        j = min(bisect.bisect_left(k, (_ms(end), -1)), i + mod.BATCH_SIZE)
+        return by_symbol[symbol][i:j]
+    mod.fetch_page = fetch_page
+    days = sorted({t - t % mod.DAY_MS for ks in keys.values() for t, _ in ks})
+    mod._days = lambda n: days
+    mod.writer, mod.buckets_writer = NullWriter(), NullWriter()
+    # per-page checkpoints go to a throwaway dir, whatever CHECKPOINT_DIR says
+    checkpoint.CHECKPOINT_DIR = tempfile.mkdtemp(prefix="bench_backfill_")
+
+    def run():
+        _, failed = mod.backfill(list(by_symbol), resume=False)
+        if failed:
+            raise RuntimeError(f"backfill failed for {len(failed)} symbols: {failed[:5]}")
+    return run, len(rows), "trades"
+
+
+def _ms(iso: str) -> int:
+    from datetime import datetime
+    return int(datetime.fromisoformat(iso).timestamp() * 1000)
+
+
+def bench_orderbook_handle_message(scale):
+    from ingesters import binance_orderbook_ingest as mod
+    frames = fixtures.depth10_frames(scale, 20)
+    mod.writer = NullWriter()
+
+    async def run():
+        mod._last_debug.clear()
+        for sym, payload in frames:
+            await mod.handle_message(sym, payload)
+    return _async_runner(run), len(frames), "messages"
+
+
+def bench_local_book(scale):
+    from ingesters.local_book import LocalBook
+    snap = fixtures.depth_snapshot(1000)
+    diffs = fixtures.depth_diffs(200 * scale)
+
+    def run():
+        book = LocalBook("BTCUSDT")
+        book.load_snapshot(snap)
+        for i, ev in enumerate(diffs):
+            if not book.apply(ev):
+                raise RuntimeError(f"out of sequence at {i}")
+            if i % 5 == 4:   # one 500ms sample per five diffs
+                book.top(10)
+                book.notional_within_bps(25)
+    return run, len(diffs), "diffs"
+
+
+def bench_heatmap_bucketize(scale):
+    from ingesters import heatmap
+    snaps = [fixtures.depth_snapshot(1000, 100.0 + i, fixtures.SEED + i) for i in range(scale)]
+
+    def run():
+        for i, depth in enumerate(snaps):
+            heatmap.bucketize_depth(f"SYM{i:03d}USDT", "binance", depth, bucket_bps=10.0)
+    return run, 2000 * scale, "levels"
+
+
+def bench_maxpain(scale):
+    from ingesters import maxpain
+    exp, chain, summaries = fixtures.option_chain(200)
+    maxpain.get_chain = lambda currency="BTC": chain
+    maxpain.get_book_summaries = lambda names: summaries
+
+    def run():
+        for _ in range(max(1, scale // 10)):
+            maxpain.compute_max_pain_for_exp("BTC", "deribit", exp)
+    return run, len(summaries) * max(1, scale // 10), "instruments"
+
+
+def bench_ohlcv_indicators(scale):
+    from ingesters import binance_ohlcv_with_rsi as mod
+    frames = [fixtures.klines_df(1000, f"SYM{i:03d}USDT", seed=fixtures.SEED + i) for i in range(max(1, scale // 5))]
+    mod.upsert = lambda table, records, on_conflict: None
+
+    def run():
+        for df in frames:
+            mod.compute_and_upsert_indicators(df)
+    return run, 1000 * len(frames), "candles"
+
+
+BENCHMARKS = {
+    "trades_agg.process_trades": bench_trades_agg,
+    "trade_buckets.add_trades": bench_trade_buckets,
+    "footprint.add_trades": bench_footprint,
+    "vwap.add_trades": bench_vwap,
+    "trades_agg_backfill.backfill": bench_trades_agg_backfill,
+    "orderbook.handle_message": bench_orderbook_handle_message,
+    "local_book.apply": bench_local_book,
+    "heatmap.bucketize_depth": bench_heatmap_bucketize,
+    "maxpain.compute_max_pain_for_exp": bench_maxpain,
+    "ohlcv.compute_and_upsert_indicators": bench_ohlcv_indicators,
+}
+
+
+# ========= RUNNER =========
+def measure(fn, repeat: int) -> list[float]:
+    """Wall times of `repeat` passes; a pass that raises fails the benchmark instead of posting a number."""
+    times, out = [], io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            fn()  # warm-up: imports, caches, first-call allocations
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - t0)
+    except Exception:
+        # the job's own logs say why; they were swallowed with the rest of stdout
+        sys.stderr.write(out.getvalue()[-4000:])
+        raise
+    return times
+
+
+def git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, scale: int, repeat: int) -> dict:
+    results = []
+    for name in names:
+        fn, items, unit = BENCHMARKS[name](scale)
+        times = measure(fn, repeat)
+        med = statistics.median(times)
+        results.append({
+            "name": name,
+            "unit": unit,
+            "items": items,
+            "repeat": repeat,
+            "best_s": round(min(times), 6),
+            "median_s": round(med, 6),
+            "per_sec": round(items / med, 1) if med else None,
+        })
+        print(f"[bench] {name:<38} {items / med:>14,.0f} {unit}/s  (median {med * 1000:.1f} ms)",
+              file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_rev": git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": fixtures.SEED,
+            "scale_symbols": scale,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline_path: str, tolerance: float) -> list[str]:
+    with open(baseline_path) as f:
+        base = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in report["results"]:
+        b = base.get(r["name"])
+        if not b or not b.get("per_sec") or not r.get("per_sec"):
+            continue
+        change = r["per_sec"] / b["per_sec"] - 1
+        r["vs_baseline"] = round(change, 4)
+        if change < -tolerance:
+            regressions.append(f"{r['name']}: {b['per_sec']:,.0f} → {r['per_sec']:,.0f} {r['unit']}/s ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=50, help="symbol count fixtures are scaled to")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="comma-separated benchmark names")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    report = run(names, args.symbols, args.repeat)
+    regressions = compare(report, args.compare, args.tolerance) if args.compare else []
+
+    out = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+    for line in regressions:
+        print(f"[bench] ❌ regression {line}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
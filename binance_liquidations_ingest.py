@@ -1,21 +1,21 @@
-import os
 import json
 import asyncio
 import websockets
-from supabase import create_client, Client
 from datetime import datetime, timezone
 from websockets.exceptions import ConnectionClosedError, ConnectionClosed
 
-# ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
+from ingesters.binance_http import BINANCE_FSTREAM
+from ingesters.metrics import WS_MESSAGES, WS_RECONNECTS
+from ingesters.writer import get_writer
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# ========= WRITER =========
+# upsert on the event's natural key (sql/natural_keys.sql): spool replays and
+# retries re-send whole chunks, which must not duplicate liquidations
+writer = get_writer("binance_liquidations", mode="upsert", on_conflict="symbol,time,side,price,quantity",
+                    event_time="time")
 
 # Binance liquidation stream (all symbols)
-BINANCE_WS_URL = "wss://fstream.binance.com/ws/!forceOrder@arr"
+BINANCE_WS_URL = f"{BINANCE_FSTREAM}/ws/!forceOrder@arr"
 
 async def save_liquidation(data):
     order = data["o"]
@@ -29,7 +29,7 @@ async def save_liquidation(data):
         "time": ts
     }
 
-    sb.table("binance_liquidations").insert(row).execute()
+    await writer.aput(row)
     print(f"[liquidation] {row['symbol']} {row['side']} {row['price']} x {row['quantity']}")
 
 async def listen():
@@ -47,15 +47,18 @@ async def listen():
                     try:
                         msg = await asyncio.wait_for(ws.recv(), timeout=45)
                         data = json.loads(msg)
+                        WS_MESSAGES.labels("binance_liquidations", 0).inc()
                         await save_liquidation(data)
                     except asyncio.TimeoutError:
                         # send ping manually if no msgs
                         print("⚠️ No message in 45s, sending ping")
                         await ws.ping()
         except (ConnectionClosed, ConnectionClosedError) as e:
+            WS_RECONNECTS.labels("binance_liquidations", 0).inc()
             print(f"⚠️ Connection lost: {e} → reconnecting in 5s")
             await asyncio.sleep(5)
         except Exception as e:
+            WS_RECONNECTS.labels("binance_liquidations", 0).inc()
             print(f"⚠️ Unexpected error: {e} → reconnecting in 10s")
             await asyncio.sleep(10)
 
@@ -1,41 +1,31 @@
 import os
-import time
-import requests
+import asyncio
 from datetime import datetime, timezone
-from supabase import create_client, Client
+
+from ingesters.binance_http import BINANCE_FAPI, get_json, close_client
+from ingesters.symbols import PERP
+from ingesters.writer import get_writer
 
 # ========= ENV VARS (Railway) =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 LIMIT_SYMBOLS = int(os.getenv("LIMIT_SYMBOLS", "0"))
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-BINANCE_FAPI = "https://fapi.binance.com"
+writer = get_writer("market_data", mode="upsert")
 
 def iso_now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
-def get_perp_symbols():
-    r = requests.get(f"{BINANCE_FAPI}/fapi/v1/exchangeInfo", timeout=10)
-    r.raise_for_status()
-    data = r.json()
-    symbols = [s["symbol"] for s in data["symbols"] if s["quoteAsset"] == "USDT" and s["contractType"] == "PERPETUAL"]
-    if LIMIT_SYMBOLS > 0:
-        symbols = symbols[:LIMIT_SYMBOLS]
+async def get_perp_symbols():
+    symbols = await PERP.symbols(quote="USDT", limit=LIMIT_SYMBOLS)
     print(f"[symbols] Found {len(symbols)} USDT-PERP symbols.")
     return symbols
 
-def fetch_market_data(symbols):
+async def fetch_market_data(symbols):
+    """One all-symbol ticker call (weight 40) instead of one call per symbol."""
     rows = []
+    tickers = {d["symbol"]: d for d in await get_json(f"{BINANCE_FAPI}/fapi/v1/ticker/24hr")}
     for sym in symbols:
         try:
-            r = requests.get(f"{BINANCE_FAPI}/fapi/v1/ticker/24hr?symbol={sym}", timeout=10)
-            r.raise_for_status()
-            d = r.json()
+            d = tickers[sym]
             rows.append({
                 "ts": iso_now(),
                 "symbol": sym,
@@ -46,24 +36,30 @@ def fetch_market_data(symbols):
         except Exception as e:
             print(f"[error] {sym}: {e}")
             continue
-        time.sleep(0.1)  # polite delay
     return rows
 
 def upsert_market_data(rows):
     if not rows:
         return
     print(f"[upsert] {len(rows)} market rows…")
-    sb.table("market_data").upsert(rows).execute()
+    writer.put_many(rows)
+    writer.flush()
 
-def main():
+async def run_cycle():
     print("Starting Market Data Job…")
-    symbols = get_perp_symbols()
-    rows = fetch_market_data(symbols)
-    upsert_market_data(rows)
+    symbols = await get_perp_symbols()
+    rows = await fetch_market_data(symbols)
+    await asyncio.to_thread(upsert_market_data, rows)
     print("Done.")
 
+async def main():
+    try:
+        await run_cycle()
+    finally:
+        await close_client()
+
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
 
 
@@ -1,65 +1,244 @@
+"""
+orderflow_cvd: taker buy/sell volume, delta, VWAP, funding and open interest per USDT perp.
+
+Two collection modes (ORDERFLOW_SOURCE, default "stream"):
+
+- stream: `stream()` keeps futures @aggTrade shards open for every USDT perp
+  and folds prints into per-symbol rolling 1m windows. Every ORDERFLOW_EVERY
+  seconds it writes one snapshot: delta over ORDERFLOW_DELTA_MINUTES and
+  VWAP over ORDERFLOW_VWAP_MINUTES come from the windows. Funding and mark
+  price for all symbols come from one /fapi/v1/premiumIndex call. Open
+  interest (no bulk endpoint) is fetched concurrently, each call capped at
+  ORDERFLOW_TIMEOUT. At startup the windows are seeded from 1m klines
+  (taker buy volume included), so the first snapshot already has full windows.
+- rest: `run_cycle()`, the original per-symbol poller (trades, fundingRate,
+  openInterest and klines for each of LIMIT_SYMBOLS symbols).
+"""
 import os
 import time
-import requests
+import asyncio
 from datetime import datetime, timezone
-from supabase import create_client, Client
-
-# ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-LIMIT_SYMBOLS = int(os.getenv("LIMIT_SYMBOLS", "100"))
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
+from ingesters.binance_http import BINANCE_FAPI, BINANCE_FSTREAM, get_json, close_client
+from ingesters.symbols import PERP
+from ingesters.writer import get_writer
+from ingesters.ws_shards import ShardSet
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# ========= ENV VARS =========
+LIMIT_SYMBOLS = int(os.getenv("LIMIT_SYMBOLS", "100"))            # rest mode only
+ORDERFLOW_EVERY = int(os.getenv("ORDERFLOW_EVERY", "300"))         # seconds between snapshots
+ORDERFLOW_VWAP_MINUTES = int(os.getenv("ORDERFLOW_VWAP_MINUTES", "50"))    # the old 50 x 1m klines
+ORDERFLOW_DELTA_MINUTES = int(os.getenv("ORDERFLOW_DELTA_MINUTES", "5"))
+ORDERFLOW_TIMEOUT = float(os.getenv("ORDERFLOW_TIMEOUT", "5"))     # per REST call in a snapshot
+SHARD_SIZE = int(os.getenv("ORDERFLOW_WS_SHARD_SIZE", "100"))
 
-BINANCE_FAPI = "https://fapi.binance.com"
+writer = get_writer("orderflow_cvd", mode="upsert", event_time="ts")
 
 # ========= HELPERS =========
 def iso_now():
     return datetime.now(timezone.utc).isoformat()
 
-def get_symbols():
+async def get_symbols():
     """Fetch all USDT perpetual pairs"""
-    resp = requests.get(f"{BINANCE_FAPI}/fapi/v1/exchangeInfo")
-    resp.raise_for_status()
-    symbols = [
-        s["symbol"] for s in resp.json()["symbols"]
-        if s["contractType"] == "PERPETUAL" and s["quoteAsset"] == "USDT"
-    ]
-    return symbols[:LIMIT_SYMBOLS]
-
-def fetch_orderflow(symbol):
+    return await PERP.symbols(quote="USDT", limit=LIMIT_SYMBOLS)
+
+
+# ========= ROLLING WINDOWS =========
+class RollingWindows:
+    """Per-symbol 1m slots of [buy qty, sell qty, price * qty] over the last `minutes` minutes."""
+
+    def __init__(self, minutes: int):
+        self.minutes = minutes
+        self.slots = {}   # symbol → {minute: [buy, sell, pv]}
+        self.first = {}   # symbol → minute of the first streamed trade since the shards (re)started
+
+    def add(self, symbol: str, ts_ms: int, price: float, qty: float, is_sell: bool):
+        minute = ts_ms // 60_000
+        slots = self.slots.get(symbol)
+        if slots is None:
+            slots = self.slots[symbol] = {}
+        if symbol not in self.first:
+            self.first[symbol] = minute
+        slot = slots.get(minute)
+        if slot is None:
+            slot = slots[minute] = [0.0, 0.0, 0.0]
+        slot[1 if is_sell else 0] += qty
+        slot[2] += price * qty
+
+    def seed(self, symbol: str, klines: list):
+        """Fill minutes up to the first streamed one from 1m klines.
+
+        The stream joined its first minute part-way, so that minute takes the
+        kline's numbers too; later trades keep adding to it. Only minutes after
+        it are left to the stream.
+        """
+        slots = self.slots.setdefault(symbol, {})
+        first = self.first.get(symbol)
+        for k in klines:
+            minute = k[0] // 60_000
+            if first is not None and minute > first:
+                continue
+            high, low, close, vol, taker_buy = float(k[2]), float(k[3]), float(k[4]), float(k[5]), float(k[9])
+            slots[minute] = [taker_buy, vol - taker_buy, (high + low + close) / 3 * vol]
+
+    def totals(self, symbol: str, now_ms: int, minutes: int) -> tuple[float, float, float]:
+        """(buy, sell, price * qty) over the last `minutes` minutes, current one included."""
+        slots = self.slots.get(symbol) or {}
+        now_min = now_ms // 60_000
+        buy = sell = pv = 0.0
+        for minute, (b, s, p) in slots.items():
+            if minute > now_min - minutes:
+                buy += b
+                sell += s
+                pv += p
+        return buy, sell, pv
+
+    def prune(self, now_ms: int):
+        cutoff = now_ms // 60_000 - self.minutes
+        for slots in self.slots.values():
+            for minute in [m for m in slots if m <= cutoff]:
+                del slots[minute]
+
+
+windows = RollingWindows(max(ORDERFLOW_VWAP_MINUTES, ORDERFLOW_DELTA_MINUTES))
+
+
+# ========= STREAM MODE =========
+async def on_stream_message(stream, payload):
+    if payload.get("e") != "aggTrade":
+        return
+    windows.add(payload["s"], payload["T"], float(payload["p"]), float(payload["q"]), payload["m"])
+
+
+SHARDS = ShardSet("orderflow_cvd", BINANCE_FSTREAM, on_stream_message, shard_size=SHARD_SIZE)
+
+
+def stream_symbols():
+    return PERP.select(quote="USDT", status="TRADING")
+
+
+async def _with_timeout(coro, default=None):
+    try:
+        return await asyncio.wait_for(coro, ORDERFLOW_TIMEOUT)
+    except Exception:
+        return default
+
+
+async def seed_windows(symbols):
+    minutes = windows.minutes
+
+    async def seed(symbol):
+        klines = await _with_timeout(get_json(f"{BINANCE_FAPI}/fapi/v1/klines",
+                                              params={"symbol": symbol, "interval": "1m", "limit": minutes}))
+        if klines:
+            windows.seed(symbol, klines)
+
+    await asyncio.gather(*(seed(s) for s in symbols))
+    print(f"[orderflow_cvd] seeded {minutes}m windows for {len(symbols)} perps")
+
+
+async def fetch_premium_index() -> dict:
+    """markPrice / indexPrice / lastFundingRate for every perp in one call."""
+    data = await get_json(f"{BINANCE_FAPI}/fapi/v1/premiumIndex")
+    return {d["symbol"]: d for d in data}
+
+
+async def fetch_open_interest(symbol):
+    oi = await get_json(f"{BINANCE_FAPI}/fapi/v1/openInterest", params={"symbol": symbol})
+    return float(oi["openInterest"]) if oi else None
+
+
+def _float(v):
+    return float(v) if v not in (None, "") else None
+
+
+async def snapshot(symbols):
+    """One orderflow_cvd row per symbol from the windows, premiumIndex and open interest."""
+    started = time.monotonic()
+    premium, ois = await asyncio.gather(
+        _with_timeout(fetch_premium_index(), {}),
+        asyncio.gather(*(_with_timeout(fetch_open_interest(s)) for s in symbols)),
+    )
+    now_ms, ts = int(time.time() * 1000), iso_now()
+    windows.prune(now_ms)
+    rows = []
+    for symbol, oi in zip(symbols, ois):
+        buy, sell, _ = windows.totals(symbol, now_ms, ORDERFLOW_DELTA_MINUTES)
+        vbuy, vsell, pv = windows.totals(symbol, now_ms, ORDERFLOW_VWAP_MINUTES)
+        p = premium.get(symbol) or {}
+        rows.append({
+            "ts": ts,
+            "symbol": symbol,
+            "buys_volume": buy,
+            "sells_volume": sell,
+            "delta": buy - sell,
+            "funding_rate": _float(p.get("lastFundingRate")),
+            "open_interest": oi,
+            "vwap": pv / (vbuy + vsell) if vbuy + vsell else None,
+            "mark_price": _float(p.get("markPrice")),
+            "index_price": _float(p.get("indexPrice")),
+        })
+    await writer.aput_many(rows)
+    missing = sum(oi is None for oi in ois)
+    print(f"✅ [orderflow_cvd] snapshot of {len(rows)} perps in {time.monotonic() - started:.1f}s"
+          + (f" ({missing} without open interest)" if missing else "")
+          + ("" if premium else " ⚠️ premiumIndex unavailable"))
+    return rows
+
+
+async def on_universe_change(added, removed):
+    print(f"🔁 [orderflow_cvd] universe changed (+{sorted(added)} -{sorted(removed)}) → resharding")
+    symbols = stream_symbols()
+    SHARDS.start([f"{s.lower()}@aggTrade" for s in symbols])
+    await seed_windows(sorted(added))
+
+
+async def stream():
+    """Long-running bulk mode: aggTrade windows plus a snapshot every ORDERFLOW_EVERY seconds."""
+    await PERP.load()
+    symbols = stream_symbols()
+    windows.first.clear()   # minutes missed while down are re-seeded from klines
+    SHARDS.start([f"{s.lower()}@aggTrade" for s in symbols])
+    PERP.subscribe(on_universe_change)
+    try:
+        await seed_windows(symbols)
+        while True:
+            # snapshots land on wall-clock multiples of ORDERFLOW_EVERY, like the old cadence
+            await asyncio.sleep(ORDERFLOW_EVERY - time.time() % ORDERFLOW_EVERY)
+            try:
+                await snapshot(stream_symbols())
+            except Exception as e:
+                print(f"[orderflow_cvd] ❌ snapshot failed: {e}")
+    finally:
+        # run_stream re-invokes main() after a crash; don't stack listeners
+        PERP.unsubscribe(on_universe_change)
+        SHARDS.stop()
+
+
+# ========= REST MODE =========
+async def fetch_orderflow(symbol):
     """Get buy/sell volume and delta from trades"""
-    url = f"{BINANCE_FAPI}/fapi/v1/trades?symbol={symbol}&limit=1000"
-    resp = requests.get(url)
-    resp.raise_for_status()
-    trades = resp.json()
+    trades = await get_json(f"{BINANCE_FAPI}/fapi/v1/trades", params={"symbol": symbol, "limit": 1000})
 
     buy_vol = sum(float(t["qty"]) for t in trades if not t["isBuyerMaker"])
     sell_vol = sum(float(t["qty"]) for t in trades if t["isBuyerMaker"])
     delta = buy_vol - sell_vol
     return buy_vol, sell_vol, delta
 
-def fetch_funding_oi(symbol):
+async def fetch_funding_oi(symbol):
     """Get funding rate + OI for symbol"""
-    f_resp = requests.get(f"{BINANCE_FAPI}/fapi/v1/fundingRate", params={"symbol": symbol, "limit": 1})
-    f_resp.raise_for_status()
-    funding_rate = float(f_resp.json()[0]["fundingRate"]) if f_resp.json() else None
-
-    oi_resp = requests.get(f"{BINANCE_FAPI}/fapi/v1/openInterest", params={"symbol": symbol})
-    oi_resp.raise_for_status()
-    open_interest = float(oi_resp.json()["openInterest"]) if oi_resp.json() else None
+    funding, oi = await asyncio.gather(
+        get_json(f"{BINANCE_FAPI}/fapi/v1/fundingRate", params={"symbol": symbol, "limit": 1}),
+        get_json(f"{BINANCE_FAPI}/fapi/v1/openInterest", params={"symbol": symbol}),
+    )
+    funding_rate = float(funding[0]["fundingRate"]) if funding else None
+    open_interest = float(oi["openInterest"]) if oi else None
 
     return funding_rate, open_interest
 
-def fetch_vwap(symbol):
+async def fetch_vwap(symbol):
     """Get VWAP from recent 1m candles"""
-    url = f"{BINANCE_FAPI}/fapi/v1/klines?symbol={symbol}&interval=1m&limit=50"
-    resp = requests.get(url)
-    resp.raise_for_status()
-    klines = resp.json()
+    klines = await get_json(f"{BINANCE_FAPI}/fapi/v1/klines", params={"symbol": symbol, "interval": "1m", "limit": 50})
 
     num, den = 0.0, 0.0
     for k in klines:
@@ -69,7 +248,7 @@ def fetch_vwap(symbol):
         den += vol
     return num / den if den else None
 
-def upsert(symbol, buy_vol, sell_vol, delta, funding_rate, open_interest, vwap):
+async def upsert(symbol, buy_vol, sell_vol, delta, funding_rate, open_interest, vwap):
     row = {
         "ts": iso_now(),
         "symbol": symbol,
@@ -80,37 +259,40 @@ def upsert(symbol, buy_vol, sell_vol, delta, funding_rate, open_interest, vwap):
         "open_interest": open_interest,
         "vwap": vwap,
     }
-    sb.table("orderflow_cvd").upsert(row).execute()
+    await writer.aput(row)
     print(f"[upsert] {symbol} Δ={delta:.2f} FR={funding_rate} OI={open_interest} VWAP={vwap}")
 
-# ========= MAIN LOOP =========
-def main():
-    while True:
-        try:
-            symbols = get_symbols()
-            print(f"[symbols] Found {len(symbols)} USDT-PERP symbols.")
-
-            for sym in symbols:
-                try:
-                    buy_vol, sell_vol, delta = fetch_orderflow(sym)
-                    funding_rate, open_interest = fetch_funding_oi(sym)
-                    vwap = fetch_vwap(sym)
+async def collect_symbol(sym):
+    try:
+        (buy_vol, sell_vol, delta), (funding_rate, open_interest), vwap = await asyncio.gather(
+            fetch_orderflow(sym), fetch_funding_oi(sym), fetch_vwap(sym)
+        )
+        await upsert(sym, buy_vol, sell_vol, delta, funding_rate, open_interest, vwap)
+    except Exception as e:
+        print(f"[error] {sym}:", e)
 
-                    upsert(sym, buy_vol, sell_vol, delta, funding_rate, open_interest, vwap)
-                except Exception as e:
-                    print(f"[error] {sym}:", e)
+async def run_cycle():
+    symbols = await get_symbols()
+    print(f"[symbols] Found {len(symbols)} USDT-PERP symbols.")
+    await asyncio.gather(*(collect_symbol(sym) for sym in symbols))
 
-            print("✅ Cycle complete.")
-        except Exception as e:
-            print("Fatal error:", e)
+# ========= MAIN LOOP =========
+async def main():
+    try:
+        if os.getenv("ORDERFLOW_SOURCE", "stream") == "stream":
+            # stream() only returns by raising; never fall through into REST polling
+            await stream()
+            return
+        while True:
+            try:
+                await run_cycle()
+                print("✅ Cycle complete.")
+            except Exception as e:
+                print("Fatal error:", e)
 
-        time.sleep(300)  # every 5 min
+            await asyncio.sleep(300)  # every 5 min
+    finally:
+        await close_client()
 
 if __name__ == "__main__":
-    main()
-
-
-
-
-
-
+    asyncio.run(main())
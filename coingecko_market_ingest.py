@@ -1,17 +1,11 @@
-import os
 import time
 import requests
 from datetime import datetime, timezone
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
 # ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 # ========= Coingecko Endpoint =========
 COINGECKO_URL = (
@@ -40,13 +34,16 @@ def upsert_market(data):
         sb.table("market_data").upsert(rows).execute()
         print(f"[upsert] {len(rows)} rows inserted/updated")
 
+def run_cycle():
+    print("📥 Fetching Coingecko market data...")
+    data = fetch_coins()
+    upsert_market(data)
+    print("✅ Done Coingecko batch.")
+
 def main():
     while True:
         try:
-            print("📥 Fetching Coingecko market data...")
-            data = fetch_coins()
-            upsert_market(data)
-            print("✅ Done Coingecko batch.")
+            run_cycle()
         except Exception as e:
             print("❌ Error in Coingecko job:", e)
         time.sleep(3600)  # run every 1 hour
@@ -1,17 +1,11 @@
-import os
 import time
 import requests
 from datetime import datetime, timezone
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
 # ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 # ========= Fake browser headers (bypass scrape protection) =========
 HEADERS = {
@@ -64,18 +58,22 @@ def upsert_liquidations(symbol: str, exchange: str, data: list):
         print(f"[upsert] {len(rows)} rows for {symbol}-{exchange}")
 
 
+def run_cycle():
+    print("🚀 Fetching Coinglass liquidation heatmaps...")
+    for symbol in SYMBOLS:
+        for exchange in EXCHANGES:
+            try:
+                data = fetch_liquidation_map(symbol, exchange)
+                if data:
+                    upsert_liquidations(symbol, exchange, data)
+                time.sleep(2)  # ⏳ avoid rate-limit
+            except Exception as e:
+                print(f"❌ Error {symbol}-{exchange}: {e}")
+
+
 def main():
     while True:
-        print("🚀 Fetching Coinglass liquidation heatmaps...")
-        for symbol in SYMBOLS:
-            for exchange in EXCHANGES:
-                try:
-                    data = fetch_liquidation_map(symbol, exchange)
-                    if data:
-                        upsert_liquidations(symbol, exchange, data)
-                    time.sleep(2)  # ⏳ avoid rate-limit
-                except Exception as e:
-                    print(f"❌ Error {symbol}-{exchange}: {e}")
+        run_cycle()
         print("✅ Cycle complete. Sleeping 30 minutes...\n")
         time.sleep(1800)  # run every 30 minutes
 
@@ -1,17 +1,11 @@
-import os
 import time
 import requests
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 from datetime import datetime, timezone
 
 # ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 # ========= DeBank Public Endpoint =========
 DEBANK_URL = "https://api.debank.com/token/cache_balance_list"
@@ -66,16 +60,19 @@ def upsert_whale_flows(wallet, tokens):
     else:
         print(f"⚠️ No rows to insert for {wallet[:6]}...")
 
+def run_cycle():
+    print("🚀 Starting DeBank whale_flows fetch...")
+    for wallet in WALLETS:
+        try:
+            tokens = fetch_debank_holdings(wallet)
+            upsert_whale_flows(wallet, tokens)
+            time.sleep(10)  # ⏳ delay between wallets to avoid 429
+        except Exception as e:
+            print(f"❌ Error processing {wallet}: {e}")
+
 def main():
     while True:
-        print("🚀 Starting DeBank whale_flows fetch...")
-        for wallet in WALLETS:
-            try:
-                tokens = fetch_debank_holdings(wallet)
-                upsert_whale_flows(wallet, tokens)
-                time.sleep(10)  # ⏳ delay between wallets to avoid 429
-            except Exception as e:
-                print(f"❌ Error processing {wallet}: {e}")
+        run_cycle()
         print("✅ Cycle complete. Sleeping 1 hour...\n")
         time.sleep(3600)
 
@@ -0,0 +1,234 @@
+# ingesters/binance_archive_import.py
+"""
+Bulk history import from Binance's public archive files (data.binance.vision).
+
+REST history is capped at 1000 rows a call; the monthly/daily zips are not.
+Point this at a directory of downloaded archives (any layout, searched
+recursively) and it loads:
+
+    <SYM>-aggTrades-<date>.zip, <SYM>-trades-<date>.zip   (spot)
+        → binance_trade_buckets, binance_trades_agg, binance_trades_agg_5m
+    <SYM>-<interval>-<date>.zip                           (USDT-M futures klines)
+        → binance_ohlcv, technical_indicators
+
+    python -m ingesters.binance_archive_import ~/binance-archive
+    python -m ingesters.binance_archive_import ~/binance-archive --kinds klines --symbols BTCUSDT
+
+CSVs are read straight out of the zip in ARCHIVE_CHUNK_ROWS chunks with
+pandas, so nothing is unzipped to disk. Trades go through the same
+TradeBuckets engine as the live jobs (columnar add_arrays) and are merged by
+trade-id range, so re-importing a file is a no-op; finished files and the
+running CVD are checkpointed per symbol, so an interrupted run picks up at
+the next file. Klines of one symbol/interval are concatenated in date order
+before indicators are computed, so RSI runs continuously across files.
+Files under a spot/ or futures/ directory that do not match the tables'
+market are skipped.
+"""
+import os
+import re
+import time
+import zipfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ingesters import checkpoint
+from ingesters.binance_ohlcv_with_rsi import indicator_rows, upsert
+from ingesters.trade_buckets import BUCKETS_TABLE, TradeBuckets, bucket_rows, agg_rows, agg_5m_rows
+from ingesters.writer import get_writer, flush_all
+
+# ========= CONFIG =========
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_CHUNK_ROWS = int(os.getenv("ARCHIVE_CHUNK_ROWS", "1000000"))
+ARCHIVE_CONCURRENCY = int(os.getenv("ARCHIVE_CONCURRENCY", "4"))   # symbols in flight
+ARCHIVE_RESUME = os.getenv("ARCHIVE_RESUME", "1") == "1"
+ARCHIVE_FLUSH_TIMEOUT = float(os.getenv("ARCHIVE_FLUSH_TIMEOUT", "1800"))   # seconds per file flush
+
+# <SYMBOL>-<kind or interval>-<YYYY-MM[-DD]>.zip
+_NAME = re.compile(r"^([A-Z0-9]+)-([A-Za-z0-9]+)-(\d{4}-\d{2}(?:-\d{2})?)\.zip$")
+KLINE_INTERVALS = {"1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h", "6h", "8h", "12h", "1d", "3d", "1w", "1mo"}
+
+# column layouts (headerless spot files; newer futures files add a header row)
+AGG_TRADE_COLS = ["agg_id", "price", "qty", "first_id", "last_id", "time", "is_buyer_maker", "is_best_match"]
+TRADE_COLS = ["id", "price", "qty", "quote_qty", "time", "is_buyer_maker", "is_best_match"]
+KLINE_COLS = ["open_time", "open", "high", "low", "close", "volume", "close_time",
+              "quote_volume", "count", "taker_buy_volume", "taker_buy_quote_volume", "ignore"]
+
+# bulk load: bigger batches than the live defaults
+writers = [
+    get_writer("binance_trades_agg", mode="merge", batch_rows=5000),
+    get_writer("binance_trades_agg_5m", mode="merge", batch_rows=5000),
+    get_writer(BUCKETS_TABLE, mode="merge", batch_rows=5000),
+]
+
+
+# ========= FILES =========
+def _market(path: str) -> str | None:
+    parts = path.replace("\\", "/").split("/")
+    return "futures" if "futures" in parts else "spot" if "spot" in parts else None
+
+
+def find_archives(root: str, kinds: set | None = None, symbols: set | None = None) -> dict:
+    """{("trades"|"klines", symbol, interval or None): [paths in date order]}."""
+    found = {}
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            m = _NAME.match(name)
+            if not m:
+                continue
+            symbol, kind, date = m.groups()
+            path = os.path.join(dirpath, name)
+            if kind in ("aggTrades", "trades"):
+                key, wrong_market = ("trades", symbol, kind), "futures"
+            elif kind in KLINE_INTERVALS:
+                key, wrong_market = ("klines", symbol, kind), "spot"
+            else:
+                continue
+            if (kinds and key[0] not in kinds) or (symbols and symbol not in symbols) \
+                    or _market(path) == wrong_market:
+                continue
+            found.setdefault(key, []).append((date, path))
+    # aggTrades and trades cover the same fills; prefer the smaller aggTrades files
+    for kind, symbol, sub in list(found):
+        if sub == "trades" and ("trades", symbol, "aggTrades") in found:
+            del found[(kind, symbol, sub)]
+    return {k: [p for _, p in sorted(v)] for k, v in found.items()}
+
+
+def read_chunks(path: str, names: list, usecols: list, dtype: dict):
+    """pandas chunks of the single CSV inside a zip, read without extracting it."""
+    with zipfile.ZipFile(path) as zf:
+        member = zf.namelist()[0]
+        with zf.open(member) as f:
+            header = 0 if not f.readline()[:1].isdigit() else None
+        with zf.open(member) as f:
+            yield from pd.read_csv(f, header=header, names=names, usecols=usecols, dtype=dtype,
+                                   chunksize=ARCHIVE_CHUNK_ROWS)
+
+
+def _ms(ts: np.ndarray) -> np.ndarray:
+    # spot archives switched to microsecond timestamps in 2025
+    return ts // 1000 if len(ts) and ts.max() > 10**14 else ts
+
+
+# ========= TRADES =========
+def _is_sell(col: pd.Series) -> np.ndarray:
+    if col.dtype == bool:
+        return col.to_numpy()
+    return col.astype(str).str.lower().eq("true").to_numpy()
+
+
+def import_trades(symbol: str, kind: str, paths: list, resume: bool = ARCHIVE_RESUME) -> int:
+    """Bucket one symbol's trade archives in date order; returns trades read."""
+    name = f"archive_{kind}_{symbol}"
+    ck = (checkpoint.load(name) if resume else None) or {}
+    done = set(ck.get("files", []))
+    tb = TradeBuckets()
+    tb.restore(ck.get("state") or {})
+    agg = kind == "aggTrades"
+    names = AGG_TRADE_COLS if agg else TRADE_COLS
+    id_col = "last_id" if agg else "id"   # aggregate trades keyed by their last trade id, like the stream
+    # aggregate trades also bring first_id, so counts cover every trade in first_id..last_id
+    usecols = ["price", "qty", "time", "is_buyer_maker", id_col] + (["first_id"] if agg else [])
+    dtype = {"price": np.float64, "qty": np.float64, "time": np.int64, id_col: np.int64, "first_id": np.int64}
+    n = 0
+    for path in paths:
+        base = os.path.basename(path)
+        if base in done:
+            continue
+        marks = [w.losses() for w in writers]
+        for df in read_chunks(path, names, usecols, dtype):
+            ts_ms = _ms(df["time"].to_numpy())
+            tb.add_arrays(symbol, ts_ms, df["price"].to_numpy(), df["qty"].to_numpy(),
+                          _is_sell(df["is_buyer_maker"]), df[id_col].to_numpy(),
+                          df["first_id"].to_numpy() if agg else None)
+            changed = tb.drain(int(ts_ms[-1]), keep_ms=86_400_000)
+            for w, rows in zip(writers, (agg_rows(changed), agg_5m_rows(changed), bucket_rows(changed))):
+                w.put_many(rows)
+            n += len(df)
+        # the file only counts as done once its rows are in the database
+        if not all([w.flush_committed(m, ARCHIVE_FLUSH_TIMEOUT) for w, m in zip(writers, marks)]):
+            raise RuntimeError(f"{base}: not committed (flush timed out or rows spooled)")
+        done.add(base)
+        checkpoint.save(name, {"files": sorted(done), "state": tb.state()})
+        print(f"✅ [archive] {base}: {n:,} trades so far for {symbol}")
+    return n
+
+
+# ========= KLINES =========
+def kline_frame(symbol: str, interval: str, paths: list) -> pd.DataFrame:
+    """binance_ohlcv-shaped frame for every candle in paths, oldest first, duplicates dropped."""
+    usecols = ["open_time", "open", "high", "low", "close", "volume"]
+    dtype = {c: np.float64 for c in usecols[1:]} | {"open_time": np.int64}
+    parts = [df for p in paths for df in read_chunks(p, KLINE_COLS, usecols, dtype)]
+    if not parts:
+        return pd.DataFrame()
+    df = pd.concat(parts, ignore_index=True)
+    df["open_time"] = _ms(df["open_time"].to_numpy())
+    df = df.drop_duplicates("open_time").sort_values("open_time", ignore_index=True)
+    ts = pd.to_datetime(df["open_time"], unit="ms", utc=True).dt.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+    return pd.DataFrame({
+        "symbol": symbol,
+        "interval": interval,
+        "ts": ts,
+        "open": df["open"],
+        "high": df["high"],
+        "low": df["low"],
+        "close": df["close"],
+        "volume": df["volume"],
+    })
+
+
+def import_klines(symbol: str, interval: str, paths: list) -> int:
+    df = kline_frame(symbol, interval, paths)
+    if df.empty:
+        return 0
+    upsert("binance_ohlcv", df.to_dict("records"), on_conflict="symbol,interval,ts")
+    upsert("technical_indicators", indicator_rows(df), on_conflict="symbol,interval,ts")
+    print(f"✅ [archive] {symbol} {interval}: {len(df):,} candles from {len(paths)} files")
+    return len(df)
+
+
+# ========= ENTRY POINT =========
+def import_archives(root: str, kinds: set | None = None, symbols: set | None = None,
+                    resume: bool = ARCHIVE_RESUME) -> dict:
+    groups = find_archives(root, kinds, symbols)
+    print(f"🚀 [archive] {sum(map(len, groups.values()))} files in {len(groups)} series under {root}")
+    t0, totals = time.time(), {"trades": 0, "klines": 0}
+
+    def run(item):
+        (kind, symbol, sub), paths = item
+        try:
+            if kind == "trades":
+                return kind, import_trades(symbol, sub, paths, resume)
+            return kind, import_klines(symbol, sub, paths)
+        except Exception as e:
+            print(f"[archive] ❌ {symbol} {sub}: {e} (re-run to resume)")
+            return kind, 0
+
+    with ThreadPoolExecutor(max_workers=ARCHIVE_CONCURRENCY) as pool:
+        for kind, n in pool.map(run, groups.items()):
+            totals[kind] += n
+    flush_all(None)
+    print(f"[archive] {totals['trades']:,} trades, {totals['klines']:,} candles in {time.time() - t0:.1f}s")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", nargs="?", default=ARCHIVE_DIR, help="directory of downloaded archive zips")
+    parser.add_argument("--kinds", default="trades,klines", help="trades, klines or both")
+    parser.add_argument("--symbols", default="", help="comma-separated symbols (default: all found)")
+    parser.add_argument("--no-resume", action="store_true", help="ignore per-symbol checkpoints")
+    args = parser.parse_args(argv)
+    if not args.root:
+        parser.error("pass an archive directory or set ARCHIVE_DIR")
+    kinds = {k.strip() for k in args.kinds.split(",") if k.strip()}
+    symbols = {s.strip().upper() for s in args.symbols.split(",") if s.strip()} or None
+    import_archives(args.root, kinds, symbols, resume=not args.no_resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# ingesters/binance_http.py
+"""
+Shared async HTTP client for Binance REST.
+
+One pooled httpx.AsyncClient per event loop (keep-alive, no TLS handshake per
+call) and one weight limiter per host for the whole process. The limiter reads
+X-MBX-USED-WEIGHT-1M from every response and only lets a request through when
+the remaining budget for the current minute covers its weight, so callers can
+simply asyncio.gather() over every symbol.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import weakref
+import httpx
+
+from ingesters.metrics import UPSTREAM_SECONDS, UPSTREAM_RESPONSES, UPSTREAM_WEIGHT_USED, add_collector
+
+# ========= CONFIG =========
+BINANCE_API = os.getenv("BINANCE_API_URL", "https://api.binance.com")
+BINANCE_FAPI = os.getenv("BINANCE_FAPI_URL", "https://fapi.binance.com")
+BINANCE_STREAM = os.getenv("BINANCE_STREAM_URL", "wss://stream.binance.com:9443")
+BINANCE_FSTREAM = os.getenv("BINANCE_FSTREAM_URL", "wss://fstream.binance.com")
+# Capture every REST response here for offline replay (see ingesters/binance_replay.py)
+BINANCE_RECORD_DIR = os.getenv("BINANCE_RECORD_DIR")
+
+# Per-minute IP weight limits published in exchangeInfo.rateLimits
+SPOT_WEIGHT_LIMIT = int(os.getenv("BINANCE_SPOT_WEIGHT_LIMIT", "6000"))
+FAPI_WEIGHT_LIMIT = int(os.getenv("BINANCE_FAPI_WEIGHT_LIMIT", "2400"))
+# Fraction of the limit we allow ourselves to use (headroom for other IP users)
+WEIGHT_HEADROOM = float(os.getenv("BINANCE_WEIGHT_HEADROOM", "0.8"))
+
+MAX_IN_FLIGHT = int(os.getenv("BINANCE_MAX_IN_FLIGHT", "50"))
+MAX_RETRIES = int(os.getenv("BINANCE_MAX_RETRIES", "4"))
+HTTP_TIMEOUT = float(os.getenv("BINANCE_HTTP_TIMEOUT", "15"))
+
+# Endpoints with their own request-count limits on top of IP weight:
+# path -> (max requests, window seconds)
+REQUEST_LIMITS = {
+    "/fapi/v1/fundingRate": (500, 300),
+    "/futures/data/openInterestHist": (1000, 300),
+}
+
+
+# ========= REQUEST WEIGHTS =========
+def _by_limit(limit, table):
+    for upper, weight in table:
+        if limit <= upper:
+            return weight
+    return table[-1][1]
+
+
+def request_weight(path: str, params: dict | None = None) -> int:
+    """IP weight of a request as documented by Binance (defaults to 1)."""
+    params = params or {}
+    limit = int(params.get("limit", 0) or 0)
+    has_symbol = "symbol" in params
+
+    # ---- spot ----
+    if path == "/api/v3/exchangeInfo":
+        return 20
+    if path in ("/api/v3/trades", "/api/v3/historicalTrades"):
+        return 25
+    if path in ("/api/v3/aggTrades", "/api/v3/klines"):
+        return 2
+    if path == "/api/v3/depth":
+        return _by_limit(limit or 100, [(100, 5), (500, 25), (1000, 50), (5000, 250)])
+    if path == "/api/v3/ticker/24hr":
+        return 2 if has_symbol else 80
+
+    # ---- USDT-M futures ----
+    if path == "/fapi/v1/exchangeInfo":
+        return 1
+    if path == "/fapi/v1/trades":
+        return 5
+    if path == "/fapi/v1/aggTrades":
+        return 20
+    if path == "/fapi/v1/klines":
+        return _by_limit(limit or 500, [(99, 1), (499, 2), (1000, 5), (1500, 10)])
+    if path == "/fapi/v1/depth":
+        return _by_limit(limit or 500, [(50, 2), (100, 5), (500, 10), (1000, 20)])
+    if path == "/fapi/v1/ticker/24hr":
+        return 1 if has_symbol else 40
+    if path == "/fapi/v1/premiumIndex":
+        return 1 if has_symbol else 10
+    return 1
+
+
+# ========= LIMITER =========
+def _minute() -> int:
+    return int(time.time() // 60)
+
+
+class WeightLimiter:
+    """Per-host budget tracker for Binance's 1-minute IP weight window.
+
+    Shared by every event loop in the process, so state is guarded by a plain
+    threading lock and callers wait with asyncio.sleep().
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.budget = int(limit * WEIGHT_HEADROOM)
+        self.used = 0            # last X-MBX-USED-WEIGHT-1M seen this minute
+        self.reserved = 0        # weight of requests currently in flight
+        self.window = _minute()
+        self.blocked_until = 0.0  # set on 429/418 from Retry-After
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        m = _minute()
+        if m != self.window:
+            self.window = m
+            self.used = 0
+
+    async def acquire(self, weight: int) -> int:
+        """Reserve weight; returns the minute window the request starts in (pass it to release)."""
+        while True:
+            with self._lock:
+                self._roll()
+                now = time.time()
+                wait = 0.0
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.used + weight > self.budget:
+                    # budget for this minute is spent: wait for the next window
+                    wait = (self.window + 1) * 60 - now + random.uniform(0.05, 0.5)
+                elif self.used + self.reserved + weight > self.budget:
+                    # in-flight requests may still fit; re-check shortly
+                    wait = 0.05
+                else:
+                    self.reserved += weight
+                    return self.window
+            await asyncio.sleep(wait)
+
+    def release(self, weight: int, used_header: str | None = None, window: int | None = None):
+        with self._lock:
+            self.reserved = max(0, self.reserved - weight)
+            self._roll()
+            if window is not None and window < self.window:
+                # started in the previous minute: its header counts that window, not this one
+                return
+            if used_header is not None:
+                try:
+                    # responses complete out of order; keep the highest count
+                    self.used = max(self.used, int(used_header))
+                except ValueError:
+                    self.used += weight
+            else:
+                self.used += weight
+
+    def block(self, seconds: float):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+
+class RequestCountLimiter:
+    """Sliding-window request counter for endpoints with their own quota."""
+
+    def __init__(self, max_requests: int, window_s: float):
+        self.max_requests = int(max_requests * WEIGHT_HEADROOM)
+        self.window_s = window_s
+        self.stamps = []
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                cutoff = now - self.window_s
+                self.stamps = [t for t in self.stamps if t > cutoff]
+                if len(self.stamps) < self.max_requests:
+                    self.stamps.append(now)
+                    return
+                wait = self.stamps[0] - cutoff
+            await asyncio.sleep(wait)
+
+
+_WEIGHT_LIMITERS = {}
+_COUNT_LIMITERS = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(host: str) -> WeightLimiter:
+    with _limiters_lock:
+        if host not in _WEIGHT_LIMITERS:
+            limit = FAPI_WEIGHT_LIMIT if host == httpx.URL(BINANCE_FAPI).host else SPOT_WEIGHT_LIMIT
+            _WEIGHT_LIMITERS[host] = WeightLimiter(limit)
+        return _WEIGHT_LIMITERS[host]
+
+
+def _collect_weight():
+    with _limiters_lock:
+        limiters = list(_WEIGHT_LIMITERS.items())
+    for host, lim in limiters:
+        with lim._lock:
+            lim._roll()
+            UPSTREAM_WEIGHT_USED.labels(host).set(lim.used)
+
+
+add_collector(_collect_weight)
+
+
+def _count_limiter(path: str):
+    if path not in REQUEST_LIMITS:
+        return None
+    with _limiters_lock:
+        if path not in _COUNT_LIMITERS:
+            _COUNT_LIMITERS[path] = RequestCountLimiter(*REQUEST_LIMITS[path])
+        return _COUNT_LIMITERS[path]
+
+
+# ========= CLIENT =========
+class BinanceClient:
+    """Pooled keep-alive client. Use get_client() instead of building one."""
+
+    def __init__(self):
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, pool=None),
+            limits=httpx.Limits(max_connections=MAX_IN_FLIGHT, max_keepalive_connections=MAX_IN_FLIGHT),
+            headers={"Accept": "application/json"},
+        )
+        self._sem = asyncio.Semaphore(MAX_IN_FLIGHT)
+
+    async def get_json(self, url: str, params: dict | None = None, weight: int | None = None,
+                       headers: dict | None = None):
+        """GET a Binance endpoint and return the decoded JSON body.
+
+        Waits for weight budget, honours Retry-After on 429/418 and retries
+        transient errors with jittered backoff; raises httpx errors otherwise.
+        """
+        u = httpx.URL(url)
+        weight = request_weight(u.path, params) if weight is None else weight
+        limiter = get_limiter(u.host)
+        counter = _count_limiter(u.path)
+
+        for attempt in range(MAX_RETRIES + 1):
+            if counter:
+                await counter.acquire()
+            window = await limiter.acquire(weight)
+            used = None
+            started = time.perf_counter()
+            try:
+                async with self._sem:
+                    r = await self._http.get(url, params=params, headers=headers)
+                used = r.headers.get("x-mbx-used-weight-1m")
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                UPSTREAM_RESPONSES.labels(u.host, u.path, type(e).__name__).inc()
+                limiter.release(weight, used, window)
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = min(30, 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"[binance_http] {u.path} {type(e).__name__}, retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            limiter.release(weight, used, window)
+            UPSTREAM_SECONDS.labels(u.host, u.path).observe(time.perf_counter() - started)
+            UPSTREAM_RESPONSES.labels(u.host, u.path, r.status_code).inc()
+
+            if r.status_code in (429, 418):
+                retry_after = float(r.headers.get("retry-after") or 60)
+                limiter.block(retry_after)
+                print(f"[binance_http] ⚠️ {r.status_code} on {u.path}, backing off {retry_after:.0f}s")
+                if attempt == MAX_RETRIES:
+                    r.raise_for_status()
+                continue
+            if r.status_code >= 500 and attempt < MAX_RETRIES:
+                await asyncio.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1.0))
+                continue
+            r.raise_for_status()
+            data = r.json()
+            if _recorder is not None:
+                _recorder.rest(u.path, params, data)
+            return data
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+_clients = weakref.WeakKeyDictionary()
+_recorder = None
+
+
+def set_recorder(recorder):
+    """Install an object with .rest(path, params, body) that sees every response."""
+    global _recorder
+    _recorder = recorder
+
+
+def get_client() -> BinanceClient:
+    """Shared client for the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = BinanceClient()
+        _clients[loop] = client
+        if BINANCE_RECORD_DIR and _recorder is None:
+            from ingesters.binance_replay import Capture
+            set_recorder(Capture(BINANCE_RECORD_DIR))
+    return client
+
+
+async def close_client():
+    """Close the running loop's client; call once at the end of asyncio.run()."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def get_json(url: str, params: dict | None = None, weight: int | None = None,
+                   headers: dict | None = None):
+    """Shortcut for get_client().get_json(...)."""
+    return await get_client().get_json(url, params=params, weight=weight, headers=headers)
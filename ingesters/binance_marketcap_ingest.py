@@ -1,36 +1,31 @@
-import os
-import time
-import requests
-from datetime import datetime, timezone, timedelta
-from supabase import create_client, Client
+import asyncio
+from datetime import datetime, timezone
+from supabase import Client
+from ingesters.db import get_supabase
+
+from ingesters.binance_http import BINANCE_API as BINANCE_HOST, get_json, close_client
+from ingesters.symbols import SPOT
+from ingesters.writer import get_writer
+from ingesters import retention
 
 # ---- Setup ----
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-BINANCE_API = "https://api.binance.com/api/v3"
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+BINANCE_API = f"{BINANCE_HOST}/api/v3"
+sb: Client = get_supabase()
+writer = get_writer("binance_market_cap", mode="upsert")
 
 # ---- Fetch Binance Symbols ----
-def get_all_usdt_symbols():
-    url = f"{BINANCE_API}/exchangeInfo"
-    r = requests.get(url, timeout=10)
-    r.raise_for_status()
-    data = r.json()
-    return [
-        s["symbol"]
-        for s in data["symbols"]
-        if s["quoteAsset"] == "USDT" and s["status"] == "TRADING"
-    ]
+async def get_all_usdt_symbols():
+    return await SPOT.symbols(quote="USDT", status="TRADING")
 
 # ---- Fetch Market Data ----
-def fetch_market_data(symbols):
+async def fetch_market_data(symbols):
+    """One all-symbol ticker call (weight 80) instead of one call per symbol."""
     rows = []
     ts = datetime.now(timezone.utc).isoformat()
+    tickers = {d["symbol"]: d for d in await get_json(f"{BINANCE_API}/ticker/24hr")}
     for sym in symbols:
         try:
-            r = requests.get(f"{BINANCE_API}/ticker/24hr?symbol={sym}", timeout=10)
-            r.raise_for_status()
-            d = r.json()
+            d = tickers[sym]
             price = float(d["lastPrice"])
             volume_24h = float(d["quoteVolume"])
             price_change_24h = float(d["priceChangePercent"])
@@ -46,7 +41,6 @@ def fetch_market_data(symbols):
             })
         except Exception as e:
             print(f"[ERROR] {sym}: {e}")
-            time.sleep(0.1)
             continue
     return rows
 
@@ -54,34 +48,36 @@ def fetch_market_data(symbols):
 def upsert_market_data(rows):
     if not rows:
         return
-    sb.table("binance_market_cap").upsert(rows).execute()
+    writer.put_many(rows)
+    writer.flush()
     print(f"[UPSERT] {len(rows)} Binance market rows inserted/updated")
 
 # ---- Cleanup old data ----
 def cleanup_old_rows():
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-    query = f"delete from binance_market_cap where ts < '{cutoff}'"
-    try:
-        sb.rpc("exec_sql_v2", {"query": query}).execute()
-        print(f"[CLEANUP] Removed rows older than 7 days")
-    except Exception as e:
-        print(f"[WARN] Cleanup skipped: {e}")
+    """Drop daily partitions older than 7 days (see ingesters/retention.py)."""
+    retention.maintain("binance_market_cap")
 
 # ---- Main Loop ----
-def main():
-    while True:
-        try:
-            symbols = get_all_usdt_symbols()
-            print(f"[INFO] Found {len(symbols)} USDT pairs")
-            data = fetch_market_data(symbols)
-            upsert_market_data(data)
-            cleanup_old_rows()
-            print(f"[DONE] Binance market cap cycle completed.")
-        except Exception as e:
-            print(f"[FATAL] {e}")
-        time.sleep(1800)  # run every 30 minutes
+async def run_cycle():
+    symbols = await get_all_usdt_symbols()
+    print(f"[INFO] Found {len(symbols)} USDT pairs")
+    data = await fetch_market_data(symbols)
+    await asyncio.to_thread(upsert_market_data, data)
+    await asyncio.to_thread(cleanup_old_rows)
+    print(f"[DONE] Binance market cap cycle completed.")
+
+async def main():
+    try:
+        while True:
+            try:
+                await run_cycle()
+            except Exception as e:
+                print(f"[FATAL] {e}")
+            await asyncio.sleep(1800)  # run every 30 minutes
+    finally:
+        await close_client()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
 
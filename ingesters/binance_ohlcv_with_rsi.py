@@ -1,16 +1,13 @@
-import os, time, math, requests
+import os, asyncio
 import pandas as pd
 import numpy as np
 from datetime import datetime, timezone
-from supabase import create_client
 
-# ========= CONFIG =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-# Use Binance **Futures** (USDT-M) for perp contracts
-BINANCE_FAPI = "https://fapi.binance.com"
+from ingesters.binance_http import BINANCE_FAPI, get_json, close_client
+from ingesters.symbols import PERP
+from ingesters.writer import get_writer
 
+# ========= CONFIG =========
 # INTERVALS to compute
 INTERVALS = [s.strip() for s in os.getenv("INTERVALS", "1h,4h,1d").split(",") if s.strip()]
 CANDLE_LIMIT = int(os.getenv("CANDLE_LIMIT", "1000"))
@@ -20,51 +17,31 @@ CANDLE_LIMIT = int(os.getenv("CANDLE_LIMIT", "1000"))
 #   - Otherwise we auto-discover ALL USDT-M PERPETUAL symbols.
 SYMBOLS_ENV = os.getenv("SYMBOLS", "").strip()
 
-# Small pause between requests to be gentle on rate limits
-SLEEP_S = float(os.getenv("SLEEP_S", "0.12"))
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing Supabase credentials")
-
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
+UPSERT_TABLES = ("binance_ohlcv", "technical_indicators")
 
 # ========= HELPERS =========
 def log(msg): print(msg, flush=True)
 
-def get_all_usdt_perp_symbols():
+async def get_all_usdt_perp_symbols():
     """Fetch all USDT-M perpetual symbols that are TRADING."""
-    url = f"{BINANCE_FAPI}/fapi/v1/exchangeInfo"
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    data = r.json()
-    symbols = []
-    for s in data.get("symbols", []):
-        if (
-            s.get("quoteAsset") == "USDT" and
-            s.get("contractType") == "PERPETUAL" and
-            s.get("status") == "TRADING"
-        ):
-            symbols.append(s["symbol"])
-    return sorted(symbols)
-
-def discover_symbols():
+    return await PERP.symbols(quote="USDT", status="TRADING")
+
+async def discover_symbols():
     if SYMBOLS_ENV:
         syms = [x.strip().upper() for x in SYMBOLS_ENV.split(",") if x.strip()]
         log(f"[universe] using SYMBOLS from env ({len(syms)}): {', '.join(syms[:12])}{'...' if len(syms)>12 else ''}")
         return syms
-    syms = get_all_usdt_perp_symbols()
+    syms = await get_all_usdt_perp_symbols()
     log(f"[universe] discovered ALL USDT-M PERP symbols: {len(syms)}")
     return syms
 
-def fetch_klines(symbol: str, interval: str, limit: int) -> pd.DataFrame:
+async def fetch_klines(symbol: str, interval: str, limit: int) -> pd.DataFrame:
     """USDT-M Futures klines."""
     params = {"symbol": symbol, "interval": interval, "limit": limit}
-    r = requests.get(f"{BINANCE_FAPI}/fapi/v1/klines", params=params, timeout=30)
-    r.raise_for_status()
-    raw = r.json()
+    raw = await get_json(f"{BINANCE_FAPI}/fapi/v1/klines", params=params)
     rows = []
     for k in raw:
-        ts = datetime.utcfromtimestamp(k[0] / 1000.0).replace(tzinfo=timezone.utc)
+        ts = datetime.fromtimestamp(k[0] / 1000.0, tz=timezone.utc)
         rows.append({
             "symbol": symbol,
             "interval": interval,
@@ -79,7 +56,7 @@ def fetch_klines(symbol: str, interval: str, limit: int) -> pd.DataFrame:
 
 def upsert(table: str, records: list, on_conflict: str):
     if records:
-        sb.table(table).upsert(records, on_conflict=on_conflict).execute()
+        get_writer(table, mode="upsert", on_conflict=on_conflict).put_many(records)
 
 def rsi(series: pd.Series, length: int = 14) -> pd.Series:
     delta = series.diff()
@@ -103,40 +80,53 @@ def stoch_rsi(rsi_series: pd.Series, length: int = 14, smooth_k: int = 3, smooth
     return k.bfill().ffill(), d.bfill().ffill()
 
 
-def compute_and_upsert_indicators(df: pd.DataFrame):
-    if df.empty:
-        return
+def indicator_rows(df: pd.DataFrame) -> list:
+    """technical_indicators rows for one symbol/interval candle frame (NaN → None)."""
     df = df.sort_values("ts")
     rsi14 = rsi(df["close"], 14)
     k, d = stoch_rsi(rsi14, 14, 3, 3)
-    out = []
-    for i, row in df.iterrows():
-        out.append({
-            "symbol": row["symbol"],
-            "interval": row["interval"],
-            "ts": row["ts"],
-            "rsi_14": float(rsi14.loc[i]) if not math.isnan(rsi14.loc[i]) else None,
-            "stoch_rsi_k_14_14_3": float(k.loc[i]) if not math.isnan(k.loc[i]) else None,
-            "stoch_rsi_d_14_14_3": float(d.loc[i]) if not math.isnan(d.loc[i]) else None,
-        })
-    upsert("technical_indicators", out, on_conflict="symbol,interval,ts")
+    out = pd.DataFrame({
+        "symbol": df["symbol"],
+        "interval": df["interval"],
+        "ts": df["ts"],
+        "rsi_14": rsi14,
+        "stoch_rsi_k_14_14_3": k,
+        "stoch_rsi_d_14_14_3": d,
+    })
+    return out.astype(object).where(out.notna(), None).to_dict("records")
 
-def main():
+
+def compute_and_upsert_indicators(df: pd.DataFrame):
+    if df.empty:
+        return
+    upsert("technical_indicators", indicator_rows(df), on_conflict="symbol,interval,ts")
+
+def store_candles(df: pd.DataFrame):
+    upsert("binance_ohlcv", df.to_dict("records"), on_conflict="symbol,interval,ts")
+    compute_and_upsert_indicators(df)
+
+async def process(sym: str, ivl: str):
+    try:
+        df = await fetch_klines(sym, ivl, limit=CANDLE_LIMIT)
+        await asyncio.to_thread(store_candles, df)
+        log(f"[ok] {sym} {ivl}: {len(df)} candles")
+    except Exception as e:
+        log(f"[warn] {sym} {ivl}: {e}")
+
+async def run_cycle():
     log("[job] start OHLCV + RSI for ALL USDT-M PERP")
-    symbols = discover_symbols()
-    for sym in symbols:
-        for ivl in INTERVALS:
-            try:
-                df = fetch_klines(sym, ivl, limit=CANDLE_LIMIT)
-                upsert("binance_ohlcv", df.to_dict("records"), on_conflict="symbol,interval,ts")
-                compute_and_upsert_indicators(df)
-                log(f"[ok] {sym} {ivl}: {len(df)} candles")
-                time.sleep(SLEEP_S)  # rate-limit friendly
-            except Exception as e:
-                log(f"[warn] {sym} {ivl}: {e}")
-                time.sleep(0.3)
+    symbols = await discover_symbols()
+    # Kline weight is paced by the shared Binance client, no manual sleeps
+    await asyncio.gather(*(process(sym, ivl) for sym in symbols for ivl in INTERVALS))
+    for table in UPSERT_TABLES:
+        await asyncio.to_thread(get_writer(table, mode="upsert", on_conflict="symbol,interval,ts").flush)
     log("[job] done")
 
-if __name__ == "__main__":
-    main()
+async def main():
+    try:
+        await run_cycle()
+    finally:
+        await close_client()
 
+if __name__ == "__main__":
+    asyncio.run(main())
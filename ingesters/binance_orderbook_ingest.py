@@ -1,59 +1,53 @@
 import os
-import json
 import time
 import asyncio
-import websockets
-import requests
 from datetime import datetime, timezone
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
-# ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+from ingesters.binance_http import BINANCE_FSTREAM
+from ingesters.symbols import PERP
+from ingesters.writer import get_writer
+from ingesters import retention
+from ingesters.heatmap import bucketize_depth
+from ingesters.local_book import LocalBooks
+from ingesters.ws_shards import ShardSet
 
-# 🔹 Dynamically load all USDT pairs
-res = requests.get("https://api.binance.com/api/v3/exchangeInfo")
-ALL_SYMBOLS = [s["symbol"].lower() for s in res.json()["symbols"] if s["quoteAsset"] == "USDT"]
-print(f"✅ Loaded {len(ALL_SYMBOLS)} USDT pairs")
+# ========= ENV VARS =========
+sb: Client = get_supabase()
 
 # 🔹 Split into shards of 50 symbols each
 SHARD_SIZE = 50
-SHARDS = [ALL_SYMBOLS[i:i + SHARD_SIZE] for i in range(0, len(ALL_SYMBOLS), SHARD_SIZE)]
 
-# Globals
-BUFFER = []
+# depth10: Binance's @depth10@500ms partial-book snapshots (default).
+# book: full local books kept from @depth@100ms diffs (ingesters/local_book.py);
+# the same top-10 rows are sampled from them every ORDERBOOK_EMIT_INTERVAL seconds.
+ORDERBOOK_SOURCE = os.getenv("ORDERBOOK_SOURCE", "depth10")
+ORDERBOOK_EMIT_INTERVAL = float(os.getenv("ORDERBOOK_EMIT_INTERVAL", "0.5"))
+# book mode also writes liquidity_heatmap from the in-memory books (0 disables)
+ORDERBOOK_HEATMAP_EVERY = float(os.getenv("ORDERBOOK_HEATMAP_EVERY", "60"))
+ORDERBOOK_HEATMAP_SYMBOLS = [s.strip().upper() for s in os.getenv("ORDERBOOK_HEATMAP_SYMBOLS", "BTCUSDT,ETHUSDT").split(",") if s.strip()]
+
+# rows: one binance_orderbook row per level (20 per message, the default).
+# packed: one binance_orderbook_snapshots row per message with the levels as
+# arrays; the binance_orderbook_levels view unnests either
+# (sql/binance_orderbook_snapshots.sql).
+ORDERBOOK_STORAGE = os.getenv("ORDERBOOK_STORAGE", "rows")
+ORDERBOOK_TABLE = "binance_orderbook_snapshots" if ORDERBOOK_STORAGE == "packed" else "binance_orderbook"
+
+# Rows go through the shared batched writer; it flushes every BATCH_INTERVAL
+# seconds or once a batch is full, and blocks the stream when the DB lags.
 BATCH_INTERVAL = 1.0  # seconds
-rows_written = 0
-_last_stats = time.time()
+if ORDERBOOK_STORAGE == "packed":
+    writer = get_writer(ORDERBOOK_TABLE, mode="upsert", on_conflict="symbol,time",
+                        max_age=BATCH_INTERVAL, event_time="time")
+else:
+    # keyed per level (sql/natural_keys.sql) so spool replays don't duplicate rows
+    writer = get_writer(ORDERBOOK_TABLE, mode="upsert", on_conflict="symbol,time,side,depth_level",
+                        max_age=BATCH_INTERVAL, event_time="time")
 _last_debug = {}  # per-symbol debug timing
 
 
-# ==========================================================
-# 🔹 Batch Writer
-# ==========================================================
-async def save_batch():
-    """Insert buffered rows into Supabase table periodically."""
-    global BUFFER, rows_written, _last_stats
-    if BUFFER:
-        try:
-            sb.table("binance_orderbook").insert(BUFFER).execute()
-            rows_written += len(BUFFER)
-            print(f"✅ Inserted {len(BUFFER)} rows")
-        except Exception as e:
-            print(f"❌ Insert failed: {e}")
-            print(f"Example row: {BUFFER[0] if BUFFER else 'EMPTY'}")
-        BUFFER = []
-
-    # 🧠 Health print every 60 seconds
-    now = time.time()
-    if now - _last_stats > 60:
-        print(f"🩵 Health check → {rows_written:,} rows inserted in last 60s")
-        rows_written = 0
-        _last_stats = now
-
-
 # ==========================================================
 # 🔹 Handle WebSocket Payloads
 # ==========================================================
@@ -61,7 +55,7 @@ import time
 _last_debug = {}
 
 async def handle_message(symbol, data):
-    global BUFFER, _last_debug
+    global _last_debug
 
     # Handle both 'data' and nested 'data.data' cases
     if "data" in data:
@@ -88,6 +82,18 @@ async def handle_message(symbol, data):
     if not bids and not asks:
         return
 
+    if ORDERBOOK_STORAGE == "packed":
+        bids, asks = bids[:10], asks[:10]
+        await writer.aput({
+            "symbol": symbol.upper(),
+            "time": ts,
+            "bid_prices": [float(p) for p, _ in bids],
+            "bid_qtys": [float(q) for _, q in bids],
+            "ask_prices": [float(p) for p, _ in asks],
+            "ask_qtys": [float(q) for _, q in asks],
+        })
+        return
+
     # Build top-10 rows per side
     rows = []
     for i, (price, qty) in enumerate(bids[:10]):
@@ -109,82 +115,70 @@ async def handle_message(symbol, data):
             "time": ts
         })
 
-    BUFFER.extend(rows)
+    await writer.aput_many(rows)
 
 # ==========================================================
 # 🔹 WebSocket Stream (Fixed Payload)
 # ==========================================================
-import random
-
-async def stream_orderbook(shard_id, symbols):
-    """Stream orderbook data for a shard with reconnect + rate limit handling."""
-    base_url = "wss://fstream.binance.com/stream?streams="
-    stream_url = base_url + "/".join([f"{s}@depth10@500ms" for s in symbols])
+async def on_stream_message(stream, payload):
+    """Combined-stream frame → handle_message(symbol, payload)."""
+    await handle_message(stream.split("@")[0], payload)
 
-    backoff = 5  # start retry delay
-    reconnect_count = 0
 
-    while True:
-        try:
-            async with websockets.connect(
-                stream_url,
-                ping_interval=60,
-                ping_timeout=20,
-                close_timeout=10,
-                max_queue=500,
-            ) as ws:
-                print(f"✅ Connected shard {shard_id} ({len(symbols)} symbols)")
-
-                backoff = 5  # reset after success
-                reconnect_count = 0
-
-                # small delay between symbols to avoid rate limit
-                await asyncio.sleep(random.uniform(0.1, 0.3))
-
-                last_message = time.time()
-                while True:
-                    try:
-                        msg = await asyncio.wait_for(ws.recv(), timeout=60)
-                        data = json.loads(msg)
-                        stream = data.get("stream", "")
-                        payload = data.get("data", {})
-
-                        symbol = stream.split("@")[0]
-                        await handle_message(symbol, payload)
-                        last_message = time.time()
-
-                    except asyncio.TimeoutError:
-                        # if idle for 60s, log heartbeat
-                        print(f"💤 Shard {shard_id} idle >60s, sending ping...")
-                        await ws.ping()
-                        if time.time() - last_message > 180:
-                            print(f"⚠️ Shard {shard_id} no data >3m, restarting connection")
-                            break
-
-                    except websockets.ConnectionClosed:
-                        print(f"⚠️ Shard {shard_id}: connection closed → reconnecting...")
-                        break
+# full books (and their snapshot traffic) only in diff-depth mode
+BOOKS = LocalBooks(market="perp") if ORDERBOOK_SOURCE == "book" else None
 
-        except Exception as e:
-            reconnect_count += 1
-            print(f"⚠️ Shard {shard_id} error: {e}, reconnect attempt #{reconnect_count}")
+# reconnect/backoff/idle handling lives in ingesters/ws_shards.py
+SHARDS = ShardSet("binance_orderbook", BINANCE_FSTREAM,
+                  BOOKS.on_stream_message if BOOKS else on_stream_message,
+                  shard_size=SHARD_SIZE)
 
-            # randomized staggered delay to avoid hitting rate limits
-            delay = backoff + random.uniform(1, 4)
-            print(f"⏳ Waiting {delay:.1f}s before reconnect...")
-            await asyncio.sleep(delay)
 
-            backoff = min(backoff * 2, 60)  # exponential up to 60s
+async def emit_books():
+    """Book mode: top-10 rows from every synced book that moved since the last pass."""
+    emitted = {}
+    while True:
+        await asyncio.sleep(ORDERBOOK_EMIT_INTERVAL)
+        for symbol, book in list(BOOKS.books.items()):
+            if not book.synced or emitted.get(symbol) == book.last_update_id:
+                continue
+            emitted[symbol] = book.last_update_id
+            bids, asks = book.top(10)
+            await handle_message(symbol.lower(), {"E": book.event_time, "bids": bids, "asks": asks})
+
+
+async def emit_heatmap():
+    """Book mode: liquidity_heatmap buckets from the synced books, no depth?limit=1000 calls.
+
+    The books live only in this process, so ingest_extras.ingest_heatmap()
+    (REST) stays the path for depth10 mode.
+    """
+    heatmap_writer = get_writer("liquidity_heatmap", mode="upsert",
+                                on_conflict="ts,venue,symbol,price_level,side", event_time="ts")
+    while True:
+        await asyncio.sleep(ORDERBOOK_HEATMAP_EVERY)
+        for symbol in ORDERBOOK_HEATMAP_SYMBOLS:
+            book = BOOKS.get(symbol)
+            if book is None:
+                continue
+            rows = bucketize_depth(symbol, "binance", book.snapshot(1000), bucket_bps=10.0)
+            await heatmap_writer.aput_many(rows)
 
 
 # ==========================================================
-# 🔹 Periodic Scheduler
+# 🔹 Writer Health
 # ==========================================================
-async def scheduler():
-    """Runs save_batch() every BATCH_INTERVAL seconds."""
+async def health():
+    """Prints writer throughput and queue depth every 60 seconds."""
+    last_written = writer.written
     while True:
-        await save_batch()
-        await asyncio.sleep(BATCH_INTERVAL)
+        await asyncio.sleep(60)
+        st = writer.stats()
+        print(
+            f"🩵 Health check → {st['written'] - last_written:,} rows inserted in last 60s, "
+            f"queue {st['queue_depth']:,}/{st['queue_capacity']:,}, failed {st['failed']:,}"
+        )
+        last_written = st["written"]
 
 
 # ==========================================================
@@ -194,84 +188,81 @@ async def watchdog():
     """Checks that new data keeps arriving in Supabase."""
     while True:
         try:
-            result = sb.table("binance_orderbook").select("time").order("time", desc=True).limit(1).execute()
+            result = sb.table(ORDERBOOK_TABLE).select("time").order("time", desc=True).limit(1).execute()
             if result.data and len(result.data) > 0:
                 latest = result.data[0]["time"]
                 print(f"🕐 Watchdog check: latest insert at {latest}")
             else:
-                print("⚠️ Watchdog warning: no data returned from binance_orderbook")
+                print(f"⚠️ Watchdog warning: no data returned from {ORDERBOOK_TABLE}")
         except Exception as e:
             print(f"⚠️ Watchdog error: {e}")
         await asyncio.sleep(600)  # every 10 minutes
 
 
 # ===============================
-# 🧹 SIMPLE DAILY CLEANUP TASK
+# 🧹 RETENTION TASK
 # ===============================
-import asyncio
-from datetime import datetime, timezone, timedelta
-
 async def cleanup_old_rows():
-    """Deletes old rows in manageable batches."""
-    BATCH_SIZE = 20000  # delete 20k rows per loop
+    """Drops expired daily partitions and pre-creates upcoming ones (see ingesters/retention.py)."""
     while True:
-        try:
-            cutoff = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-            print(f"🧹 Running batched cleanup for rows older than {cutoff}")
-
-            total_deleted = 0
-            while True:
-                result = sb.table("binance_orderbook") \
-                    .delete() \
-                    .lt("time", cutoff) \
-                    .limit(BATCH_SIZE) \
-                    .execute()
+        await asyncio.to_thread(retention.maintain, ORDERBOOK_TABLE)
+        await asyncio.sleep(retention.RETENTION_EVERY)
 
-                deleted = len(result.data or [])
-                total_deleted += deleted
 
-                if deleted == 0:
-                    break  # no more to delete this round
 
-                print(f"🧩 Deleted batch of {deleted} rows (total {total_deleted})")
-                await asyncio.sleep(1)  # pause between batches
+# ==========================================================
+# 🔹 Symbol Universe → Shards
+# ==========================================================
+def load_symbols():
+    """USDT-M perps from the shared registry (lowercase for stream names)."""
+    symbols = [s.lower() for s in PERP.select(quote="USDT", status="TRADING")]
+    print(f"✅ Loaded {len(symbols)} USDT pairs")
+    return symbols
 
-            print(f"✅ Cleanup done — total {total_deleted} rows deleted")
 
-        except Exception as e:
-            print(f"⚠️ Cleanup failed: {e}")
+def start_shards(symbols):
+    """(Re)start one stream task per shard of SHARD_SIZE symbols."""
+    stream = "depth@100ms" if ORDERBOOK_SOURCE == "book" else "depth10@500ms"
+    SHARDS.start([f"{s}@{stream}" for s in symbols])
 
-        await asyncio.sleep(86400)  # run daily
 
+async def on_universe_change(added, removed):
+    """Listings/delistings reshuffle shard membership, so reconnect all shards."""
+    print(f"🔁 Universe changed (+{sorted(added)} -{sorted(removed)}) → resharding")
+    if BOOKS:
+        BOOKS.drop(removed)
+    start_shards(load_symbols())
 
 
 # ==========================================================
 # 🔹 Entry Point
 # ==========================================================
-if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-
-    # Create shard tasks
-    for i, shard_symbols in enumerate(SHARDS):
-        loop.create_task(stream_orderbook(i + 1, shard_symbols))
-
-    loop.create_task(scheduler())
-    loop.create_task(watchdog())
-    loop.create_task(cleanup_old_rows())
+async def main():
+    await PERP.load()
+    start_shards(load_symbols())
+    PERP.subscribe(on_universe_change)
+
+    book_tasks = []
+    if BOOKS:
+        book_tasks.append(emit_books())
+        if ORDERBOOK_HEATMAP_EVERY > 0:
+            book_tasks.append(emit_heatmap())
+    try:
+        await asyncio.gather(
+            *book_tasks,
+            health(),
+            watchdog(),
+            cleanup_old_rows(),
+            PERP.watch(),
+        )
+    finally:
+        # the supervisor re-runs main() after a crash; don't stack listeners
+        PERP.unsubscribe(on_universe_change)
+        SHARDS.stop()
 
 
+if __name__ == "__main__":
     try:
-        loop.run_forever()
+        asyncio.run(main())
     except KeyboardInterrupt:
         print("🛑 Shutting down gracefully...")
-    except Exception as e:
-        print(f"❌ Unhandled error in main loop: {e}")
-    finally:
-        for task in asyncio.all_tasks(loop):
-            task.cancel()
-        loop.stop()
-        loop.close()
-
-
-
-
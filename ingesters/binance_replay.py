@@ -0,0 +1,346 @@
+# ingesters/binance_replay.py
+"""
+Offline record/replay harness for Binance REST and WebSocket feeds.
+
+Record (needs network):
+    python -m ingesters.binance_replay record --out captures/demo --symbols 20 --duration 300
+
+  Captures exchangeInfo, tickers, trades, klines, depth, funding/OI over REST
+  and trade / depth10 / kline_1m / forceOrder frames over WS into
+  captures/demo/{rest,ws}.jsonl.gz. Any ingester run with
+  BINANCE_RECORD_DIR=captures/demo also appends the REST calls it makes.
+
+Replay (no network):
+    python -m ingesters.binance_replay serve --in captures/demo --speed 10 --loop
+
+  Serves REST on --port and WS on --ws-port and prints the BINANCE_*_URL
+  exports that point the ingesters at it. WS frames keep their recorded
+  spacing divided by --speed (0 = as fast as the client reads).
+"""
+import os
+import gzip
+import json
+import time
+import heapq
+import atexit
+import asyncio
+import argparse
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit, parse_qsl
+
+from ingesters.binance_http import (
+    BINANCE_API, BINANCE_FAPI, BINANCE_STREAM, BINANCE_FSTREAM,
+    get_json, close_client, set_recorder,
+)
+
+REST_FILE = "rest.jsonl.gz"
+WS_FILE = "ws.jsonl.gz"
+
+# Query params that change on every call and shouldn't affect matching
+VOLATILE_PARAMS = {"startTime", "endTime", "fromId", "timestamp", "signature"}
+
+
+# ========= CAPTURE =========
+class Capture:
+    """Appends REST responses and WS frames to gzipped JSONL files."""
+
+    def __init__(self, out_dir: str):
+        os.makedirs(out_dir, exist_ok=True)
+        self._rest = gzip.open(os.path.join(out_dir, REST_FILE), "at")
+        self._ws = gzip.open(os.path.join(out_dir, WS_FILE), "at")
+        self._lock = threading.Lock()
+        self.rest_count = 0
+        self.ws_count = 0
+        atexit.register(self.close)
+
+    def rest(self, path: str, params: dict | None, body):
+        line = json.dumps({"t": time.time(), "path": path, "params": params or {}, "body": body})
+        with self._lock:
+            self._rest.write(line + "\n")
+            self.rest_count += 1
+
+    def ws(self, market: str, stream: str, data):
+        line = json.dumps({"t": time.time(), "market": market, "stream": stream, "data": data})
+        with self._lock:
+            self._ws.write(line + "\n")
+            self.ws_count += 1
+
+    def close(self):
+        with self._lock:
+            if not self._rest.closed:
+                self._rest.close()
+                self._ws.close()
+
+
+def _read_jsonl_gz(path: str):
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return  # truncated tail of a capture that was killed mid-write
+
+
+# ========= RECORD =========
+async def record_ws(cap: Capture, market: str, base: str, streams: list[str], until: float):
+    import websockets
+    url = f"{base}/stream?streams=" + "/".join(streams)
+    while time.time() < until:
+        try:
+            async with websockets.connect(url, ping_interval=20, max_queue=None) as ws:
+                print(f"[record] ✅ {market} WS: {len(streams)} streams")
+                while time.time() < until:
+                    try:
+                        msg = json.loads(await asyncio.wait_for(ws.recv(), timeout=max(0.1, until - time.time())))
+                    except asyncio.TimeoutError:
+                        break
+                    cap.ws(market, msg.get("stream", ""), msg.get("data"))
+        except Exception as e:
+            print(f"[record] ⚠️ {market} WS error: {e}, reconnecting")
+            await asyncio.sleep(2)
+
+
+async def record_rest(symbols_spot: list[str], symbols_perp: list[str], until: float, every: float):
+    async def safe(url, params=None):
+        try:
+            await get_json(url, params=params)
+        except Exception as e:
+            print(f"[record] ⚠️ {url} {params}: {e}")
+
+    while True:
+        calls = [
+            safe(f"{BINANCE_API}/api/v3/exchangeInfo"),
+            safe(f"{BINANCE_FAPI}/fapi/v1/exchangeInfo"),
+            safe(f"{BINANCE_API}/api/v3/ticker/24hr"),
+            safe(f"{BINANCE_FAPI}/fapi/v1/ticker/24hr"),
+            safe(f"{BINANCE_FAPI}/fapi/v1/premiumIndex"),
+        ]
+        for s in symbols_spot:
+            calls += [
+                safe(f"{BINANCE_API}/api/v3/trades", {"symbol": s, "limit": 1000}),
+                safe(f"{BINANCE_API}/api/v3/aggTrades", {"symbol": s, "limit": 1000}),
+                safe(f"{BINANCE_API}/api/v3/depth", {"symbol": s, "limit": 100}),
+            ]
+        for s in symbols_perp:
+            calls += [
+                safe(f"{BINANCE_FAPI}/fapi/v1/trades", {"symbol": s, "limit": 1000}),
+                safe(f"{BINANCE_FAPI}/fapi/v1/depth", {"symbol": s, "limit": 1000}),
+                safe(f"{BINANCE_FAPI}/fapi/v1/fundingRate", {"symbol": s, "limit": 1}),
+                safe(f"{BINANCE_FAPI}/fapi/v1/openInterest", {"symbol": s}),
+                safe(f"{BINANCE_FAPI}/futures/data/openInterestHist", {"symbol": s, "period": "5m", "limit": 1}),
+                safe(f"{BINANCE_FAPI}/fapi/v1/klines", {"symbol": s, "interval": "1m", "limit": 50}),
+            ]
+            calls += [safe(f"{BINANCE_FAPI}/fapi/v1/klines", {"symbol": s, "interval": ivl, "limit": 1000})
+                      for ivl in ("1h", "4h", "1d")]
+        await asyncio.gather(*calls)
+        if time.time() + every >= until:
+            return
+        await asyncio.sleep(every)
+
+
+async def record(out_dir: str, n_symbols: int, duration: float, rest_every: float):
+    from ingesters.symbols import SPOT, PERP
+    cap = Capture(out_dir)
+    set_recorder(cap)
+    try:
+        spot = (await SPOT.symbols(quote="USDT"))[:n_symbols]
+        perp = (await PERP.symbols(quote="USDT"))[:n_symbols]
+        until = time.time() + duration
+        spot_streams = [f"{s.lower()}@{k}" for s in spot for k in ("trade", "aggTrade")]
+        perp_streams = [f"{s.lower()}@{k}" for s in perp for k in ("depth10@500ms", "kline_1m", "aggTrade")]
+        perp_streams.append("!forceOrder@arr")
+        print(f"[record] {len(spot)} spot / {len(perp)} perp symbols for {duration:.0f}s → {out_dir}")
+        await asyncio.gather(
+            record_rest(spot, perp, until, rest_every),
+            record_ws(cap, "spot", BINANCE_STREAM, spot_streams, until),
+            record_ws(cap, "fapi", BINANCE_FSTREAM, perp_streams, until),
+        )
+    finally:
+        await close_client()
+        cap.close()
+    print(f"[record] done: {cap.rest_count:,} REST responses, {cap.ws_count:,} WS frames")
+
+
+# ========= REPLAY: REST =========
+def _param_key(params: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in params.items() if k not in VOLATILE_PARAMS))
+
+
+class RestStore:
+    """Recorded responses indexed by path + params, with looser fallbacks."""
+
+    def __init__(self, path: str, strict: bool = False):
+        self.exact = defaultdict(list)      # (path, params) -> [bodies]
+        self.by_symbol = defaultdict(list)  # (path, symbol) -> [bodies]
+        self.by_path = defaultdict(list)    # path -> [bodies]
+        self._next = defaultdict(int)
+        self.strict = strict
+        for rec in _read_jsonl_gz(path):
+            params = rec.get("params") or {}
+            body = json.dumps(rec["body"]).encode()
+            self.exact[(rec["path"], _param_key(params))].append(body)
+            self.by_symbol[(rec["path"], params.get("symbol"))].append(body)
+            self.by_path[rec["path"]].append(body)
+
+    def __len__(self):
+        return sum(len(v) for v in self.by_path.values())
+
+    def lookup(self, path: str, params: dict) -> bytes | None:
+        """Cycle through the matching recordings so repeated polls see the feed move."""
+        candidates = [("exact", (path, _param_key(params)), self.exact)]
+        if not self.strict:
+            candidates += [("symbol", (path, params.get("symbol")), self.by_symbol),
+                           ("path", path, self.by_path)]
+        for kind, key, index in candidates:
+            bodies = index.get(key)
+            if bodies:
+                i = self._next[(kind, key)]
+                self._next[(kind, key)] = i + 1
+                return bodies[i % len(bodies)]
+        return None
+
+
+async def serve_rest(store: RestStore, host: str, port: int, latency: float):
+    """Minimal keep-alive HTTP/1.1 GET server in front of a RestStore."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                target = head.split(b"\r\n", 1)[0].split(b" ")[1].decode()
+                u = urlsplit(target)
+                body = store.lookup(u.path, dict(parse_qsl(u.query)))
+                if latency:
+                    await asyncio.sleep(latency)
+                if body is None:
+                    status, body = "400 Bad Request", b'{"code":-1121,"msg":"Invalid symbol."}'
+                else:
+                    status = "200 OK"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\nX-MBX-USED-WEIGHT-1M: 0\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# ========= REPLAY: WS =========
+class WsStore:
+    """Recorded frames per (market, stream) as (t, data) lists in time order."""
+
+    def __init__(self, path: str):
+        self.frames = defaultdict(list)
+        for rec in _read_jsonl_gz(path):
+            self.frames[(rec["market"], rec["stream"])].append((rec["t"], rec["data"]))
+        for frames in self.frames.values():
+            frames.sort(key=lambda f: f[0])
+
+    def __len__(self):
+        return sum(len(v) for v in self.frames.values())
+
+    def merged(self, market: str, streams: list[str]):
+        iters = [((t, s, d) for t, d in self.frames.get((market, s), [])) for s in streams]
+        return heapq.merge(*iters, key=lambda f: f[0])
+
+
+async def serve_ws(store: WsStore, host: str, port: int, speed: float, loop_forever: bool):
+    """Replays frames for the streams a client subscribes to via its URL.
+
+    /<market>/stream?streams=a/b  -> combined frames {"stream", "data"}
+    /<market>/ws/<stream>         -> raw frames
+    """
+    import websockets
+
+    async def handler(ws):
+        u = urlsplit(ws.path)
+        parts = u.path.strip("/").split("/", 2)   # market, "ws"|"stream", [stream]
+        market = parts[0] if parts else ""
+        if len(parts) >= 2 and parts[1] == "stream":
+            streams, combined = dict(parse_qsl(u.query)).get("streams", "").split("/"), True
+        elif len(parts) == 3 and parts[1] == "ws":
+            streams, combined = [parts[2]], False
+        else:
+            await ws.close(code=1008, reason="unknown stream path")
+            return
+        print(f"[replay] WS client: {market} {len(streams)} streams")
+        try:
+            while True:
+                start, first = time.monotonic(), None
+                sent = 0
+                for t, stream, data in store.merged(market, streams):
+                    if first is None:
+                        first = t
+                    if speed > 0:
+                        delay = (t - first) / speed - (time.monotonic() - start)
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    await ws.send(json.dumps({"stream": stream, "data": data} if combined else data))
+                    sent += 1
+                if not loop_forever or not sent:
+                    break
+            await ws.wait_closed()
+        except websockets.ConnectionClosed:
+            pass
+
+    return await websockets.serve(handler, host, port, max_size=None)
+
+
+async def serve(in_dir: str, host: str, port: int, ws_port: int, speed: float,
+                loop_forever: bool, latency_ms: float, strict: bool):
+    rest = RestStore(os.path.join(in_dir, REST_FILE), strict=strict)
+    frames = WsStore(os.path.join(in_dir, WS_FILE))
+    print(f"[replay] loaded {len(rest):,} REST responses, {len(frames):,} WS frames from {in_dir}")
+    http_server = await serve_rest(rest, host, port, latency_ms / 1000)
+    ws_server = await serve_ws(frames, host, ws_port, speed, loop_forever)
+    print("[replay] point the ingesters here with:")
+    print(f"  export BINANCE_API_URL=http://{host}:{port}")
+    print(f"  export BINANCE_FAPI_URL=http://{host}:{port}")
+    print(f"  export BINANCE_STREAM_URL=ws://{host}:{ws_port}/spot")
+    print(f"  export BINANCE_FSTREAM_URL=ws://{host}:{ws_port}/fapi")
+    async with http_server:
+        await asyncio.gather(http_server.serve_forever(), ws_server.wait_closed())
+
+
+# ========= CLI =========
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    rec = sub.add_parser("record", help="capture live Binance traffic")
+    rec.add_argument("--out", required=True)
+    rec.add_argument("--symbols", type=int, default=20, help="top-N USDT symbols per market")
+    rec.add_argument("--duration", type=float, default=300, help="seconds")
+    rec.add_argument("--rest-every", type=float, default=60, help="seconds between REST snapshots")
+
+    srv = sub.add_parser("serve", help="replay a capture on local REST + WS servers")
+    srv.add_argument("--in", dest="in_dir", required=True)
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8765)
+    srv.add_argument("--ws-port", type=int, default=None, help="defaults to --port + 1")
+    srv.add_argument("--speed", type=float, default=1.0, help="WS replay speed multiplier, 0 = unthrottled")
+    srv.add_argument("--loop", action="store_true", help="restart WS replay when a capture runs out")
+    srv.add_argument("--latency-ms", type=float, default=0, help="added delay per REST response")
+    srv.add_argument("--strict", action="store_true", help="only serve exact path+params matches")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "record":
+        asyncio.run(record(args.out, args.symbols, args.duration, args.rest_every))
+    else:
+        ws_port = args.ws_port or args.port + 1
+        try:
+            asyncio.run(serve(args.in_dir, args.host, args.port, ws_port, args.speed,
+                              args.loop, args.latency_ms, args.strict))
+        except KeyboardInterrupt:
+            print("🛑 replay stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,46 @@
 import os
-import time
-import requests
-from datetime import datetime, timedelta, timezone
-from supabase import create_client, Client
+import asyncio
+from supabase import Client
+from ingesters.db import get_supabase
+
+from ingesters.binance_http import close_client
+from ingesters.symbols import SPOT
+from ingesters.writer import get_writer
+from ingesters.trade_cursor import TradePoller
+from ingesters import retention
 
 # ===== Supabase setup =====
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
-BINANCE_URL = "https://api.binance.com/api/v3"
+writer = get_writer("binance_trades_24h", mode="upsert", event_time="ts")
+poller = TradePoller("binance_trades_24h", writer)
 TIME_LIMIT_HOURS = int(os.getenv("TIME_LIMIT_HOURS", 24 * 7))
 print(f"[CONFIG] Keeping trades for the last {TIME_LIMIT_HOURS} hours")
 
-def get_all_usdt_symbols():
+async def get_all_usdt_symbols():
     """Fetch all active USDT pairs from Binance"""
-    url = f"{BINANCE_URL}/exchangeInfo"
-    r = requests.get(url, timeout=15)
-    r.raise_for_status()
-    data = r.json()
-    return [
-        s["symbol"] for s in data["symbols"]
-        if s["quoteAsset"] == "USDT" and s["status"] == "TRADING"
-    ]
-
-def fetch_trades(symbol, limit=1000):
-    """Fetch latest binance_trades_24h for a given symbol."""
-    url = f"{BINANCE_URL}/trades"
-    r = requests.get(url, params={"symbol": symbol, "limit": limit}, timeout=10)
-    r.raise_for_status()
-    return r.json()
+    return await SPOT.symbols(quote="USDT", status="TRADING")
 
 def cleanup_old_rows():
-    """Delete rows older than 24 hours."""
-    cutoff = (datetime.now(timezone.utc) - timedelta(hours=TIME_LIMIT_HOURS)).isoformat()
-    query = f"delete from binance_trades_24h  where ts < '{cutoff}'"
-    print(f"[CLEANUP] Removing rows older than {cutoff}")
-    try:
-        sb.rpc("exec_sql_v2", {"query": query}).execute()
-    except Exception as e:
-        print(f"[WARN] Cleanup skipped: {e}")
-def ingest_trades():
-    symbols = get_all_usdt_symbols()
-    print(f"[INFO] Found {len(symbols)} USDT pairs")
+    """Drop hourly partitions older than TIME_LIMIT_HOURS (see ingesters/retention.py)."""
+    retention.maintain("binance_trades_24h")
 
-    for symbol in symbols:
-        try:
-            trades = fetch_trades(symbol)
-            rows = []
-            for t in trades:
-                rows.append({
-                    "symbol": symbol,
-                    "trade_id": t["id"],
-                    "price": float(t["price"]),
-                    "qty": float(t["qty"]),
-                    "quote_qty": float(t["quoteQty"]),
-                    "side": "BUY" if not t["isBuyerMaker"] else "SELL",
-                    "is_buyer_maker": t["isBuyerMaker"],
-                    "ts": datetime.fromtimestamp(t["time"]/1000.0).isoformat()
-                })
-            if rows:
-                sb.table("binance_trades_24h").upsert(rows).execute()
-                print(f"[{symbol}] Inserted {len(rows)} trades")
-        except Exception as e:
-            print(f"[ERROR] {symbol}: {e}")
+async def ingest_trades():
+    await poller.run(await get_all_usdt_symbols())
 
-  # cleanup old data after each full pass
-    cleanup_old_rows()
-
-if __name__ == "__main__":
-    while True:
-        try:
-            ingest_trades()
-        except Exception as e:
-            print("[FATAL ERROR]", e)
-        time.sleep(300)  # run every 5 minutes
+    # cleanup old data after each full pass
+    await asyncio.to_thread(cleanup_old_rows)
 
+async def main():
+    try:
+        while True:
+            try:
+                await ingest_trades()
+            except Exception as e:
+                print("[FATAL ERROR]", e)
+            await asyncio.sleep(300)  # run every 5 minutes
+    finally:
+        await close_client()
 
+if __name__ == "__main__":
+    asyncio.run(main())
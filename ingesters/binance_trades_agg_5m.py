@@ -1,100 +1,11 @@
-import os
-import requests
-import time
-from datetime import datetime, timezone
-from supabase import create_client, Client
+"""
+binance_trades_agg_5m is now written by binance_trades_agg_ingest, which
+buckets each /trades fetch at every resolution in one pass. This entry point
+is kept so existing Procfile/cron lines keep working.
+"""
+import asyncio
 
-# ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-BINANCE_URL = "https://api.binance.com/api/v3/trades"
-EXCHANGE_INFO_URL = "https://api.binance.com/api/v3/exchangeInfo"
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing Supabase credentials")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# ========= HELPERS =========
-def get_all_usdt_symbols():
-    """Fetch all USDT trading pairs from Binance"""
-    resp = requests.get(EXCHANGE_INFO_URL)
-    resp.raise_for_status()
-    data = resp.json()
-    return [s["symbol"] for s in data["symbols"] if s["symbol"].endswith("USDT")]
-
-def get_binance_trades(symbol="BTCUSDT", limit=1000):
-    """Fetch latest trades from Binance"""
-    url = f"{BINANCE_URL}?symbol={symbol}&limit={limit}"
-    resp = requests.get(url)
-    resp.raise_for_status()
-    return resp.json()
-
-def bucketize_5m(ts: int):
-    """Return 5m bucket from trade timestamp"""
-    dt = datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
-    bucket_5m = dt.replace(minute=(dt.minute // 5) * 5, second=0, microsecond=0)
-    return bucket_5m
-
-def process_trades(symbol="BTCUSDT"):
-    """Fetch trades, bucketize, and upsert into binance_trades_agg_5m"""
-    trades = get_binance_trades(symbol=symbol)
-    agg_map = {}
-
-    for t in trades:
-        ts = t["time"]
-        qty = float(t["qty"])
-        price = float(t["price"])
-        quote_qty = qty * price
-        is_buyer_maker = t["isBuyerMaker"]
-
-        side = "SELL" if is_buyer_maker else "BUY"
-        bucket_5m = bucketize_5m(ts)
-
-        key = bucket_5m
-        if key not in agg_map:
-            agg_map[key] = {
-                "symbol": symbol,
-                "bucket_5m": bucket_5m.isoformat(),  # ✅ serialize safely
-                "buy_vol": 0,
-                "sell_vol": 0,
-                "delta": 0,
-                "bullish_trades": 0,
-                "bearish_trades": 0,
-            }
-
-        row = agg_map[key]
-        if side == "BUY":
-            row["buy_vol"] += quote_qty
-            row["delta"] += quote_qty
-            row["bullish_trades"] += 1
-        else:
-            row["sell_vol"] += quote_qty
-            row["delta"] -= quote_qty
-            row["bearish_trades"] += 1
-
-    # CVD
-    for row in agg_map.values():
-        row["cvd"] = row["delta"]
-
-    rows = list(agg_map.values())
-    if rows:
-        sb.table("binance_trades_agg_5m").upsert(rows).execute()
-        print(f"✅ {symbol}: {len(rows)} rows into binance_trades_agg_5m")
-
-# ========= MAIN LOOP =========
-def main():
-    symbols = get_all_usdt_symbols()   # 🔹 now pulls ALL USDT pairs dynamically
-    while True:
-        for sym in symbols:
-            try:
-                process_trades(symbol=sym)
-            except Exception as e:
-                print(f"[error] {sym}: {e}")
-        time.sleep(60)  # fetch every 1 min
+from ingesters.binance_trades_agg_ingest import process_trades, process_symbol, run_cycle, main  # noqa: F401
 
 if __name__ == "__main__":
-    main()
-
-
-
+    asyncio.run(main())
@@ -1,78 +1,186 @@
+"""
+Rebuild trade buckets from binance_trades, resumably and in parallel.
+
+Work is split into partitions of one symbol x one UTC day. Symbols run
+concurrently (BACKFILL_CONCURRENCY threads); the days of one symbol run in
+order so its running CVD carries across them. A day never shares a bucket
+with another day (1d is the coarsest resolution), so partitions stay
+independent in the tables.
+
+Each partition pages by (ts, trade_id) keyset rather than OFFSET, reading
+only the columns bucketing needs, and checkpoints its cursor plus the
+symbol's TradeBuckets state after every flushed page
+(ingesters/checkpoint.py, one file per partition). A re-run skips finished
+partitions and resumes the rest from their cursor; rows are merged by
+trade-id range (writer mode="merge"), so pages written before a crash but
+after the last checkpoint are not counted twice.
+
+The merge functions reject an increment that overlaps what a bucket already
+holds, so a plain run cannot repair buckets the live jobs wrote partially
+(e.g. across an outage). BACKFILL_REPLACE=1 merges with replace => true
+instead: a backfill increment that starts at or before a stored bucket's
+first trade replaces that bucket, and the following pages add onto it. Use it
+with BACKFILL_RESUME=0 for days the live jobs no longer write to; on today's
+partition a live bucket ahead of binance_trades would lose its newer trades.
+
+    BACKFILL_DAYS=7 BACKFILL_SYMBOLS=BTCUSDT,ETHUSDT python -m ingesters.binance_trades_agg_backfill
+"""
 import os
-from supabase import create_client
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from ingesters import checkpoint
+from ingesters.db import get_supabase
+from ingesters.trade_buckets import (
+    BUCKETS_TABLE, RESOLUTIONS, TradeBuckets, bucket_rows, agg_rows,
+)
+from ingesters.writer import get_writer
+
+sb = get_supabase()
+
+# ========= CONFIG =========
+BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "50000"))
+# 1m over a long history is a lot of rows; the live jobs cover it going forward
+BACKFILL_RESOLUTIONS = os.getenv("BACKFILL_RESOLUTIONS", "5m,15m,1h,4h,1d").split(",")
+BACKFILL_DAYS = int(os.getenv("BACKFILL_DAYS", "30"))              # history window, ending today
+BACKFILL_SYMBOLS = [s.strip() for s in os.getenv("BACKFILL_SYMBOLS", "").split(",") if s.strip()]
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))  # symbols in flight
+BACKFILL_RESUME = os.getenv("BACKFILL_RESUME", "1") == "1"         # 0 = ignore saved partitions
+BACKFILL_REPLACE = os.getenv("BACKFILL_REPLACE", "0") == "1"       # rebuild stored buckets (see above)
+BACKFILL_FLUSH_TIMEOUT = float(os.getenv("BACKFILL_FLUSH_TIMEOUT", "600"))   # seconds per page flush
+
+COLUMNS = "price,qty,is_buyer_maker,ts,trade_id"
+DAY_MS = 86_400_000
+
+# increments merge onto stored rows; pages already merged are rejected by trade-id range
+writer = get_writer("binance_trades_agg", mode="merge", merge_replace=BACKFILL_REPLACE)
+buckets_writer = get_writer(BUCKETS_TABLE, mode="merge", merge_replace=BACKFILL_REPLACE)
+
+
+def trade_columns(rows: list) -> tuple:
+    """binance_trades rows → (ts_ms, price, qty, is_sell, trade_id) NumPy columns."""
+    df = pd.DataFrame.from_records(rows, columns=["price", "qty", "is_buyer_maker", "ts", "trade_id"])
+    ts_ms = pd.to_datetime(df["ts"], utc=True, format="ISO8601").dt.as_unit("ms").astype("int64")
+    return (
+        ts_ms.to_numpy(),
+        df["price"].to_numpy(dtype=np.float64),
+        df["qty"].to_numpy(dtype=np.float64),
+        df["is_buyer_maker"].to_numpy(dtype=bool),   # buyer is maker → taker sold
+        df["trade_id"].to_numpy(dtype=np.int64),
+    )
+
+
+def fetch_page(symbol: str, start: str, end: str, after: list | None) -> list:
+    """Up to BATCH_SIZE trades of symbol in [start, end), strictly after the (ts, trade_id) cursor."""
+    q = sb.table("binance_trades").select(COLUMNS).eq("symbol", symbol).gte("ts", start).lt("ts", end)
+    if after:
+        ts, trade_id = after
+        q = q.or_(f'ts.gt."{ts}",and(ts.eq."{ts}",trade_id.gt.{trade_id})')
+    return q.order("ts").order("trade_id").limit(BATCH_SIZE).execute().data or []
+
+
+# ========= PARTITIONS =========
+def _iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing Supabase credentials")
+def _days(days: int) -> list[int]:
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return [int((today - timedelta(days=d)).timestamp() * 1000) for d in range(days - 1, -1, -1)]
 
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def backfill():
-    print("🚀 Backfilling from binance_trades → binance_trades_agg...")
-    # Fetch in batches (avoid timeouts)
-    offset = 0
-    batch_size = 50000
+def _partition_name(symbol: str, day_ms: int) -> str:
+    return f"backfill_{symbol}_{datetime.fromtimestamp(day_ms / 1000, tz=timezone.utc):%Y%m%d}"
+
+
+def _new_buckets(state: dict | None = None) -> TradeBuckets:
+    tb = TradeBuckets({r: RESOLUTIONS[r] for r in BACKFILL_RESOLUTIONS if r in RESOLUTIONS})
+    if state:
+        tb.restore(state)
+    return tb
+
+
+def backfill_partition(symbol: str, day_ms: int, tb: TradeBuckets, after: list | None = None) -> int:
+    """Bucket one symbol-day, checkpointing after each flushed page; returns trades read."""
+    name, start, end = _partition_name(symbol, day_ms), _iso(day_ms), _iso(day_ms + DAY_MS)
+    n = 0
     while True:
-        resp = sb.table("binance_trades") \
-            .select("*") \
-            .range(offset, offset + batch_size - 1) \
-            .execute()
-
-        rows = resp.data
-        if not rows:
-            break
-
-        agg_map = {}
-        for t in rows:
-            ts = t["ts"]
-            price = float(t["price"])
-            qty = float(t["qty"])
-            quote_qty = float(t["quote_qty"])
-            side = t["side"]
-
-            # bucket
-            import datetime
-            dt = datetime.datetime.fromisoformat(ts.replace("Z", "+00:00"))
-            bucket_15m = dt.replace(minute=(dt.minute // 15) * 15, second=0, microsecond=0)
-            bucket_1h = dt.replace(minute=0, second=0, microsecond=0)
-            bucket_1d = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-
-            key = (t["symbol"], bucket_15m, bucket_1h, bucket_1d)
-            if key not in agg_map:
-                agg_map[key] = {
-                    "symbol": t["symbol"],
-                    "bucket_15m": bucket_15m.isoformat(),
-                    "bucket_1h": bucket_1h.isoformat(),
-                    "bucket_1d": bucket_1d.isoformat(),
-                    "buy_vol": 0,
-                    "sell_vol": 0,
-                    "delta": 0,
-                    "bullish_trades": 0,
-                    "bearish_trades": 0,
-                }
-
-            row = agg_map[key]
-            if side.upper() == "BUY":
-                row["buy_vol"] += quote_qty
-                row["delta"] += quote_qty
-                row["bullish_trades"] += 1
-            else:
-                row["sell_vol"] += quote_qty
-                row["delta"] -= quote_qty
-                row["bearish_trades"] += 1
-
-        # naive CVD = delta per bucket (extend later for cumulative)
-        for row in agg_map.values():
-            row["cvd"] = row["delta"]
-
-        sb.table("binance_trades_agg").upsert(list(agg_map.values())).execute()
-        print(f"✅ Upserted {len(agg_map)} rows (offset {offset})")
-
-        offset += batch_size
+        rows = fetch_page(symbol, start, end, after)
+        if rows:
+            marks = [w.losses() for w in (writer, buckets_writer)]
+            cols = trade_columns(rows)
+            tb.add_arrays(symbol, *cols)
+            changed = tb.drain(int(cols[0][-1]), keep_ms=DAY_MS)
+            writer.put_many(agg_rows(changed))
+            buckets_writer.put_many(bucket_rows(changed))
+            after = [rows[-1]["ts"], rows[-1]["trade_id"]]
+            n += len(rows)
+            # the cursor only moves on once the rows behind it are in the database
+            # (not merely queued or spooled)
+            if not all([w.flush_committed(m, BACKFILL_FLUSH_TIMEOUT) for w, m in zip((writer, buckets_writer), marks)]):
+                raise RuntimeError(f"{name}: page not committed (flush timed out or rows spooled)")
+        done = len(rows) < BATCH_SIZE
+        checkpoint.save(name, {"after": after, "done": done, "state": tb.state()})
+        if done:
+            return n
+
+
+def backfill_symbol(symbol: str, days: list[int], resume: bool = BACKFILL_RESUME) -> int:
+    """Every day of one symbol in order, so running CVD carries from day to day."""
+    tb, n = _new_buckets(), 0
+    for day_ms in days:
+        ck = checkpoint.load(_partition_name(symbol, day_ms)) if resume else None
+        if ck:
+            tb = _new_buckets(ck.get("state"))
+            if ck.get("done"):
+                continue
+        n += backfill_partition(symbol, day_ms, tb, ck.get("after") if ck else None)
+    return n
 
-if __name__ == "__main__":
-    backfill()
 
+def backfill_symbols() -> list[str]:
+    if BACKFILL_SYMBOLS:
+        return BACKFILL_SYMBOLS
+    import asyncio
+    from ingesters.symbols import SPOT
+    asyncio.run(SPOT.load())
+    return SPOT.select(quote="USDT", status="TRADING")
 
+
+def backfill(symbols: list[str] | None = None, days: int = BACKFILL_DAYS, resume: bool = BACKFILL_RESUME):
+    """Backfill every symbol; returns (trades bucketed, symbols that failed)."""
+    symbols = symbols or backfill_symbols()
+    day_list = _days(days)
+    print(f"🚀 Backfilling {len(symbols)} symbols x {len(day_list)} days from binance_trades → "
+          f"binance_trades_agg + {BUCKETS_TABLE} ({BACKFILL_CONCURRENCY} at a time)...")
+    t0, total, failed = time.time(), 0, []
+
+    def run(symbol):
+        try:
+            return symbol, backfill_symbol(symbol, day_list, resume), None
+        except Exception as e:
+            return symbol, 0, e
+
+    with ThreadPoolExecutor(max_workers=BACKFILL_CONCURRENCY) as pool:
+        for symbol, n, err in pool.map(run, symbols):
+            if err:
+                failed.append(symbol)
+                print(f"[backfill] ❌ {symbol}: {err} (re-run to resume)")
+            elif n:
+                total += n
+                print(f"✅ {symbol}: bucketed {n:,} trades")
+
+    writer.flush()
+    buckets_writer.flush()
+    dt = time.time() - t0
+    print(f"[backfill] {total:,} trades in {dt:.1f}s ({total / max(dt, 1e-9):,.0f}/s)"
+          + (f", {len(failed)} symbols failed: {failed}" if failed else ""))
+    return total, failed
+
+
+if __name__ == "__main__":
+    backfill()
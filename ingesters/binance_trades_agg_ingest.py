@@ -1,32 +1,43 @@
-import os
-import requests
+import asyncio
 import time
-from datetime import datetime, timezone
-from supabase import create_client, Client
 
-# ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-BINANCE_URL = "https://api.binance.com/api/v3/trades"
-BINANCE_EXCHANGE_INFO_URL = "https://api.binance.com/api/v3/exchangeInfo"
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing Supabase credentials")
+from ingesters import footprint
+from ingesters.binance_http import BINANCE_API, get_json, close_client
+from ingesters.symbols import SPOT
+from ingesters.trade_buckets import (
+    BUCKETS_TABLE, TradeBuckets, bucket_rows, agg_rows, agg_5m_rows,
+    load_checkpoint, save_checkpoint,
+)
+from ingesters.vwap import VWAP_TABLE, VWAP_CONFLICT, VwapEngine, warm_start
+from ingesters.writer import get_writer
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# ========= ENV VARS =========
+BINANCE_URL = f"{BINANCE_API}/api/v3/trades"
+
+# one fetch per symbol feeds all three tables (binance_trades_agg_5m used to refetch).
+# Rows are per-poll increments tagged with their trade-id range; the tables'
+# merge functions add them onto what is stored (sql/trade_bucket_merge.sql).
+writer = get_writer("binance_trades_agg", mode="merge")
+writer_5m = get_writer("binance_trades_agg_5m", mode="merge")
+buckets_writer = get_writer(BUCKETS_TABLE, mode="merge")
+# footprint rows are whole-bar totals, so they upsert
+footprint_writer = get_writer(footprint.FOOTPRINT_TABLE, mode="upsert", on_conflict=footprint.FOOTPRINT_CONFLICT)
+vwap_writer = get_writer(VWAP_TABLE, mode="upsert", on_conflict=VWAP_CONFLICT)
+
+# Running CVD and the last trade id per symbol live across cycles; tb skips
+# trades it has already seen, so overlapping /trades pages are not double counted.
+CHECKPOINT_NAME = "binance_trades_agg"
+BUCKET_KEEP_MS = 2 * 3600 * 1000
+tb = TradeBuckets()
+fp = footprint.Footprint()
+vwap = VwapEngine()
+_restored = False
 
 # ========= HELPERS =========
-def get_all_usdt_symbols():
-    """Fetch ALL available USDT trading pairs directly from Binance"""
+async def get_all_usdt_symbols():
+    """All active USDT trading pairs from the cached symbol registry"""
     try:
-        resp = requests.get(BINANCE_EXCHANGE_INFO_URL)
-        resp.raise_for_status()
-        data = resp.json()
-        symbols = [
-            s["symbol"]
-            for s in data["symbols"]
-            if s["symbol"].endswith("USDT") and s["status"] == "TRADING"
-        ]
+        symbols = await SPOT.symbols(quote="USDT", status="TRADING")
         print(f"[info] fetched {len(symbols)} active USDT pairs")
         return symbols
     except Exception as e:
@@ -34,82 +45,64 @@ def get_all_usdt_symbols():
         # fallback to a few main pairs
         return ["BTCUSDT", "ETHUSDT", "BNBUSDT"]
 
-def get_binance_trades(symbol="BTCUSDT", limit=1000):
+async def get_binance_trades(symbol="BTCUSDT", limit=1000):
     """Fetch latest trades from Binance"""
-    url = f"{BINANCE_URL}?symbol={symbol}&limit={limit}"
-    resp = requests.get(url)
-    resp.raise_for_status()
-    return resp.json()
-
-def bucketize(ts: int):
-    """Return 15m, 1h, 1d buckets from trade timestamp"""
-    dt = datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
-    bucket_15m = dt.replace(minute=(dt.minute // 15) * 15, second=0, microsecond=0)
-    bucket_1h = dt.replace(minute=0, second=0, microsecond=0)
-    bucket_1d = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    return bucket_15m, bucket_1h, bucket_1d
-
-def process_trades(symbol="BTCUSDT"):
-    """Fetch trades, bucketize, and upsert into binance_trades_agg"""
-    trades = get_binance_trades(symbol=symbol)
-    agg_map = {}
-
-    for t in trades:
-        ts = t["time"]
-        qty = float(t["qty"])
-        price = float(t["price"])
-        quote_qty = qty * price
-        is_buyer_maker = t["isBuyerMaker"]
-
-        side = "SELL" if is_buyer_maker else "BUY"
-        bucket_15m, bucket_1h, bucket_1d = bucketize(ts)
-
-        key = (bucket_15m, bucket_1h, bucket_1d)
-        if key not in agg_map:
-            agg_map[key] = {
-                "symbol": symbol,
-                "bucket_15m": bucket_15m.isoformat(),
-                "bucket_1h": bucket_1h.isoformat(),
-                "bucket_1d": bucket_1d.isoformat(),
-                "buy_vol": 0,
-                "sell_vol": 0,
-                "delta": 0,
-                "bullish_trades": 0,
-                "bearish_trades": 0,
-            }
-
-        row = agg_map[key]
-        if side == "BUY":
-            row["buy_vol"] += quote_qty
-            row["delta"] += quote_qty
-            row["bullish_trades"] += 1
-        else:
-            row["sell_vol"] += quote_qty
-            row["delta"] -= quote_qty
-            row["bearish_trades"] += 1
-
-    for row in agg_map.values():
-        row["cvd"] = row["delta"]
-
-    rows = list(agg_map.values())
+    return await get_json(BINANCE_URL, params={"symbol": symbol, "limit": limit})
+
+async def process_trades(symbol="BTCUSDT"):
+    """Fetch trades once, bucket the new ones at every resolution, merge into all tables"""
+    trades = await get_binance_trades(symbol=symbol)
+    fp.add_trades(symbol, trades)
+    vwap.add_trades(symbol, trades)
+    if not tb.add_trades(symbol, trades):
+        return
+    now_ms = int(time.time() * 1000)
+    changed = tb.drain(now_ms, keep_ms=BUCKET_KEEP_MS)
+    await footprint_writer.aput_many(fp.drain(now_ms, keep_ms=BUCKET_KEEP_MS))
+
+    rows = agg_rows(changed)
     if rows:
-        sb.table("binance_trades_agg").upsert(rows).execute()
-        print(f"✅ Upserted {len(rows)} rows into binance_trades_agg")
+        await writer.aput_many(rows)
+        await writer_5m.aput_many(agg_5m_rows(changed))
+        await buckets_writer.aput_many(bucket_rows(changed))
+        print(f"✅ Merged {len(rows)} rows into binance_trades_agg (+5m, +{BUCKETS_TABLE})")
+
+async def process_symbol(sym):
+    try:
+        await process_trades(symbol=sym)
+    except Exception as e:
+        print(f"[error] {sym}: {e}")
+
+async def run_cycle():
+    global _restored
+    if not _restored:
+        await asyncio.to_thread(load_checkpoint, tb, CHECKPOINT_NAME)
+        footprint.load_checkpoint(fp, f"{CHECKPOINT_NAME}_footprint")
+        await asyncio.to_thread(warm_start, vwap, tb.last_ids, int(time.time() * 1000))
+        _restored = True
+    writers = (writer, writer_5m, buckets_writer, footprint_writer, vwap_writer)
+    marks = [w.losses() for w in writers]
+    # registry is cached, so this only refetches exchangeInfo after its TTL
+    symbols = await get_all_usdt_symbols()   # 🔹 pulls ALL USDT pairs dynamically
+    # concurrency is paced by the shared client's weight budget
+    await asyncio.gather(*(process_symbol(sym) for sym in symbols))
+    # expiry runs over every symbol, so windows are emitted once per cycle
+    await vwap_writer.aput_many(vwap.drain(int(time.time() * 1000)))
+    # the checkpoint only moves past rows that are in the database (not spooled or dropped)
+    done = await asyncio.gather(*(asyncio.to_thread(w.flush_committed, m) for w, m in zip(writers, marks)))
+    if all(done):
+        save_checkpoint(tb, CHECKPOINT_NAME)
+        footprint.save_checkpoint(fp, f"{CHECKPOINT_NAME}_footprint")
+    print("[cycle] completed one full loop over all symbols")
 
 # ========= MAIN LOOP =========
-def main():
-    symbols = get_all_usdt_symbols()   # 🔹 pulls ALL USDT pairs dynamically
-    while True:
-        for sym in symbols:
-            try:
-                process_trades(symbol=sym)
-                time.sleep(0.25)  # avoid Binance API rate limit
-            except Exception as e:
-                print(f"[error] {sym}: {e}")
-        print("[cycle] completed one full loop over all symbols")
-        time.sleep(60)  # wait 1 min between loops
+async def main():
+    try:
+        while True:
+            await run_cycle()
+            await asyncio.sleep(60)  # wait 1 min between loops
+    finally:
+        await close_client()
 
 if __name__ == "__main__":
-    main()
-
-
+    asyncio.run(main())
@@ -0,0 +1,237 @@
+# ingesters/binance_trades_stream.py
+"""
+Spot @aggTrade stream for every USDT pair, feeding all trade tables at once.
+
+Replaces the REST trade pollers (binance_trades, binance_trades_24h,
+binance_trades_agg) with one sharded websocket
+(ingesters/ws_shards.py):
+
+- binance_trades / binance_trades_24h get one row per aggregate trade,
+  keyed by its last trade id ("l") so ids stay in the /trades id space.
+  In stream mode these rows are aggTrades, not individual trades: qty is
+  summed over trades f..l at one price, so there are fewer rows than the
+  REST pollers write for the same fills. Trade counts live in the bucket
+  tables, which count every trade in f..l in either mode.
+- binance_trade_buckets (1m..1d), binance_trades_agg (15m/1h/1d) and
+  binance_trades_agg_5m come from one running TradeBuckets
+  (ingesters/trade_buckets.py); what each bucket gained is merged in every
+  AGG_EMIT_INTERVAL seconds (writer mode="merge", keyed by trade-id range).
+- binance_footprint (5m/1h price-binned volume per bar, ingesters/footprint.py)
+  is upserted on the same pass.
+- binance_vwap_live (rolling 1h/4h/24h and session/week VWAP with bands,
+  ingesters/vwap.py) is upserted for the windows that moved on each pass.
+- binance_whale_trades gets large prints and sweeps (ingesters/whales.py)
+  within about a second of the trade.
+
+Aggregate ids ("a") are contiguous per symbol, so a jump after a reconnect
+is refilled from /api/v3/aggTrades?fromId= before the live frame is applied;
+duplicates replayed by the exchange are dropped. Running CVD and the last
+aggregate ids are checkpointed every minute and restored at startup.
+"""
+import os
+import asyncio
+from datetime import datetime, timezone
+
+from ingesters import checkpoint, footprint
+from ingesters.binance_http import BINANCE_API, BINANCE_STREAM, get_json
+from ingesters.symbols import SPOT
+from ingesters.trade_buckets import (
+    BUCKETS_TABLE, TradeBuckets, bucket_rows, agg_rows, agg_5m_rows,
+    load_checkpoint, save_checkpoint,
+)
+from ingesters.trade_cursor import TradeCursors
+from ingesters.vwap import VWAP_TABLE, VWAP_CONFLICT, VwapEngine, warm_start
+from ingesters.whales import WHALE_TABLE, WHALE_CONFLICT, WhaleDetector
+from ingesters.writer import get_writer
+from ingesters.ws_shards import ShardSet
+
+# ========= CONFIG =========
+SHARD_SIZE = int(os.getenv("TRADES_WS_SHARD_SIZE", "100"))      # streams per connection
+AGG_EMIT_INTERVAL = float(os.getenv("TRADES_AGG_EMIT_INTERVAL", "5"))
+GAP_FILL_PAGES = int(os.getenv("TRADES_GAP_FILL_PAGES", "5"))   # x1000 aggTrades per gap
+BUCKET_KEEP_MS = 30 * 60 * 1000   # keep closed buckets this long for late frames
+CLEANUP_EVERY = 3600              # binance_trades_24h retention pass
+WHALE_FLUSH_INTERVAL = float(os.getenv("WHALE_FLUSH_INTERVAL", "0.25"))
+CHECKPOINT_NAME = "binance_trades_stream"
+
+TRADE_TABLES = ("binance_trades", "binance_trades_24h")
+trade_writers = [get_writer(t, mode="upsert", event_time="ts") for t in TRADE_TABLES]
+# bucket rows are increments; the tables' merge functions add them up
+agg_writer = get_writer("binance_trades_agg", mode="merge")
+agg_5m_writer = get_writer("binance_trades_agg_5m", mode="merge")
+buckets_writer = get_writer(BUCKETS_TABLE, mode="merge")
+footprint_writer = get_writer(footprint.FOOTPRINT_TABLE, mode="upsert", on_conflict=footprint.FOOTPRINT_CONFLICT)
+vwap_writer = get_writer(VWAP_TABLE, mode="upsert", on_conflict=VWAP_CONFLICT)
+# few rows, wanted fast: flush on age well inside a second
+whale_writer = get_writer(WHALE_TABLE, mode="upsert", on_conflict=WHALE_CONFLICT, max_age=0.5, event_time="ts")
+
+# trade ids queued per table, so switching back to the REST pollers resumes here
+cursors = [TradeCursors(t) for t in TRADE_TABLES]
+
+_last_agg_id = {}   # symbol → last aggregate id applied
+buckets = TradeBuckets()
+fp = footprint.Footprint()
+vwap = VwapEngine()
+whales = WhaleDetector()
+
+
+def _iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+# ========= TRADE HANDLING =========
+async def apply_trade(symbol: str, t: dict):
+    """One aggTrade (WS or REST shape) → trade rows + bucket increments."""
+    _last_agg_id[symbol] = t["a"]
+    ts_ms = t["T"]
+    price, qty = float(t["p"]), float(t["q"])
+    is_sell = t["m"]
+    # gap fills after a restart replay trades already written; skip their rows
+    targets = [(w, c) for w, c in zip(trade_writers, cursors) if c.is_new(symbol, t["l"])]
+    if targets:
+        row = {
+            "symbol": symbol,
+            "trade_id": t["l"],
+            "price": price,
+            "qty": qty,
+            "quote_qty": price * qty,
+            "side": "SELL" if is_sell else "BUY",
+            "is_buyer_maker": is_sell,
+            "ts": _iso(ts_ms),
+        }
+        for w, c in targets:
+            await w.aput(row)
+            c.advance(symbol, t["l"])
+
+    # trades already merged before a restart are skipped here
+    buckets.add(symbol, ts_ms, price, qty, is_sell, t["l"], t["f"])
+    fp.add(symbol, ts_ms, price, qty, is_sell, t["l"])
+    vwap.add(symbol, ts_ms, price, qty, t["l"])
+    for ev in whales.add(symbol, ts_ms, price, qty, is_sell, t["f"], t["l"]):
+        await whale_writer.aput(ev)
+
+
+async def fill_gap(symbol: str, after_id: int, before_id: int):
+    """Replay aggTrades (after_id, before_id) missed while disconnected."""
+    from_id, filled = after_id + 1, 0
+    for _ in range(GAP_FILL_PAGES):
+        page = await get_json(f"{BINANCE_API}/api/v3/aggTrades",
+                              params={"symbol": symbol, "fromId": from_id, "limit": 1000})
+        for t in page:
+            if t["a"] >= before_id:
+                break
+            await apply_trade(symbol, t)
+            filled += 1
+        if len(page) < 1000 or page[-1]["a"] >= before_id - 1:
+            break
+        from_id = page[-1]["a"] + 1
+    missing = before_id - after_id - 1 - filled
+    print(f"[trades_stream] {symbol}: refilled {filled} aggTrades"
+          + (f", {missing} still missing" if missing > 0 else ""))
+
+
+async def on_stream_message(stream, payload):
+    if payload.get("e") != "aggTrade":
+        return
+    symbol, agg_id = payload["s"], payload["a"]
+    last = _last_agg_id.get(symbol)
+    if last is not None:
+        if agg_id <= last:
+            return  # replayed after reconnect
+        if agg_id > last + 1:
+            try:
+                await fill_gap(symbol, last, agg_id)
+            except Exception as e:
+                print(f"[trades_stream] ⚠️ {symbol}: gap fill failed: {e}")
+    await apply_trade(symbol, payload)
+
+
+SHARDS = ShardSet("binance_trades_stream", BINANCE_STREAM, on_stream_message, shard_size=SHARD_SIZE)
+
+
+# ========= BUCKET EMITTER =========
+async def emit_buckets():
+    """Merge what each bucket gained since the last pass every AGG_EMIT_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(AGG_EMIT_INTERVAL)
+        now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        changed = buckets.drain(now_ms, keep_ms=BUCKET_KEEP_MS)
+        if changed.get("1m"):
+            await buckets_writer.aput_many(bucket_rows(changed))
+            await agg_writer.aput_many(agg_rows(changed))
+            await agg_5m_writer.aput_many(agg_5m_rows(changed))
+        await footprint_writer.aput_many(fp.drain(now_ms, keep_ms=BUCKET_KEEP_MS))
+        await vwap_writer.aput_many(vwap.drain(now_ms))
+
+
+async def emit_whales():
+    """Close sweeps that went quiet; whale_writer's short max_age gets them out."""
+    while True:
+        await asyncio.sleep(WHALE_FLUSH_INTERVAL)
+        events = whales.flush()
+        if events:
+            await whale_writer.aput_many(events)
+
+
+async def save_state():
+    """Persist cursors and running CVD once the rows behind them are committed."""
+    writers = trade_writers + [buckets_writer, agg_writer, agg_5m_writer, footprint_writer, vwap_writer, whale_writer]
+    marks = [w.losses() for w in writers]
+    while True:
+        await asyncio.sleep(60)
+        # a chunk spooled or dropped since the last pass skips this save
+        done = await asyncio.gather(*(asyncio.to_thread(w.flush_committed, m) for w, m in zip(writers, marks)))
+        marks = [w.losses() for w in writers]
+        if all(done):
+            for c in cursors:
+                c.save()
+            save_checkpoint(buckets, CHECKPOINT_NAME, _last_agg_id)   # on the loop: it folds live state
+            footprint.save_checkpoint(fp, f"{CHECKPOINT_NAME}_footprint")
+            checkpoint.save(f"{CHECKPOINT_NAME}_whales", whales.state())
+        st = trade_writers[0].stats()
+        print(f"🩵 [trades_stream] {st['written']:,} trades written, queue {st['queue_depth']:,}/{st['queue_capacity']:,}, "
+              f"{len(_last_agg_id)} symbols live, {whales.flagged:,} whale prints")
+
+
+async def cleanup_24h():
+    from ingesters.binance_trades_24h import cleanup_old_rows
+    while True:
+        await asyncio.to_thread(cleanup_old_rows)
+        await asyncio.sleep(CLEANUP_EVERY)
+
+
+# ========= UNIVERSE =========
+def load_streams():
+    symbols = SPOT.select(quote="USDT", status="TRADING")
+    print(f"✅ [trades_stream] {len(symbols)} USDT pairs")
+    return [f"{s.lower()}@aggTrade" for s in symbols]
+
+
+async def on_universe_change(added, removed):
+    print(f"🔁 [trades_stream] universe changed (+{sorted(added)} -{sorted(removed)}) → resharding")
+    SHARDS.start(load_streams())
+
+
+# ========= ENTRY POINT =========
+async def main():
+    await SPOT.load()
+    # a recent checkpoint also restores aggregate ids, so the restart gap is refilled
+    _last_agg_id.update(await asyncio.to_thread(load_checkpoint, buckets, CHECKPOINT_NAME))
+    footprint.load_checkpoint(fp, f"{CHECKPOINT_NAME}_footprint")
+    whales.restore(checkpoint.load(f"{CHECKPOINT_NAME}_whales") or {})
+    await asyncio.to_thread(warm_start, vwap, buckets.last_ids, int(datetime.now(timezone.utc).timestamp() * 1000))
+    SHARDS.start(load_streams())
+    # the supervisor re-runs main() after a crash: drop the listener with the shards
+    SPOT.subscribe(on_universe_change)
+    try:
+        await asyncio.gather(emit_buckets(), emit_whales(), save_state(), cleanup_24h(), SPOT.watch())
+    finally:
+        SPOT.unsubscribe(on_universe_change)
+        SHARDS.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("🛑 Shutting down gracefully...")
@@ -0,0 +1,42 @@
+# ingesters/checkpoint.py
+"""
+Small JSON checkpoints for in-memory job state (running CVD, stream ids).
+
+    state = checkpoint.load("binance_trades_stream") or {}
+    ...
+    checkpoint.save("binance_trades_stream", state)
+
+Writes go to a temp file and are renamed into place, so a crash mid-save
+leaves the previous checkpoint intact. Like the symbol cache and spool this
+lives on the dyno's disk: a fresh dyno starts without one, so callers need a
+fallback (usually seeding from the database).
+"""
+import os
+import json
+import tempfile
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "tfe_checkpoints"))
+
+
+def _path(name: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, f"{name}.json")
+
+
+def load(name: str) -> dict | None:
+    try:
+        with open(_path(name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save(name: str, state: dict):
+    path = _path(name)
+    try:
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[checkpoint] ⚠️ could not write {path}: {e}")
@@ -2,19 +2,16 @@ import os
 import time
 import requests
 from datetime import datetime, timezone
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
 # ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 COINAPI_KEY = os.getenv("COINAPI_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing Supabase credentials")
 if not COINAPI_KEY:
     raise RuntimeError("Missing COINAPI_KEY")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 HEADERS = {"X-CoinAPI-Key": COINAPI_KEY}
 BASE_URL = "https://rest.coinapi.io/v1"
@@ -83,11 +80,14 @@ def ingest_funding():
         sb.table("coinapi_funding").upsert(rows).execute()
         print(f"[CoinAPI Funding] Upserted {len(rows)} rows")
 
+def run_cycle():
+    ingest_open_interest()
+    ingest_funding()
+
 if __name__ == "__main__":
     while True:
         try:
-            ingest_open_interest()
-            ingest_funding()
+            run_cycle()
         except Exception as e:
             print("[error]", e)
         time.sleep(300)  # every 5 minutes
@@ -1,14 +1,13 @@
 import os
 import requests
 from datetime import datetime, timezone
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
 # ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 COINGLASS_API_KEY = os.getenv("COINGLASS_API_KEY")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 BASE_URL = "https://open-api-v4.coinglass.com/api"
 HEADERS = {"accept": "application/json", "coinglassSecret": COINGLASS_API_KEY}
@@ -0,0 +1,28 @@
+# ingesters/db.py
+"""
+Process-wide Supabase client.
+
+Every job used to call create_client() at import time. Under the supervisor
+all jobs share one interpreter, so they share this one client (and its
+connection pool) instead.
+"""
+import os
+import threading
+from supabase import create_client, Client
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_supabase() -> Client:
+    """Create the Supabase client on first use and return the same one after."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                url = os.getenv("SUPABASE_URL")
+                key = os.getenv("SUPABASE_KEY")
+                if not url or not key:
+                    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
+                _client = create_client(url, key)
+    return _client
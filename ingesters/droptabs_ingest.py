@@ -1,13 +1,11 @@
 import os
 import requests
-from supabase import create_client
+from ingesters.db import get_supabase
 
 # ========= ENV VARS =========
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 DROPTABS_KEY = os.getenv("DROPTABS_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = get_supabase()
 
 BASE_URL = "https://public-api.dropstab.com/api/v1"
 
@@ -0,0 +1,206 @@
+# ingesters/footprint.py
+"""
+Streaming footprint / volume profile per bar.
+
+TradeBuckets keeps one buy/sell total per time bucket; Footprint keeps them
+per price bin inside each bar, so signal views get point of control and
+value area without scanning raw trades:
+
+    fp = Footprint()
+    fp.add_trades(symbol, trades)                 # /api/v3/trades payload
+    writer.put_many(fp.drain(now_ms, keep_ms))    # binance_footprint rows
+
+Bin width follows the symbol's tick size (spot exchangeInfo via the symbol
+registry): the smallest 1-2-5 multiple of the tick that is at least
+FOOTPRINT_BIN_BPS of the price when the symbol is first seen, so BTC and a
+sub-cent coin both get a few dozen to a few hundred bins per bar. The width
+is then fixed for that symbol and resolution and stored on every row.
+
+Each row holds the bar's profile as two dense arrays (base-asset buy and sell
+volume per bin, starting at price_low) plus POC, VAH/VAL and totals. Rows are
+full bar totals and are upserted as the bar fills; trade ids at or below the
+newest one added per symbol are skipped. Because a row replaces the stored
+bar, open bars are checkpointed with the job's other state and restored on a
+quick restart; after a longer outage the bars in progress restart empty.
+"""
+import os
+import math
+import time
+
+import numpy as np
+
+from ingesters import checkpoint
+from ingesters.symbols import SPOT
+
+# ========= CONFIG =========
+FOOTPRINT_TABLE = "binance_footprint"
+FOOTPRINT_CONFLICT = "symbol,resolution,bar_start"
+_RES_MS = {"1m": 60_000, "5m": 300_000, "15m": 900_000, "1h": 3_600_000, "4h": 14_400_000, "1d": 86_400_000}
+FOOTPRINT_RESOLUTIONS = {r: _RES_MS[r] for r in os.getenv("FOOTPRINT_RESOLUTIONS", "5m,1h").split(",") if r in _RES_MS}
+# target bin width per resolution, in basis points of price
+FOOTPRINT_BIN_BPS = {
+    k: float(v) for k, v in
+    (p.split(":") for p in os.getenv("FOOTPRINT_BIN_BPS", "1m:1,5m:2,15m:3,1h:5,4h:10,1d:20").split(","))
+}
+FOOTPRINT_VALUE_AREA = float(os.getenv("FOOTPRINT_VALUE_AREA", "0.7"))
+
+
+def bin_width(price: float, tick: float | None, bps: float) -> float:
+    """Smallest 1-2-5 multiple of tick that is at least bps of price."""
+    target = price * bps / 1e4
+    if not tick or tick <= 0:
+        tick = 10 ** math.floor(math.log10(target)) if target > 0 else 1e-8
+    m = max(1.0, target / tick)
+    mag = 10 ** math.floor(math.log10(m))
+    for step in (1, 2, 5, 10):
+        if step * mag >= m - 1e-9:
+            return float(f"{tick * step * mag:.12g}")
+
+
+def value_area(total: np.ndarray, poc: int, share: float = FOOTPRINT_VALUE_AREA) -> tuple[int, int]:
+    """(low, high) bin indexes holding `share` of the volume, grown outward from the POC."""
+    target, covered = total.sum() * share, total[poc]
+    lo = hi = poc
+    while covered < target and (lo > 0 or hi < len(total) - 1):
+        up = total[hi + 1] if hi < len(total) - 1 else -1.0
+        down = total[lo - 1] if lo > 0 else -1.0
+        if up >= down:
+            hi += 1
+            covered += up
+        else:
+            lo -= 1
+            covered += down
+    return lo, hi
+
+
+class Footprint:
+    """Buy/sell base volume per (symbol, resolution, bar, price bin)."""
+
+    def __init__(self, resolutions: dict = FOOTPRINT_RESOLUTIONS, tick_size=None):
+        self.resolutions = dict(resolutions)
+        self.tick_size = tick_size or (lambda s: (SPOT.info(s) or {}).get("tick_size"))
+        self.last_ids = {}      # symbol → newest trade id added
+        self.bars = {}          # (symbol, res, start_ms) → {bin: [buy, sell, trades]}
+        self._ids = {}          # bar key → [first_id, last_id]
+        self._widths = {}       # (symbol, res) → bin width
+        self._plans = {}        # symbol → [(res, ms, width)]
+        self._dirty = set()
+
+    def _plan(self, symbol: str, price: float) -> list:
+        plan = self._plans[symbol] = [(res, ms, self.width(symbol, res, price)) for res, ms in self.resolutions.items()]
+        return plan
+
+    def width(self, symbol: str, res: str, price: float) -> float:
+        w = self._widths.get((symbol, res))
+        if w is None:
+            w = self._widths[(symbol, res)] = bin_width(price, self.tick_size(symbol), FOOTPRINT_BIN_BPS.get(res, 5.0))
+        return w
+
+    # ---- hot path ----
+    def add(self, symbol: str, ts_ms: int, price: float, qty: float, is_sell: bool, trade_id: int) -> bool:
+        if trade_id <= self.last_ids.get(symbol, -1):
+            return False
+        self.last_ids[symbol] = trade_id
+        side = 1 if is_sell else 0
+        bars, ids, dirty = self.bars, self._ids, self._dirty
+        for res, ms, width in self._plans.get(symbol) or self._plan(symbol, price):
+            key = (symbol, res, ts_ms - ts_ms % ms)
+            bar = bars.get(key)
+            if bar is None:
+                bar = bars[key] = {}
+                ids[key] = [trade_id, trade_id]
+            else:
+                ids[key][1] = trade_id
+            b = int(price // width)
+            level = bar.get(b)
+            if level is None:
+                level = bar[b] = [0.0, 0.0, 0]
+            level[side] += qty
+            level[2] += 1
+            dirty.add(key)
+        return True
+
+    def add_trades(self, symbol: str, trades: list) -> int:
+        """/api/v3/trades payload; returns trades added."""
+        add = self.add
+        return sum(add(symbol, t["time"], float(t["price"]), float(t["qty"]), t["isBuyerMaker"], t["id"])
+                   for t in trades)
+
+    # ---- checkpointing ----
+    def state(self) -> dict:
+        """Open bars, bin widths and last trade ids, JSON-safe."""
+        return {
+            "last_ids": dict(self.last_ids),
+            "widths": [[s, r, w] for (s, r), w in self._widths.items()],
+            "bars": [[s, r, start, *self._ids[(s, r, start)], [[b, *lv] for b, lv in bar.items()]]
+                     for (s, r, start), bar in self.bars.items()],
+        }
+
+    def restore(self, state: dict):
+        for symbol, last in (state.get("last_ids") or {}).items():
+            self.last_ids.setdefault(symbol, int(last))
+        for s, r, w in state.get("widths") or []:
+            self._widths.setdefault((s, r), float(w))
+        for s, r, start, first_id, last_id, levels in state.get("bars") or []:
+            key = (s, r, int(start))
+            if r in self.resolutions and key not in self.bars:
+                self.bars[key] = {int(b): [float(buy), float(sell), int(n)] for b, buy, sell, n in levels}
+                self._ids[key] = [int(first_id), int(last_id)]
+
+    # ---- output ----
+    def _row(self, key: tuple) -> dict:
+        symbol, res, start = key
+        bar, width = self.bars[key], self._widths[(symbol, res)]
+        lo, hi = min(bar), max(bar)
+        levels = np.zeros((hi - lo + 1, 3))
+        for b, level in bar.items():
+            levels[b - lo] = level
+        buy, sell = levels[:, 0], levels[:, 1]
+        total = buy + sell
+        poc = int(total.argmax())
+        val, vah = value_area(total, poc)
+        first_id, last_id = self._ids[key]
+        return {
+            "symbol": symbol,
+            "resolution": res,
+            "bar_start": _iso(start),
+            "bin_width": width,
+            "price_low": float(f"{lo * width:.12g}"),
+            "buy_vol": [round(v, 8) for v in buy.tolist()],
+            "sell_vol": [round(v, 8) for v in sell.tolist()],
+            "poc_price": float(f"{(lo + poc + 0.5) * width:.12g}"),
+            "val_price": float(f"{(lo + val) * width:.12g}"),
+            "vah_price": float(f"{(lo + vah + 1) * width:.12g}"),
+            "volume": float(total.sum()),
+            "delta": float(buy.sum() - sell.sum()),
+            "trades": int(levels[:, 2].sum()),
+            "first_trade_id": first_id,
+            "last_trade_id": last_id,
+        }
+
+    def drain(self, now_ms: int | None = None, keep_ms: int | None = None) -> list[dict]:
+        """Rows for every bar changed since the last drain; forgets bars older than keep_ms."""
+        rows = [self._row(key) for key in self._dirty]
+        self._dirty.clear()
+        if keep_ms is not None and now_ms is not None:
+            for key in [k for k in self.bars if k[2] + self.resolutions[k[1]] < now_ms - keep_ms]:
+                del self.bars[key], self._ids[key]
+        return rows
+
+
+def _iso(ms: int) -> str:
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def load_checkpoint(fp: Footprint, name: str, max_age: float = 600):
+    """Resume open bars unless the checkpoint is older than max_age seconds."""
+    ck = checkpoint.load(name) or {}
+    age = time.time() - ck.get("saved_at", 0)
+    if ck and age <= max_age:
+        fp.restore(ck)
+        print(f"[footprint] {name}: resumed {len(fp.bars)} open bars ({age:.0f}s old)")
+
+
+def save_checkpoint(fp: Footprint, name: str):
+    checkpoint.save(name, {"saved_at": time.time(), **fp.state()})
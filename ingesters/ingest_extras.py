@@ -1,6 +1,6 @@
 # ingest_extras.py
-import os, time
-from supabase import create_client
+import time
+from ingesters.db import get_supabase
 from datetime import datetime, timezone
 
 from ingesters.unlocks import fetch_unlocks_for
@@ -8,9 +8,7 @@ from ingesters.heatmap import fetch_binance_depth, bucketize_depth
 from ingesters.maxpain import compute_max_pain_for_exp
 import requests
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb = get_supabase()
 
 def upsert(table: str, rows: list, conflict_cols: list):
     if rows:
@@ -0,0 +1,254 @@
+# ingesters/local_book.py
+"""
+Local L2 order books kept in sync from Binance diff-depth streams.
+
+Follows Binance's "manage a local order book" procedure per symbol:
+
+  1. subscribe <symbol>@depth@100ms and buffer events,
+  2. fetch a REST snapshot (depth?limit=BOOK_SNAPSHOT_LIMIT) → lastUpdateId,
+  3. drop buffered events the snapshot already covers (futures: u < lastUpdateId,
+     spot: u <= lastUpdateId); the first applied event must straddle it
+     (futures: U <= lastUpdateId <= u, spot: U <= lastUpdateId + 1 <= u),
+  4. every later event must continue the previous one (futures: pu == last u,
+     spot: U == last u + 1); otherwise the book is resynced from step 2.
+
+    books = LocalBooks(market="perp")
+    shards = ShardSet("local_book", BINANCE_FSTREAM, books.on_stream_message)
+    shards.start([f"{s}@depth@100ms" for s in symbols])
+    book = books.get("BTCUSDT")            # None until synced
+    book.top(10); book.depth_to_price("BID", 64_000); book.notional_within_bps(25)
+
+Each side keeps parallel sorted price / quantity lists (asks ascending, bids
+ascending with the best bid last), updated with bisect. Queries then slice
+the top of the book instead of walking a dict. snapshot(limit) returns the
+REST depth shape, so heatmap.bucketize_depth() and friends can read a book
+from memory instead of calling depth?limit=1000. Books only exist in the
+process running the stream, so consumers have to run there too (see
+emit_heatmap() in binance_orderbook_ingest.py).
+"""
+import os
+import asyncio
+from bisect import bisect_left, bisect_right
+from operator import mul
+
+from ingesters.binance_http import BINANCE_API, BINANCE_FAPI, get_json
+from ingesters.metrics import counter
+
+# ========= CONFIG =========
+BOOK_SNAPSHOT_LIMIT = int(os.getenv("BOOK_SNAPSHOT_LIMIT", "1000"))
+BOOK_SNAPSHOT_CONCURRENCY = int(os.getenv("BOOK_SNAPSHOT_CONCURRENCY", "4"))   # weight 20 each on futures
+BOOK_BUFFER_EVENTS = int(os.getenv("BOOK_BUFFER_EVENTS", "2000"))               # per symbol while syncing
+
+BOOK_RESYNCS = counter("tfe_local_book_resyncs_total", "Local order book resyncs by reason", ["reason"])
+
+
+class BookSide:
+    """One side of the book as parallel sorted lists; best price at the end for bids, the start for asks."""
+
+    __slots__ = ("prices", "qtys", "bids")
+
+    def __init__(self, bids: bool):
+        self.prices = []
+        self.qtys = []
+        self.bids = bids
+
+    def set(self, price: float, qty: float):
+        prices = self.prices
+        i = bisect_left(prices, price)
+        if i < len(prices) and prices[i] == price:
+            if qty:
+                self.qtys[i] = qty
+            else:
+                del prices[i], self.qtys[i]
+        elif qty:
+            prices.insert(i, price)
+            self.qtys.insert(i, qty)
+
+    def load(self, levels: list):
+        pairs = sorted((float(p), float(q)) for p, q in levels if float(q))
+        self.prices = [p for p, _ in pairs]
+        self.qtys = [q for _, q in pairs]
+
+    def best(self) -> float | None:
+        if not self.prices:
+            return None
+        return self.prices[-1] if self.bids else self.prices[0]
+
+    def top(self, n: int) -> list[tuple[float, float]]:
+        """Best n levels, best first."""
+        if self.bids:
+            k = max(0, len(self.prices) - n)
+            return list(zip(reversed(self.prices[k:]), reversed(self.qtys[k:])))
+        return list(zip(self.prices[:n], self.qtys[:n]))
+
+    def _span(self, price: float) -> slice:
+        """Levels from the best price through price (inclusive)."""
+        if self.bids:
+            return slice(bisect_left(self.prices, price), len(self.prices))
+        return slice(0, bisect_right(self.prices, price))
+
+    def depth_to(self, price: float) -> tuple[float, float]:
+        """(quantity, notional) resting between the best price and price."""
+        s = self._span(price)
+        prices, qtys = self.prices[s], self.qtys[s]
+        return sum(qtys), sum(map(mul, prices, qtys))
+
+
+class LocalBook:
+    """One symbol's book plus its diff-stream sync state."""
+
+    def __init__(self, symbol: str, market: str = "perp"):
+        self.symbol = symbol
+        self.market = market
+        self.bids = BookSide(bids=True)
+        self.asks = BookSide(bids=False)
+        self.last_update_id = None   # u of the last applied event (or the snapshot's lastUpdateId)
+        self.synced = False
+        self._first = False          # next event must straddle the snapshot
+        self.event_time = None
+        self.buffer = []
+
+    # ---- sync ----
+    def load_snapshot(self, snap: dict) -> bool:
+        """Apply a REST snapshot, then the buffered events that follow it; False if they do not."""
+        self.bids.load(snap.get("bids", []))
+        self.asks.load(snap.get("asks", []))
+        self.last_update_id = snap["lastUpdateId"]
+        self.event_time = snap.get("E") or snap.get("T")
+        self.synced, self._first = True, True
+        buffered, self.buffer = self.buffer, []
+        for i, ev in enumerate(buffered):
+            if not self.apply(ev):
+                self.buffer += buffered[i + 1:]
+                return False
+        return True
+
+    def _continues(self, ev: dict) -> bool:
+        if self._first:
+            # the first event after the snapshot has to straddle its lastUpdateId
+            start = self.last_update_id + (0 if self.market == "perp" else 1)
+            return ev["U"] <= start <= ev["u"]
+        if "pu" in ev:
+            return ev["pu"] == self.last_update_id
+        return ev["U"] == self.last_update_id + 1
+
+    def apply(self, ev: dict) -> bool:
+        """One diff event; buffered while unsynced. False when a gap forces a resync."""
+        if not self.synced:
+            self.buffer.append(ev)
+            if len(self.buffer) > BOOK_BUFFER_EVENTS:
+                del self.buffer[:len(self.buffer) - BOOK_BUFFER_EVENTS]
+            return True
+        # futures may start with the event ending exactly on the snapshot; spot may not
+        keep_equal = self._first and self.market == "perp"
+        if ev["u"] < self.last_update_id or (ev["u"] == self.last_update_id and not keep_equal):
+            return True   # already in the snapshot / applied
+        if not self._continues(ev):
+            self.synced = False
+            self.buffer = [ev]
+            return False
+        self._first = False
+        self._apply(ev)
+        return True
+
+    def _apply(self, ev: dict):
+        for p, q in ev.get("b", []):
+            self.bids.set(float(p), float(q))
+        for p, q in ev.get("a", []):
+            self.asks.set(float(p), float(q))
+        self.last_update_id = ev["u"]
+        self.event_time = ev.get("E")
+
+    # ---- queries ----
+    def mid(self) -> float | None:
+        bid, ask = self.bids.best(), self.asks.best()
+        return (bid + ask) / 2 if bid is not None and ask is not None else None
+
+    def top(self, n: int = 10) -> tuple[list, list]:
+        """(bids, asks) best n levels each, best first."""
+        return self.bids.top(n), self.asks.top(n)
+
+    def depth_to_price(self, side: str, price: float) -> tuple[float, float]:
+        """Cumulative (quantity, notional) from the best price on side ("BID"/"ASK") through price."""
+        return (self.bids if side.upper() == "BID" else self.asks).depth_to(price)
+
+    def notional_within_bps(self, bps: float) -> tuple[float, float]:
+        """(bid, ask) notional resting within bps of mid."""
+        mid = self.mid()
+        if mid is None:
+            return 0.0, 0.0
+        return self.bids.depth_to(mid * (1 - bps / 1e4))[1], self.asks.depth_to(mid * (1 + bps / 1e4))[1]
+
+    def snapshot(self, limit: int = 1000) -> dict:
+        """REST depth-shaped dict of the top `limit` levels (what heatmap.bucketize_depth expects)."""
+        bids, asks = self.top(limit)
+        return {"lastUpdateId": self.last_update_id, "E": self.event_time,
+                "bids": [[p, q] for p, q in bids], "asks": [[p, q] for p, q in asks]}
+
+
+class LocalBooks:
+    """Books for a whole stream universe, resyncing any symbol that falls out of sequence."""
+
+    def __init__(self, market: str = "perp", snapshot_limit: int = BOOK_SNAPSHOT_LIMIT):
+        self.market = market
+        self.snapshot_limit = snapshot_limit
+        self.books = {}
+        self.resyncs = 0
+        self._syncing = {}
+        self._sem = asyncio.Semaphore(BOOK_SNAPSHOT_CONCURRENCY)
+
+    def get(self, symbol: str) -> LocalBook | None:
+        """The symbol's book once it is in sync, else None."""
+        book = self.books.get(symbol.upper())
+        return book if book is not None and book.synced else None
+
+    async def fetch_snapshot(self, symbol: str) -> dict:
+        url = f"{BINANCE_FAPI}/fapi/v1/depth" if self.market == "perp" else f"{BINANCE_API}/api/v3/depth"
+        return await get_json(url, params={"symbol": symbol, "limit": self.snapshot_limit})
+
+    async def _sync(self, book: LocalBook):
+        try:
+            while True:
+                async with self._sem:
+                    snap = await self.fetch_snapshot(book.symbol)
+                if book.load_snapshot(snap):
+                    return
+                BOOK_RESYNCS.labels("stale_snapshot").inc()
+                await asyncio.sleep(0.5)   # the buffered stream had already moved past it
+        except Exception as e:
+            print(f"[local_book] ⚠️ {book.symbol}: snapshot failed: {e}")
+            book.synced = False
+        finally:
+            self._syncing.pop(book.symbol, None)
+
+    def _resync(self, book: LocalBook):
+        if book.symbol not in self._syncing:
+            self._syncing[book.symbol] = asyncio.create_task(self._sync(book))
+
+    async def on_event(self, ev: dict):
+        symbol = ev["s"]
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = LocalBook(symbol, self.market)
+            book.buffer.append(ev)
+            self._resync(book)
+            return
+        if not book.apply(ev):
+            self.resyncs += 1
+            BOOK_RESYNCS.labels("gap").inc()
+            print(f"[local_book] 🔁 {symbol}: sequence gap at U={ev['U']} → resync")
+            self._resync(book)
+        elif not book.synced:
+            self._resync(book)   # e.g. a snapshot that failed earlier
+
+    async def on_stream_message(self, stream, payload):
+        """ShardSet handler for <symbol>@depth@<speed> streams."""
+        if payload.get("e") == "depthUpdate":
+            await self.on_event(payload)
+
+    def drop(self, symbols):
+        for s in symbols:
+            self.books.pop(s.upper(), None)
+            task = self._syncing.pop(s.upper(), None)
+            if task:
+                task.cancel()
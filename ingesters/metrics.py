@@ -0,0 +1,273 @@
+# ingesters/metrics.py
+"""
+Process-wide metrics in Prometheus text format, no client library needed.
+
+    from ingesters.metrics import counter, histogram
+    REQS = counter("tfe_upstream_responses_total", "Upstream responses", ["host", "path", "status"])
+    REQS.labels(host, path, "200").inc()
+
+start_server() serves GET /metrics on METRICS_PORT from a daemon thread; the
+supervisor calls it at startup. Collectors registered with add_collector()
+are evaluated at scrape time (writer queue depths, Binance weight used).
+"""
+import os
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ========= CONFIG =========
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))   # 0 disables the endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+# ========= METRIC TYPES =========
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines += child.render(self.name, self.labelnames, key)
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def render(self, name, names, key):
+        return [f"{name}{_fmt_labels(names, key)} {_fmt_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, name, names, key):
+        out, cum = [], 0
+        for le, n in zip(list(self.buckets) + [float("inf")], self.counts):
+            cum += n
+            out.append(f"{name}_bucket{_fmt_labels(names, key, [('le', _fmt_value(le))])} {cum}")
+        out.append(f"{name}_sum{_fmt_labels(names, key)} {_fmt_value(self.sum)}")
+        out.append(f"{name}_count{_fmt_labels(names, key)} {cum}")
+        return out
+
+
+class _Timer:
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+# ========= REGISTRY =========
+_metrics = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name, help_text, labelnames=(), **kw):
+    with _registry_lock:
+        m = _metrics.get(name)
+        if m is None:
+            m = _metrics[name] = cls(name, help_text, labelnames, **kw)
+        return m
+
+
+def counter(name, help_text, labelnames=()) -> Counter:
+    return _register(Counter, name, help_text, labelnames)
+
+
+def gauge(name, help_text, labelnames=()) -> Gauge:
+    return _register(Gauge, name, help_text, labelnames)
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+
+def add_collector(fn):
+    """fn() is called before every scrape, typically to set gauges."""
+    _collectors.append(fn)
+
+
+def render() -> str:
+    for fn in list(_collectors):
+        try:
+            fn()
+        except Exception as e:
+            print(f"[metrics] collector {getattr(fn, '__name__', fn)} failed: {e}")
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for m in metrics:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+
+# ========= HTTP ENDPOINT =========
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass  # scrapes every 15s would drown the job logs
+
+
+_server = None
+
+
+def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Serve /metrics from a daemon thread (idempotent; port 0 disables)."""
+    global _server
+    if _server is not None or not port:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"[metrics] ⚠️ could not bind {host}:{port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[metrics] 📈 serving on http://{host}:{port}/metrics")
+    return _server
+
+
+# ========= SHARED METRICS =========
+# Defined here so every module reports under the same names.
+JOB_CYCLE_SECONDS = histogram("tfe_job_cycle_seconds", "Duration of one job cycle", ["job"])
+JOB_RUNS = counter("tfe_job_runs_total", "Job cycles by outcome", ["job", "status"])
+JOB_LAST_SUCCESS = gauge("tfe_job_last_success_timestamp_seconds", "Unix time of the last successful cycle", ["job"])
+JOB_OVERRUNS = counter("tfe_job_overruns_total", "Cycles that took longer than the job cadence", ["job"])
+STREAM_RESTARTS = counter("tfe_stream_restarts_total", "Long-running stream restarts", ["job"])
+
+UPSTREAM_SECONDS = histogram("tfe_upstream_request_seconds", "Upstream HTTP request latency", ["host", "path"])
+UPSTREAM_RESPONSES = counter("tfe_upstream_responses_total", "Upstream HTTP responses by status", ["host", "path", "status"])
+UPSTREAM_WEIGHT_USED = gauge("tfe_upstream_weight_used", "Binance IP weight used in the current minute", ["host"])
+
+WS_MESSAGES = counter("tfe_ws_messages_total", "WebSocket messages received", ["stream", "shard"])
+WS_RECONNECTS = counter("tfe_ws_reconnects_total", "WebSocket reconnects", ["stream", "shard"])
+
+ROWS_PRODUCED = counter("tfe_rows_produced_total", "Rows handed to the writer", ["table"])
+ROWS_WRITTEN = counter("tfe_rows_written_total", "Rows committed to the database", ["table"])
+ROWS_FAILED = counter("tfe_rows_failed_total", "Rows dropped after retries", ["table"])
+ROWS_SPOOLED = counter("tfe_rows_spooled_total", "Rows diverted to the disk spool", ["table"])
+WRITER_QUEUE_DEPTH = gauge("tfe_writer_queue_depth", "Rows waiting in the writer queue", ["table"])
+WRITER_QUEUE_CAPACITY = gauge("tfe_writer_queue_capacity", "Writer queue bound", ["table"])
+WRITE_SECONDS = histogram("tfe_write_seconds", "Duration of one chunk write", ["table", "sink"])
+FRESHNESS_SECONDS = histogram(
+    "tfe_freshness_seconds", "Exchange event time to DB commit, oldest row of each chunk", ["table"],
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900, 3600),
+)
+LAST_EVENT_COMMITTED = gauge(
+    "tfe_last_event_committed_timestamp_seconds", "Newest exchange event time committed per table", ["table"])
@@ -1,10 +1,6 @@
-import os
-from supabase import create_client
+from ingesters.db import get_supabase
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb = get_supabase()
 
 views = [
     "binance_orderbook_agg_min",
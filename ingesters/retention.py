@@ -0,0 +1,87 @@
+# ingesters/retention.py
+"""
+Partition-based retention for the short-lived feed tables.
+
+Each table below is range-partitioned on its time column (hourly or daily,
+see sql/partition_retention.sql). maintain() asks the database to create
+the partitions ahead of ingest and drop the ones past retention, so expiry
+is a DROP TABLE per partition instead of row-level DELETEs that bloat the
+table and contend with inserts.
+
+    from ingesters import retention
+    retention.maintain("binance_trades_24h")
+    await retention.run()          # every RETENTION_EVERY seconds, all tables
+
+Retention is per table; override with RETENTION_<TABLE>=<hours>, e.g.
+RETENTION_BINANCE_ORDERBOOK=336. Rows expire at partition granularity, so a
+table keeps up to one extra hour/day.
+
+Tested against a local Postgres (skipped without PG_DSN):
+    PG_DSN=postgresql://localhost/postgres python -m pytest tests/test_retention.py
+"""
+import os
+import asyncio
+from datetime import timedelta
+
+from ingesters.db import get_supabase
+
+# ========= CONFIG =========
+RETENTION_EVERY = int(os.getenv("RETENTION_EVERY", "3600"))   # seconds between passes
+RETENTION_AHEAD = int(os.getenv("RETENTION_AHEAD", "3"))      # partitions created ahead of now
+
+
+def _keep(table: str, default: timedelta) -> timedelta:
+    hours = os.getenv(f"RETENTION_{table.upper()}")
+    return timedelta(hours=float(hours)) if hours else default
+
+
+# table → partition column, partition step ("hour" | "day"), retention
+RETENTION_TABLES = {
+    "binance_orderbook": {"column": "time", "step": "day",
+                          "keep": _keep("binance_orderbook", timedelta(days=7))},
+    # ORDERBOOK_STORAGE=packed
+    "binance_orderbook_snapshots": {"column": "time", "step": "day",
+                                    "keep": _keep("binance_orderbook_snapshots", timedelta(days=7))},
+    "binance_trades_24h": {"column": "ts", "step": "hour",
+                           "keep": _keep("binance_trades_24h",
+                                         timedelta(hours=int(os.getenv("TIME_LIMIT_HOURS", 24 * 7))))},
+    "binance_market_cap": {"column": "ts", "step": "day",
+                           "keep": _keep("binance_market_cap", timedelta(days=7))},
+}
+
+
+def _interval(td: timedelta) -> str:
+    return f"{int(td.total_seconds())} seconds"
+
+
+def maintain(table: str) -> dict | None:
+    """Create upcoming partitions and drop expired ones for one table."""
+    policy = RETENTION_TABLES[table]
+    try:
+        res = get_supabase().rpc("retention_maintain", {
+            "parent": table,
+            "step": policy["step"],
+            "keep": _interval(policy["keep"]),
+            "ahead": RETENTION_AHEAD,
+        }).execute()
+    except Exception as e:
+        print(f"[retention] ⚠️ {table}: maintenance skipped: {e}")
+        return None
+    out = (res.data or [{}])[0]
+    if out.get("created") or out.get("dropped"):
+        print(f"🧹 [retention] {table}: +{out.get('created', 0)} partitions, "
+              f"-{out.get('dropped', 0)} expired (keep {policy['keep']})")
+    return out
+
+
+def maintain_all():
+    for table in RETENTION_TABLES:
+        maintain(table)
+
+
+async def run(interval: float = RETENTION_EVERY):
+    """Retention pass over every table, forever."""
+    while True:
+        await asyncio.to_thread(maintain_all)
+        await asyncio.sleep(interval)
+
@@ -0,0 +1,179 @@
+# ingesters/spool.py
+"""
+Disk-backed write-ahead spool for rows the database didn't take.
+
+When a TableWriter gives up on a chunk it appends it here instead of dropping
+it, and replays the spool in order once writes succeed again, so a short
+Supabase outage costs neither data nor a re-fetch from rate-limited APIs.
+
+Layout: SPOOL_DIR/<table>/<seq>.jsonl, one chunk ({"rows": [...]}) per line,
+new segment every SPOOL_SEGMENT_BYTES. cursor.json records how far replay
+got (segment + byte offset); fully replayed segments are deleted. When the
+spool exceeds SPOOL_MAX_BYTES the oldest segments are dropped (and logged)
+so a long outage can't fill the disk.
+
+Replay is at-least-once: a chunk that committed just before a crash or a
+timed-out request is sent again. Writers that spool should therefore upsert
+or merge on a natural key; TableWriter warns about insert-mode writers.
+"""
+import os
+import json
+import glob
+import tempfile
+import threading
+
+# ========= CONFIG =========
+SPOOL_DIR = os.getenv("SPOOL_DIR", os.path.join(tempfile.gettempdir(), "tfe_spool"))
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(512 * 1024 * 1024)))
+SPOOL_FSYNC = os.getenv("SPOOL_FSYNC", "0") == "1"
+
+
+class Spool:
+    """Append-only segmented JSONL log with a persistent replay cursor."""
+
+    def __init__(self, name: str, root: str = SPOOL_DIR,
+                 segment_bytes: int = SPOOL_SEGMENT_BYTES, max_bytes: int = SPOOL_MAX_BYTES):
+        self.name = name
+        self.dir = os.path.join(root, name)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.cursor_path = os.path.join(self.dir, "cursor.json")
+        self._lock = threading.Lock()
+        self.dropped_rows = 0
+        os.makedirs(self.dir, exist_ok=True)
+        self.cursor = self._read_cursor()   # (segment seq, byte offset) of the next unreplayed line
+        self._repair()
+        self._compact()
+
+    # ---- segments ----
+    def _segments(self) -> list[int]:
+        return sorted(int(os.path.basename(p)[:-6]) for p in glob.glob(os.path.join(self.dir, "*.jsonl")))
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.dir, f"{seq:012d}.jsonl")
+
+    def _read_cursor(self):
+        try:
+            with open(self.cursor_path) as f:
+                c = json.load(f)
+            return c["segment"], c["offset"]
+        except (OSError, ValueError, KeyError):
+            segs = self._segments()
+            return (segs[0] if segs else 0), 0
+
+    def _write_cursor(self):
+        tmp = self.cursor_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": self.cursor[0], "offset": self.cursor[1]}, f)
+        os.replace(tmp, self.cursor_path)
+
+    def _repair(self):
+        """Trim a partial last line left by a crash mid-append."""
+        segs = self._segments()
+        if not segs:
+            return
+        path = self._path(segs[-1])
+        with open(path, "rb+") as f:
+            data = f.read()
+            keep = data.rfind(b"\n") + 1
+            if keep < len(data):
+                f.truncate(keep)
+                print(f"[spool] {self.name}: trimmed {len(data) - keep} bytes of a torn write")
+
+    def _compact(self):
+        """Delete replayed segments, then the oldest unreplayed ones if over the size cap."""
+        segs = self._segments()
+        for seq in segs:
+            if seq < self.cursor[0]:
+                os.remove(self._path(seq))
+        segs = [s for s in segs if s >= self.cursor[0]]
+        total = sum(os.path.getsize(self._path(s)) for s in segs)
+        while len(segs) > 1 and total > self.max_bytes:
+            seq = segs.pop(0)
+            path = self._path(seq)
+            lost = self._count_rows(path, self.cursor[1] if seq == self.cursor[0] else 0)
+            total -= os.path.getsize(path)
+            os.remove(path)
+            self.dropped_rows += lost
+            self.cursor = (segs[0], 0)
+            self._write_cursor()
+            print(f"[spool] ⚠️ {self.name}: over {self.max_bytes:,} bytes, dropped segment {seq} ({lost:,} rows)")
+
+    @staticmethod
+    def _count_rows(path: str, offset: int) -> int:
+        n = 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    n += len(json.loads(line)["rows"])
+                except (ValueError, KeyError):
+                    pass
+        return n
+
+    # ---- public ----
+    def append(self, rows: list):
+        """Persist a chunk of rows for later replay."""
+        line = (json.dumps({"rows": rows}, default=str) + "\n").encode()
+        with self._lock:
+            segs = self._segments()
+            seq = segs[-1] if segs else self.cursor[0]
+            path = self._path(seq)
+            if os.path.exists(path) and os.path.getsize(path) + len(line) > self.segment_bytes:
+                seq += 1
+                path = self._path(seq)
+                self._compact()
+            with open(path, "ab") as f:
+                f.write(line)
+                if SPOOL_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def pending(self) -> bool:
+        with self._lock:
+            for seq in self._segments():
+                if seq > self.cursor[0]:
+                    return True
+                if seq == self.cursor[0] and os.path.getsize(self._path(seq)) > self.cursor[1]:
+                    return True
+            return False
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(os.path.getsize(self._path(s)) for s in self._segments())
+
+    def replay(self, write) -> int:
+        """Feed spooled chunks to write(rows) in order until one fails.
+
+        The cursor only advances past a chunk once write() returns, so a
+        crash mid-replay re-sends at most one chunk (harmless for upserts and
+        merges, a duplicate for plain inserts).
+        Returns the number of rows replayed; re-raises the write error.
+        """
+        replayed = 0
+        with self._lock:
+            segs = [s for s in self._segments() if s >= self.cursor[0]]
+            for i, seq in enumerate(segs):
+                offset = self.cursor[1] if seq == self.cursor[0] else 0
+                with open(self._path(seq), "rb") as f:
+                    f.seek(offset)
+                    for line in iter(f.readline, b""):
+                        try:
+                            rows = json.loads(line)["rows"]
+                        except (ValueError, KeyError):
+                            rows = []
+                            print(f"[spool] ⚠️ {self.name}: skipping corrupt line in segment {seq}")
+                        if rows:
+                            write(rows)
+                            replayed += len(rows)
+                        self.cursor = (seq, f.tell())
+                        self._write_cursor()
+                if i + 1 < len(segs):
+                    self.cursor = (segs[i + 1], 0)
+                else:
+                    # everything replayed: retire the last segment too
+                    self.cursor = (seq + 1, 0)
+                self._write_cursor()
+            self._compact()
+        return replayed
@@ -0,0 +1,205 @@
+# ingesters/symbols.py
+"""
+Cached Binance symbol universe.
+
+exchangeInfo is multi-MB and every job used to download and parse it on its
+own. SPOT and PERP below keep a compact per-symbol summary in memory and on
+disk (shared by every process on the dyno) and only refetch once the TTL has
+expired. Long-running jobs can subscribe() to hear about listings/delistings.
+"""
+import os
+import json
+import time
+import asyncio
+import inspect
+import tempfile
+import weakref
+
+from ingesters.binance_http import BINANCE_API, BINANCE_FAPI, get_json
+
+# ========= CONFIG =========
+SYMBOL_CACHE_DIR = os.getenv("SYMBOL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tfe_symbols"))
+SYMBOL_CACHE_TTL = int(os.getenv("SYMBOL_CACHE_TTL", "3600"))  # seconds
+SYMBOL_RETRY_AFTER = int(os.getenv("SYMBOL_RETRY_AFTER", "60"))  # seconds between refreshes while exchangeInfo fails
+
+EXCHANGE_INFO_URLS = {
+    "spot": f"{BINANCE_API}/api/v3/exchangeInfo",
+    "perp": f"{BINANCE_FAPI}/fapi/v1/exchangeInfo",
+}
+
+
+def _filter_value(s: dict, filter_type: str, key: str):
+    for f in s.get("filters", []):
+        if f.get("filterType") == filter_type and f.get(key) is not None:
+            return float(f[key])
+    return None
+
+
+def compact(s: dict) -> dict:
+    """The handful of exchangeInfo fields our jobs actually use."""
+    return {
+        "symbol": s["symbol"],
+        "status": s.get("status"),
+        "base": s.get("baseAsset"),
+        "quote": s.get("quoteAsset"),
+        "contract_type": s.get("contractType"),
+        "tick_size": _filter_value(s, "PRICE_FILTER", "tickSize"),
+        "step_size": _filter_value(s, "LOT_SIZE", "stepSize"),
+    }
+
+
+class SymbolRegistry:
+    """exchangeInfo for one market ("spot" or "perp") with a disk-backed TTL cache."""
+
+    def __init__(self, market: str, ttl: int = SYMBOL_CACHE_TTL):
+        self.market = market
+        self.url = EXCHANGE_INFO_URLS[market]
+        self.ttl = ttl
+        self.path = os.path.join(SYMBOL_CACHE_DIR, f"exchange_info_{market}.json")
+        self.by_symbol = {}
+        self.fetched_at = 0.0
+        self._listeners = []
+        self._locks = weakref.WeakKeyDictionary()   # event loop → asyncio.Lock
+
+    # ---- cache ----
+    def _fresh(self, fetched_at: float) -> bool:
+        return time.time() - fetched_at < self.ttl
+
+    def _read_disk(self):
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+            return cached["fetched_at"], cached["symbols"]
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def _write_disk(self):
+        os.makedirs(SYMBOL_CACHE_DIR, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"fetched_at": self.fetched_at, "symbols": list(self.by_symbol.values())}, f)
+        os.replace(tmp, self.path)
+
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+
+    async def load(self, force: bool = False) -> dict:
+        """Return {symbol: info}, refreshing from disk or Binance when stale.
+
+        Concurrent callers share one refresh: the first takes the lock and the
+        rest find the fresh universe once it is released.
+        """
+        if not force and self.by_symbol and self._fresh(self.fetched_at):
+            return self.by_symbol
+        requested = time.time()
+        async with self._lock():
+            if self.by_symbol and self._fresh(self.fetched_at) and (not force or self.fetched_at >= requested):
+                return self.by_symbol
+            return await self._refresh(force)
+
+    async def _refresh(self, force: bool) -> dict:
+        if not force:
+            fetched_at, rows = self._read_disk()
+            if rows and self._fresh(fetched_at):
+                await self._adopt({r["symbol"]: r for r in rows}, fetched_at)
+                return self.by_symbol
+
+        try:
+            info = await get_json(self.url)
+        except Exception as e:
+            # Binance unreachable: a stale universe beats no universe
+            if not self.by_symbol:
+                fetched_at, rows = self._read_disk()
+                if not rows:
+                    raise
+                self.by_symbol = {r["symbol"]: r for r in rows}
+            # back off: the cached universe counts as fresh for SYMBOL_RETRY_AFTER more seconds,
+            # so every job's load() does not hit the failing endpoint again
+            self.fetched_at = time.time() - self.ttl + min(SYMBOL_RETRY_AFTER, self.ttl)
+            print(f"[symbols] ⚠️ {self.market} refresh failed, using cached universe "
+                  f"(retry in {min(SYMBOL_RETRY_AFTER, self.ttl)}s): {e}")
+            return self.by_symbol
+
+        fetched = {s["symbol"]: compact(s) for s in info.get("symbols", [])}
+        await self._adopt(fetched, time.time())
+        try:
+            self._write_disk()
+        except OSError as e:
+            print(f"[symbols] ⚠️ could not write cache {self.path}: {e}")
+        print(f"[symbols] {self.market}: refreshed {len(fetched)} symbols from exchangeInfo")
+        return self.by_symbol
+
+    async def _adopt(self, new: dict, fetched_at: float):
+        old_trading = {s for s, r in self.by_symbol.items() if r["status"] == "TRADING"}
+        new_trading = {s for s, r in new.items() if r["status"] == "TRADING"}
+        first_load = not self.by_symbol
+        self.by_symbol = new
+        self.fetched_at = fetched_at
+        if first_load:
+            return
+        added, removed = new_trading - old_trading, old_trading - new_trading
+        if added or removed:
+            print(f"[symbols] {self.market}: +{len(added)} listed, -{len(removed)} delisted")
+            await self._notify(added, removed)
+
+    # ---- queries ----
+    def select(self, quote: str | None = "USDT", status: str | None = "TRADING",
+               contract_type: str | None = None, limit: int = 0) -> list[str]:
+        """Sorted symbols matching the filters (None disables a filter)."""
+        if contract_type is None and self.market == "perp":
+            contract_type = "PERPETUAL"
+        out = sorted(
+            s for s, r in self.by_symbol.items()
+            if (quote is None or r["quote"] == quote)
+            and (status is None or r["status"] == status)
+            and (contract_type is None or r["contract_type"] == contract_type)
+        )
+        return out[:limit] if limit and limit > 0 else out
+
+    async def symbols(self, **filters) -> list[str]:
+        """load() + select(); the usual entry point for jobs."""
+        await self.load()
+        return self.select(**filters)
+
+    def info(self, symbol: str) -> dict | None:
+        return self.by_symbol.get(symbol.upper())
+
+    # ---- change notifications ----
+    def subscribe(self, callback):
+        """callback(added: set, removed: set); may be sync or async. Subscribing twice is a no-op."""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    async def _notify(self, added: set, removed: set):
+        for cb in list(self._listeners):
+            try:
+                res = cb(added, removed)
+                if inspect.isawaitable(res):
+                    await res
+            except Exception as e:
+                print(f"[symbols] listener {getattr(cb, '__name__', cb)} failed: {e}")
+
+    async def watch(self, interval: float | None = None):
+        """Refresh forever so subscribers see listings/delistings promptly.
+
+        Uses load(), so a refresh another process already wrote to the disk
+        cache is picked up without downloading exchangeInfo again.
+        """
+        while True:
+            await asyncio.sleep(interval or self.ttl)
+            try:
+                await self.load()
+            except Exception as e:
+                print(f"[symbols] {self.market} watch error: {e}")
+
+
+SPOT = SymbolRegistry("spot")
+PERP = SymbolRegistry("perp")
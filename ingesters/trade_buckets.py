@@ -0,0 +1,452 @@
+# ingesters/trade_buckets.py
+"""
+Single-pass multi-resolution trade bucketing.
+
+Every trade is touched once: add() folds it into a pending 1m accumulator
+(one dict lookup, a few float adds). drain() then rolls each pending minute
+into the 1m, 5m, 15m, 1h, 4h and 1d buckets and returns what was added to
+each bucket since the last drain, so the per-trade cost does not grow with
+the number of resolutions.
+
+    tb = TradeBuckets()
+    tb.add_trades(symbol, trades)   # /api/v3/trades payload
+    changed = tb.drain()            # {"1m": [(symbol, start_ms, acc), ...], ...}
+    writer.put_many(bucket_rows(changed))   # writer mode="merge"
+
+Drained rows are increments, not totals: each covers a trade-id range
+(first_trade_id..last_trade_id) and the merge_<table>() functions in
+sql/trade_bucket_merge.sql add it onto the stored row only when it starts
+after the row's last_trade_id. A bucket spanning several polls or a restart
+therefore sums exactly, and replaying a batch is a no-op. Trade ids at or
+below the newest one added per symbol (last_ids) are skipped on the way in.
+
+Large batches (backfills, archive files) go through add_arrays() instead:
+time/price/qty/side/id columns as NumPy arrays, bucket ids by integer math
+and per-bucket sums by np.bincount, so no Python object is built per trade.
+
+AggTrades (stream, archive files) pass their first trade id as well, so a
+bucket's trade counts and first_trade_id cover the whole f..l range and
+match what the /trades pollers write for the same fills.
+
+Every drained bucket also carries its running CVD: cumulative buy-minus-sell
+quote volume up to the end of that bucket, per symbol and resolution. Only
+a three-number state per (resolution, symbol) is kept for it; state() /
+restore() checkpoint it with last_ids across restarts and seed_from_db()
+rebuilds both from binance_trade_buckets. A trade landing in a bucket older
+than the newest one shifts the CVD of every later bucket: drain() then also
+returns CVD-only corrections (no trade-id range, see _correction()) for the
+later buckets it still holds deltas for. Buckets older than keep_ms keep the
+CVD they were written with.
+
+Buckets are aligned to UTC epoch multiples (4h = 00/04/08... like Binance
+klines). Long-running callers pass keep_ms to drain() so per-bucket deltas
+are forgotten once late trades can no longer reach them.
+"""
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from ingesters import checkpoint
+
+RESOLUTIONS = {
+    "1m": 60_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "1h": 3_600_000,
+    "4h": 14_400_000,
+    "1d": 86_400_000,
+}
+BUCKETS_TABLE = "binance_trade_buckets"
+BUCKETS_CONFLICT = "symbol,resolution,bucket_start"
+
+# accumulator slots; CVD is only present on the copies drain() returns.
+# FIRST_ID/LAST_ID bound the trade ids folded in, so the database can tell a
+# new increment from a replay of one it already merged.
+BUY_Q, SELL_Q, BUY_N, SELL_N, BASE, FIRST_ID, LAST_ID, CVD = range(8)
+_SUMS = 5
+_WIDTH = 7
+
+
+def _correction(version: int, cvd: float) -> list:
+    """A CVD-only entry: no volume and no trade-id range, so the merge functions
+    only overwrite cvd. LAST_ID carries the symbol's newest trade id as a
+    version, so an older correction never overwrites a newer increment."""
+    return [0.0, 0.0, 0.0, 0.0, 0.0, None, version, cvd]
+
+
+def _merge(cur: list, acc: list):
+    for i in range(_SUMS):
+        cur[i] += acc[i]
+    if acc[FIRST_ID] < cur[FIRST_ID]:
+        cur[FIRST_ID] = acc[FIRST_ID]
+    if acc[LAST_ID] > cur[LAST_ID]:
+        cur[LAST_ID] = acc[LAST_ID]
+
+
+class TradeBuckets:
+    """Buy/sell quote volume, trade counts and VWAP terms per bucket, as increments."""
+
+    def __init__(self, resolutions: dict = RESOLUTIONS):
+        self.resolutions = dict(resolutions)
+        self.last_ids = {}                                  # symbol → newest trade id added
+        self._pending = {}                                  # (symbol, minute_ms) → acc
+        self._inc = {r: {} for r in self.resolutions}       # res → {(symbol, start_ms): acc} since last drain
+        self._delta = {r: {} for r in self.resolutions}     # res → {(symbol, start_ms): total delta}
+        # res → {symbol: [open_start, closed, open_delta]}: the newest bucket seen,
+        # cumulative delta of everything before it, and its own delta so far
+        self._cvd = {r: {} for r in self.resolutions}
+        self._late = {r: {} for r in self.resolutions}      # res → {symbol: oldest bucket hit behind the open one}
+
+    # ---- hot path ----
+    def add(self, symbol: str, ts_ms: int, price: float, qty: float, is_sell: bool,
+            trade_id: int, first_id: int | None = None) -> bool:
+        """Add one trade (or aggTrade first_id..trade_id); False if that id was already added.
+
+        An aggTrade counts as trade_id - first_id + 1 trades, like the /trades rows it bundles.
+        """
+        if trade_id <= self.last_ids.get(symbol, -1):
+            return False
+        self.last_ids[symbol] = trade_id
+        if first_id is None:
+            first_id = trade_id
+        key = (symbol, ts_ms - ts_ms % 60_000)
+        acc = self._pending.get(key)
+        if acc is None:
+            acc = self._pending[key] = [0.0, 0.0, 0.0, 0.0, 0.0, first_id, trade_id]
+        else:
+            acc[LAST_ID] = trade_id
+        if is_sell:
+            acc[SELL_Q] += price * qty
+            acc[SELL_N] += trade_id - first_id + 1
+        else:
+            acc[BUY_Q] += price * qty
+            acc[BUY_N] += trade_id - first_id + 1
+        acc[BASE] += qty
+        return True
+
+    def add_trades(self, symbol: str, trades: list) -> int:
+        """/api/v3/trades payload (or anything with id/time/price/qty/isBuyerMaker); returns trades added."""
+        add = self.add
+        return sum(add(symbol, t["time"], float(t["price"]), float(t["qty"]), t["isBuyerMaker"], t["id"])
+                   for t in trades)
+
+    def add_arrays(self, symbols, ts_ms, price, qty, is_sell, trade_ids, first_ids=None) -> int:
+        """Columnar add; symbols is one name or an array aligned with the other columns.
+
+        first_ids (aggTrades) makes each row count as trade_ids - first_ids + 1 trades.
+        """
+        ts_ms = np.asarray(ts_ms, dtype=np.int64)
+        if not len(ts_ms):
+            return 0
+        trade_ids = np.asarray(trade_ids, dtype=np.int64)
+        first_ids = trade_ids if first_ids is None else np.asarray(first_ids, dtype=np.int64)
+        if isinstance(symbols, str):
+            names, sym_idx = [symbols], np.zeros(len(ts_ms), dtype=np.int64)
+        else:
+            names, sym_idx = np.unique(np.asarray(symbols), return_inverse=True)
+
+        # drop ids already added, then advance the per-symbol high-water mark
+        seen = np.array([self.last_ids.get(str(n), -1) for n in names], dtype=np.int64)
+        keep = trade_ids > seen[sym_idx]
+        if not keep.all():
+            ts_ms, trade_ids, first_ids, sym_idx = ts_ms[keep], trade_ids[keep], first_ids[keep], sym_idx[keep]
+            price, qty, is_sell = (np.asarray(c)[keep] for c in (price, qty, is_sell))
+            if not len(ts_ms):
+                return 0
+        newest = seen.copy()
+        np.maximum.at(newest, sym_idx, trade_ids)
+        for n, before, after in zip(names, seen.tolist(), newest.tolist()):
+            if after > before:
+                self.last_ids[str(n)] = after
+
+        price = np.asarray(price, dtype=np.float64)
+        qty = np.asarray(qty, dtype=np.float64)
+        is_sell = np.asarray(is_sell, dtype=bool)
+        quote = price * qty
+        counts = (trade_ids - first_ids + 1).astype(np.float64)
+        weights = (np.where(is_sell, 0.0, quote), np.where(is_sell, quote, 0.0), counts,
+                   np.where(is_sell, counts, 0.0), qty)
+
+        # reduce straight into every resolution; no per-minute Python objects
+        for res, ms in self.resolutions.items():
+            starts, start_idx = np.unique(ts_ms - ts_ms % ms, return_inverse=True)
+            groups, inv = np.unique(sym_idx * len(starts) + start_idx, return_inverse=True)
+            n = len(groups)
+            sums = np.empty((n, _WIDTH))
+            for i, w in enumerate(weights):
+                sums[:, i] = np.bincount(inv, weights=w, minlength=n)
+            sums[:, BUY_N] -= sums[:, SELL_N]
+            first = np.full(n, np.iinfo(np.int64).max)
+            last = np.full(n, -1)
+            np.minimum.at(first, inv, first_ids)
+            np.maximum.at(last, inv, trade_ids)
+
+            m, starts = len(starts), starts.tolist()
+            inc, deltas = self._inc[res], self._delta[res]
+            for g, acc, f, l in zip(groups.tolist(), sums.tolist(), first.tolist(), last.tolist()):
+                acc[FIRST_ID], acc[LAST_ID] = f, l
+                key = (str(names[g // m]), starts[g % m])
+                cur = inc.get(key)
+                if cur is None:
+                    inc[key] = acc
+                else:
+                    _merge(cur, acc)
+                d = acc[BUY_Q] - acc[SELL_Q]
+                deltas[key] = deltas.get(key, 0.0) + d
+                self._track(res, key, d)
+        return len(ts_ms)
+
+    # ---- roll-up ----
+    def _fold(self):
+        for (symbol, minute), acc in self._pending.items():
+            d = acc[BUY_Q] - acc[SELL_Q]
+            for res, ms in self.resolutions.items():
+                key = (symbol, minute - minute % ms)
+                inc = self._inc[res]
+                cur = inc.get(key)
+                if cur is None:
+                    inc[key] = list(acc)
+                else:
+                    _merge(cur, acc)
+                deltas = self._delta[res]
+                deltas[key] = deltas.get(key, 0.0) + d
+                self._track(res, key, d)
+        self._pending.clear()
+
+    def _track(self, res: str, key: tuple, d: float):
+        """Fold a delta increment for bucket key into the running CVD state.
+
+        A late trade in an older bucket moves the running total forward and
+        marks the buckets after it for a CVD correction in the next drain().
+        """
+        symbol, start = key
+        st = self._cvd[res].get(symbol)
+        if st is None:
+            self._cvd[res][symbol] = [start, 0.0, d]
+        elif start == st[0]:
+            st[2] += d
+        elif start > st[0]:
+            st[1] += st[2]
+            st[0], st[2] = start, d
+        else:
+            st[1] += d
+            late = self._late[res]
+            if start < late.get(symbol, start + 1):
+                late[symbol] = start
+
+    def _cvd_for(self, res: str, keys) -> dict:
+        """{key: cumulative delta at the end of that bucket} for the given keys.
+
+        One backward walk per symbol from its open bucket: CVD at the end of a
+        bucket is the open bucket's CVD minus the deltas of every bucket after it.
+        """
+        by_symbol = {}
+        for symbol, start in keys:
+            by_symbol.setdefault(symbol, []).append(start)
+        deltas, ms = self._delta[res], self.resolutions[res]
+        out = {}
+        for symbol, starts in by_symbol.items():
+            open_start, closed, open_delta = self._cvd[res][symbol]
+            wanted = set(starts)
+            cur = closed + open_delta
+            for s in range(open_start, min(starts) - 1, -ms):
+                if s in wanted:
+                    out[(symbol, s)] = cur
+                cur -= open_delta if s == open_start else deltas.get((symbol, s), 0.0)
+        return out
+
+    def state(self) -> dict:
+        """Running CVD and last trade id per symbol, for checkpointing."""
+        self._fold()
+        return {
+            "cvd": {res: {s: list(st) for s, st in states.items()} for res, states in self._cvd.items()},
+            "last_ids": dict(self.last_ids),
+        }
+
+    def restore(self, state: dict):
+        """Resume from state() output (symbols already live are kept)."""
+        for res, states in (state.get("cvd") or {}).items():
+            if res in self._cvd:
+                for symbol, st in states.items():
+                    self._cvd[res].setdefault(symbol, [int(st[0]), float(st[1]), float(st[2])])
+        for symbol, last in (state.get("last_ids") or {}).items():
+            self.last_ids.setdefault(symbol, int(last))
+
+    def drain(self, now_ms: int | None = None, keep_ms: int | None = None) -> dict:
+        """{res: [(symbol, start_ms, increment + cvd), ...]} for trades added since the last drain.
+
+        Each increment covers trade ids FIRST_ID..LAST_ID of its bucket and is
+        meant to be added onto the stored row (writer mode="merge"), so a
+        bucket spanning several drains, polls or restarts still sums exactly.
+        Entries with FIRST_ID None are CVD-only corrections (see _correction()).
+        """
+        self._fold()
+        out = {}
+        for res, ms in self.resolutions.items():
+            inc, deltas = self._inc[res], self._delta[res]
+            # buckets after a late trade that were written before it and get no increment now
+            stale = [(symbol, s) for symbol, late in self._late[res].items()
+                     for s in range(late + ms, self._cvd[res][symbol][0] + 1, ms)
+                     if (symbol, s) not in inc and ((symbol, s) in deltas or s == self._cvd[res][symbol][0])]
+            self._late[res].clear()
+            cvd = self._cvd_for(res, [*inc, *stale])
+            out[res] = [(key[0], key[1], acc + [cvd[key]]) for key, acc in inc.items()]
+            out[res] += [(symbol, s, _correction(self.last_ids[symbol], cvd[(symbol, s)])) for symbol, s in stale]
+            inc.clear()
+            if keep_ms is not None and now_ms is not None:
+                cutoff = now_ms - keep_ms - ms
+                deltas = self._delta[res]
+                for key in [k for k in deltas if k[1] < cutoff]:
+                    del deltas[key]
+        return out
+
+
+# ========= ROW BUILDERS =========
+def _iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def _id(v) -> int | None:
+    return None if v is None else int(v)
+
+
+def bucket_rows(changed: dict) -> list[dict]:
+    """binance_trade_buckets rows for every resolution in a drain() result."""
+    rows = []
+    for res, items in changed.items():
+        for symbol, start, acc in items:
+            quote = acc[BUY_Q] + acc[SELL_Q]
+            rows.append({
+                "symbol": symbol,
+                "resolution": res,
+                "bucket_start": _iso(start),
+                "buy_vol": acc[BUY_Q],
+                "sell_vol": acc[SELL_Q],
+                "delta": acc[BUY_Q] - acc[SELL_Q],
+                "buy_trades": int(acc[BUY_N]),
+                "sell_trades": int(acc[SELL_N]),
+                "quote_vol": quote,
+                "base_vol": acc[BASE],
+                "vwap": quote / acc[BASE] if acc[BASE] else None,
+                "cvd": acc[CVD],
+                "first_trade_id": _id(acc[FIRST_ID]),
+                "last_trade_id": int(acc[LAST_ID]),
+            })
+    return rows
+
+
+def _legacy_row(symbol: str, acc: list, **buckets) -> dict:
+    row = {"symbol": symbol}
+    row.update({k: _iso(v) for k, v in buckets.items()})
+    row.update({
+        "buy_vol": acc[BUY_Q],
+        "sell_vol": acc[SELL_Q],
+        "delta": acc[BUY_Q] - acc[SELL_Q],
+        "bullish_trades": int(acc[BUY_N]),
+        "bearish_trades": int(acc[SELL_N]),
+        "cvd": acc[CVD],
+        "first_trade_id": _id(acc[FIRST_ID]),
+        "last_trade_id": int(acc[LAST_ID]),
+    })
+    return row
+
+
+def agg_rows(changed: dict) -> list[dict]:
+    """binance_trades_agg rows (15m buckets labelled with their 1h/1d parents)."""
+    return [
+        _legacy_row(s, acc, bucket_15m=start, bucket_1h=start - start % 3_600_000,
+                    bucket_1d=start - start % 86_400_000)
+        for s, start, acc in changed.get("15m", [])
+    ]
+
+
+def agg_5m_rows(changed: dict) -> list[dict]:
+    """binance_trades_agg_5m rows."""
+    return [_legacy_row(s, acc, bucket_5m=start) for s, start, acc in changed.get("5m", [])]
+
+
+# ========= SEEDING =========
+def seed_from_db(resolutions: dict = RESOLUTIONS, table: str = BUCKETS_TABLE) -> dict:
+    """state()-shaped dict from the newest stored bucket per symbol and resolution.
+
+    Only the last two buckets of each resolution are read. A symbol with no
+    recent row at some resolution starts that resolution from the newest CVD
+    it has at any other, so the series stays continuous across the outage.
+    last_ids is the highest last_trade_id merged for each symbol.
+    """
+    from ingesters.db import get_supabase
+    sb = get_supabase()
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    state, latest, last_ids = {}, {}, {}   # latest: symbol → (bucket end ms, cvd)
+    for res, ms in resolutions.items():
+        since = _iso(now_ms - now_ms % ms - ms)
+        rows, offset = [], 0
+        while True:
+            page = (sb.table(table).select("symbol,bucket_start,delta,cvd,last_trade_id")
+                    .eq("resolution", res).gte("bucket_start", since)
+                    .order("bucket_start").range(offset, offset + 999).execute()).data or []
+            rows += page
+            if len(page) < 1000:
+                break
+            offset += 1000
+        res_state = state[res] = {}
+        for r in rows:
+            if r.get("last_trade_id") is not None:
+                last_ids[r["symbol"]] = max(last_ids.get(r["symbol"], -1), int(r["last_trade_id"]))
+            if r.get("cvd") is None:
+                continue
+            start = int(datetime.fromisoformat(r["bucket_start"].replace("Z", "+00:00")).timestamp() * 1000)
+            res_state[r["symbol"]] = [start, float(r["cvd"]) - float(r["delta"]), float(r["delta"])]
+            if start + ms > latest.get(r["symbol"], (0, 0.0))[0]:
+                latest[r["symbol"]] = (start + ms, float(r["cvd"]))
+    for res_state in state.values():
+        for symbol, (_, cvd) in latest.items():
+            res_state.setdefault(symbol, [0, cvd, 0.0])
+    print(f"[trade_buckets] seeded running CVD for {len(latest)} symbols from {table}")
+    return {"cvd": state, "last_ids": last_ids}
+
+
+def _newest(ck: dict, db: dict) -> dict:
+    """Per symbol, whichever of checkpoint and database has merged the later trade id."""
+    ck_ids, db_ids = ck.get("last_ids") or {}, db.get("last_ids") or {}
+    pick = {s: db if db_ids.get(s, -1) > ck_ids.get(s, -1) else ck for s in set(ck_ids) | set(db_ids)}
+    out = {"cvd": {}, "last_ids": {s: src["last_ids"][s] for s, src in pick.items()}}
+    for res in set(ck.get("cvd") or {}) | set(db.get("cvd") or {}):
+        ck_res, db_res = (ck.get("cvd") or {}).get(res, {}), (db.get("cvd") or {}).get(res, {})
+        res_out = out["cvd"][res] = {}
+        for s in set(ck_res) | set(db_res):
+            first, second = (db_res, ck_res) if pick.get(s) is db else (ck_res, db_res)
+            res_out[s] = first.get(s, second.get(s))
+    return out
+
+
+def load_checkpoint(tb: TradeBuckets, name: str, extra_max_age: float | None = 600) -> dict:
+    """Resume tb's running CVD and trade-id filter; returns the checkpoint's extra ids.
+
+    Rows can be flushed after the last checkpoint, so each symbol resumes from
+    whichever of checkpoint and database is further ahead; resuming behind the
+    database would only make the merge functions reject the replayed trades.
+    The extra map (e.g. stream aggregate ids) is only returned when the
+    checkpoint is younger than extra_max_age seconds (None = any age), so a
+    long outage does not turn into a huge gap refill at startup.
+    """
+    ck = checkpoint.load(name) or {}
+    try:
+        db = seed_from_db(tb.resolutions)
+    except Exception as e:
+        print(f"[trade_buckets] ⚠️ {name}: seed from DB failed, using checkpoint only: {e}")
+        db = {}
+    tb.restore(_newest(ck, db))
+    if not ck:
+        return {}
+    age = time.time() - ck.get("saved_at", 0)
+    print(f"[trade_buckets] {name}: resumed running CVD from checkpoint ({age:.0f}s old)")
+    if extra_max_age is not None and age > extra_max_age:
+        return {}
+    return ck.get("extra", {})
+
+
+def save_checkpoint(tb: TradeBuckets, name: str, extra: dict | None = None):
+    """Checkpoint running CVD and trade ids, plus caller ids (e.g. last aggregate id per symbol)."""
+    checkpoint.save(name, {"saved_at": time.time(), **tb.state(), "extra": dict(extra or {})})
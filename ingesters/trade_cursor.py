@@ -0,0 +1,317 @@
+# ingesters/trade_cursor.py
+"""
+Per-symbol trade-id cursors for incremental spot trade ingestion.
+
+Instead of re-fetching the latest 1000 trades of every symbol each cycle, a
+job keeps the last trade id it queued per symbol and only asks Binance for
+what came after it:
+
+    cursors = TradeCursors("binance_trades")
+    active = await cursors.active(symbols)          # {symbol: exchange lastId}
+    trades = await cursors.fetch_new(symbol, active[symbol])
+    ...queue rows...
+    cursors.advance(symbol, trades[-1]["id"])
+    ...writer.flush_committed(mark)...
+    cursors.save()
+
+One bulk /ticker/24hr call (type=MINI) tells us each symbol's latest trade id,
+so symbols with nothing new cost neither a request nor a DB write. The rest
+page forward with /historicalTrades?fromId= until caught up (needs
+BINANCE_API_KEY); without a key they fall back to /trades and keep only ids
+past the cursor, logging any gap that was too large to cover.
+
+Pollers re-fetch overlapping windows (latest-1000 mode, restarts, stream
+gap fills), so each TradeCursors also keeps a SeenIds filter: a per-symbol
+high-water mark plus a bitmap of the SEEN_WINDOW ids below it, seeded from
+the cursor. unseen() drops trades already queued before any row is built
+and counts them in tfe_trades_suppressed_total.
+
+Cursors live in a small JSON file (CURSOR_DIR) and are only saved once the
+writer has committed their rows (flush_committed), so a crash or a spooled
+or dropped chunk re-reads trades rather than skipping them.
+When the file is missing (fresh dyno) cursors can be seeded from the table's
+max(trade_id) per symbol.
+
+TradePoller wraps the whole cycle for one table (binance_trades,
+binance_trades_24h):
+
+    poller = TradePoller("binance_trades", writer)
+    await poller.run(symbols)
+"""
+import os
+import json
+import time
+import asyncio
+import tempfile
+from datetime import datetime
+
+from ingesters.binance_http import BINANCE_API, get_json
+from ingesters.metrics import counter
+
+# ========= CONFIG =========
+CURSOR_DIR = os.getenv("CURSOR_DIR", os.path.join(tempfile.gettempdir(), "tfe_cursors"))
+CURSOR_MAX_PAGES = int(os.getenv("CURSOR_MAX_PAGES", "10"))      # per symbol per cycle
+CURSOR_SEED_FROM_DB = os.getenv("CURSOR_SEED_FROM_DB", "1") == "1"
+BINANCE_API_KEY = os.getenv("BINANCE_API_KEY", "")
+# 1 = page forward from the last stored trade id, 0 = latest 1000 every cycle
+TRADES_CURSOR_MODE = os.getenv("TRADES_CURSOR_MODE", "1") == "1"
+SEEN_WINDOW = int(os.getenv("SEEN_WINDOW", "4096"))              # out-of-order ids tracked below the high-water mark
+
+PAGE_LIMIT = 1000
+TICKER_TTL = 30  # seconds; trades and trades_24h run back to back and share one ticker call
+
+TRADES_SKIPPED = counter("tfe_trades_symbols_skipped_total", "Symbols skipped because no new trades", ["table"])
+TRADES_GAP = counter("tfe_trades_gap_total", "Trades missed between cursor and the oldest fetchable id", ["table"])
+TRADES_SUPPRESSED = counter("tfe_trades_suppressed_total", "Trades dropped before writing because their id was already queued", ["table"])
+
+_ticker = {"at": 0.0, "last_ids": {}}
+_ticker_lock = asyncio.Lock()
+
+
+async def last_trade_ids() -> dict:
+    """{symbol: lastId} for every spot symbol from one /ticker/24hr call (weight 80)."""
+    async with _ticker_lock:
+        if time.time() - _ticker["at"] > TICKER_TTL:
+            data = await get_json(f"{BINANCE_API}/api/v3/ticker/24hr", params={"type": "MINI"})
+            _ticker["last_ids"] = {t["symbol"]: int(t["lastId"]) for t in data if int(t.get("lastId", -1)) >= 0}
+            _ticker["at"] = time.time()
+        return _ticker["last_ids"]
+
+
+class SeenIds:
+    """Trade ids already queued per symbol: high-water mark + bitmap of the ids just below it.
+
+    Bit k of a symbol's bitmap is set once id hwm - k has been seen. Ids more
+    than `window` below the mark count as seen (long since written).
+    """
+
+    def __init__(self, window: int = SEEN_WINDOW):
+        self.window = window
+        self._mask = (1 << window) - 1
+        self._hwm = {}
+        self._bits = {}
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._hwm
+
+    def seed(self, symbol: str, trade_id: int):
+        """Treat every id up to trade_id as seen (e.g. from a saved cursor)."""
+        if symbol not in self._hwm:
+            self._hwm[symbol], self._bits[symbol] = int(trade_id), self._mask
+
+    def add(self, symbol: str, trade_id: int) -> bool:
+        """Mark trade_id seen; False if it already was."""
+        hwm = self._hwm.get(symbol)
+        if hwm is None:
+            self._hwm[symbol], self._bits[symbol] = trade_id, 1
+            return True
+        if trade_id > hwm:
+            shift = trade_id - hwm
+            self._bits[symbol] = 1 if shift >= self.window else ((self._bits[symbol] << shift) | 1) & self._mask
+            self._hwm[symbol] = trade_id
+            return True
+        k = hwm - trade_id
+        if k >= self.window or self._bits[symbol] >> k & 1:
+            return False
+        self._bits[symbol] |= 1 << k
+        return True
+
+
+class TradeCursors:
+    """Last queued trade id per symbol for one table, persisted between runs."""
+
+    def __init__(self, table: str, root: str = CURSOR_DIR, id_column: str = "trade_id"):
+        self.table = table
+        self.id_column = id_column
+        self.path = os.path.join(root, f"{table}.json")
+        self.cursors = self._load()
+        self._seeded = set()
+        self.seen = SeenIds()
+        self.suppressed = 0   # trades dropped by unseen()/is_new() since start
+
+    # ---- persistence ----
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return {s: int(v) for s, v in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def save(self):
+        """Persist cursors; call only after the writer has flushed their rows."""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.cursors, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[cursor] ⚠️ could not write {self.path}: {e}")
+
+    def rewind(self):
+        """Back to the last saved cursors, forgetting ids queued since (their rows did not land)."""
+        self.cursors = self._load()
+        self._seeded = set()
+        self.seen = SeenIds(self.seen.window)
+
+    def get(self, symbol: str):
+        return self.cursors.get(symbol)
+
+    def advance(self, symbol: str, trade_id: int):
+        if trade_id > self.cursors.get(symbol, -1):
+            self.cursors[symbol] = int(trade_id)
+
+    def _seen_for(self, symbol: str) -> SeenIds:
+        # ids up to the saved cursor were written by an earlier run
+        if symbol not in self.seen and symbol in self.cursors:
+            self.seen.seed(symbol, self.cursors[symbol])
+        return self.seen
+
+    def _suppress(self, n: int):
+        self.suppressed += n
+        TRADES_SUPPRESSED.labels(self.table).inc(n)
+
+    def is_new(self, symbol: str, trade_id: int) -> bool:
+        """True the first time trade_id is offered for symbol; counts the repeats."""
+        if self._seen_for(symbol).add(symbol, trade_id):
+            return True
+        self._suppress(1)
+        return False
+
+    def unseen(self, symbol: str, trades: list, key: str = "id") -> list:
+        """trades whose id was not queued before, in their original order."""
+        add = self._seen_for(symbol).add
+        out = [t for t in trades if add(symbol, t[key])]
+        if len(out) < len(trades):
+            self._suppress(len(trades) - len(out))
+        return out
+
+    async def _seed(self, symbol: str):
+        """Resume from the newest trade already in the table (once per symbol)."""
+        self._seeded.add(symbol)
+        if not CURSOR_SEED_FROM_DB:
+            return
+        from ingesters.db import get_supabase
+
+        def query():
+            return (get_supabase().table(self.table).select(self.id_column)
+                    .eq("symbol", symbol).order(self.id_column, desc=True).limit(1).execute())
+        try:
+            res = await asyncio.to_thread(query)
+        except Exception as e:
+            print(f"[cursor] ⚠️ {self.table}/{symbol}: seed from DB failed: {e}")
+            return
+        if res.data:
+            self.advance(symbol, int(res.data[0][self.id_column]))
+
+    # ---- cycle helpers ----
+    async def active(self, symbols) -> dict:
+        """{symbol: exchange lastId} for symbols that traded past their cursor."""
+        last_ids = await last_trade_ids()
+        out, skipped = {}, 0
+        for s in symbols:
+            last_id = last_ids.get(s)
+            cur = self.cursors.get(s)
+            if last_id is None or (cur is not None and last_id <= cur):
+                skipped += 1
+                continue
+            out[s] = last_id
+        TRADES_SKIPPED.labels(self.table).inc(skipped)
+        return out
+
+    async def fetch_new(self, symbol: str, last_id: int | None = None) -> list:
+        """Raw /trades-shaped dicts with id > cursor, oldest first."""
+        if symbol not in self.cursors and symbol not in self._seeded:
+            await self._seed(symbol)
+        cur = self.cursors.get(symbol)
+
+        if cur is None:
+            # first sight of this symbol: the latest page is all we promise
+            return await get_json(f"{BINANCE_API}/api/v3/trades", params={"symbol": symbol, "limit": PAGE_LIMIT})
+
+        if BINANCE_API_KEY:
+            out, from_id = [], cur + 1
+            for _ in range(CURSOR_MAX_PAGES):
+                page = await get_json(
+                    f"{BINANCE_API}/api/v3/historicalTrades",
+                    params={"symbol": symbol, "fromId": from_id, "limit": PAGE_LIMIT},
+                    headers={"X-MBX-APIKEY": BINANCE_API_KEY},
+                )
+                out += page
+                if len(page) < PAGE_LIMIT or (last_id is not None and page[-1]["id"] >= last_id):
+                    break
+                from_id = page[-1]["id"] + 1
+            return out
+
+        page = await get_json(f"{BINANCE_API}/api/v3/trades", params={"symbol": symbol, "limit": PAGE_LIMIT})
+        new = [t for t in page if t["id"] > cur]
+        if new and new[0]["id"] > cur + 1:
+            gap = new[0]["id"] - cur - 1
+            TRADES_GAP.labels(self.table).inc(gap)
+            print(f"[cursor] ⚠️ {self.table}/{symbol}: {gap} trades fell out of /trades (set BINANCE_API_KEY to page them)")
+        return new
+
+
+def to_rows(symbol: str, trades: list) -> list:
+    """/trades dicts → binance_trades-shaped rows."""
+    rows = []
+    for t in trades:
+        rows.append({
+            "symbol": symbol,
+            "trade_id": t["id"],
+            "price": float(t["price"]),
+            "qty": float(t["qty"]),
+            "quote_qty": float(t["quoteQty"]),
+            "side": "BUY" if not t["isBuyerMaker"] else "SELL",
+            "is_buyer_maker": t["isBuyerMaker"],
+            "ts": datetime.fromtimestamp(t["time"]/1000.0).isoformat()
+        })
+    return rows
+
+
+class TradePoller:
+    """One REST polling cycle over the spot universe into `table` via `writer`."""
+
+    def __init__(self, table: str, writer, cursor_mode: bool = TRADES_CURSOR_MODE):
+        self.table = table
+        self.writer = writer
+        self.cursor_mode = cursor_mode
+        self.cursors = TradeCursors(table)
+
+    async def ingest_symbol(self, symbol: str, last_id: int | None = None):
+        cursors = self.cursors
+        try:
+            if self.cursor_mode:
+                trades = await cursors.fetch_new(symbol, last_id)
+            else:
+                trades = await get_json(f"{BINANCE_API}/api/v3/trades", params={"symbol": symbol, "limit": PAGE_LIMIT})
+            # overlapping windows: only ids not queued before become rows
+            trades = cursors.unseen(symbol, trades)
+            rows = to_rows(symbol, trades)
+            if rows:
+                await self.writer.aput_many(rows)
+                cursors.advance(symbol, max(t["id"] for t in trades))
+                print(f"[{symbol}] Queued {len(rows)} trades")
+        except Exception as e:
+            print(f"[ERROR] {self.table}/{symbol}: {e}")
+
+    async def run(self, symbols: list):
+        cursors = self.cursors
+        suppressed = cursors.suppressed
+        mark = self.writer.losses()
+        print(f"[INFO] {self.table}: {len(symbols)} USDT pairs")
+        if self.cursor_mode:
+            active = await cursors.active(symbols)
+            print(f"[INFO] {self.table}: {len(active)} pairs with new trades, {len(symbols) - len(active)} idle")
+            await asyncio.gather(*(self.ingest_symbol(s, last_id) for s, last_id in active.items()))
+        else:
+            await asyncio.gather(*(self.ingest_symbol(s) for s in symbols))
+        if cursors.suppressed > suppressed:
+            print(f"[INFO] {self.table}: skipped {cursors.suppressed - suppressed} already-queued trades")
+        # cursors only move once their rows are in the database; a spooled or
+        # dropped chunk sends the next cycle back to the last saved cursors
+        if await asyncio.to_thread(self.writer.flush_committed, mark):
+            cursors.save()
+        else:
+            print(f"[WARN] {self.table}: rows not committed, re-reading from the saved cursors next cycle")
+            cursors.rewind()
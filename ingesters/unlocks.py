@@ -1,17 +1,14 @@
 import os, csv, io, requests
 from datetime import datetime, timezone
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 CSV_URL = os.getenv("UNLOCKS_CSV_URL")  # set in Railway to your raw GitHub CSV url
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
 if not CSV_URL:
     raise RuntimeError("Missing UNLOCKS_CSV_URL")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 ALLOWED_TYPES = {"CLIFF","LINEAR","OTHER"}
 
 def normalize_row(row: dict) -> dict:
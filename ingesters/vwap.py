@@ -0,0 +1,257 @@
+# ingesters/vwap.py
+"""
+Incremental VWAP with standard-deviation bands, per symbol and window.
+
+Windows are rolling (VWAP_WINDOWS, default 1h/4h/24h) or anchored: "session"
+restarts at VWAP_SESSION_HOUR UTC each day, "week" on Monday 00:00 UTC.
+
+    vw = VwapEngine()
+    vw.add(symbol, ts_ms, price, qty, trade_id)
+    writer.put_many(vw.drain(now_ms))     # binance_vwap_live rows that changed
+
+Each window keeps three running sums (volume, volume x price offset,
+volume x offset²) measured from a per-symbol reference price, which keeps
+the variance numerically stable at any price level. A trade updates every
+window in O(1). Rolling windows also keep per-minute slots; drain() subtracts
+the minutes that fell out of each window, so expiry is O(1) amortized too.
+Only windows whose sums moved (trade, expiry, new anchor) are emitted.
+
+At startup seed_from_db() fills the windows from binance_trade_buckets 1h
+rows. Bands are narrower until the seeded hours age out, because a bucket
+carries no within-hour variance.
+"""
+import os
+import math
+from datetime import datetime, timezone
+
+# ========= CONFIG =========
+VWAP_TABLE = "binance_vwap_live"
+VWAP_CONFLICT = "symbol,timeframe"
+_WINDOW_MIN = {"15m": 15, "30m": 30, "1h": 60, "2h": 120, "4h": 240, "8h": 480, "12h": 720, "24h": 1440}
+VWAP_WINDOWS = {w: _WINDOW_MIN[w] for w in os.getenv("VWAP_WINDOWS", "1h,4h,24h").split(",") if w in _WINDOW_MIN}
+VWAP_ANCHORS = [a for a in os.getenv("VWAP_ANCHORS", "session,week").split(",") if a in ("session", "week")]
+VWAP_SESSION_HOUR = int(os.getenv("VWAP_SESSION_HOUR", "0"))   # UTC hour the daily session starts
+
+DAY_MS = 86_400_000
+_MONDAY_MS = 4 * DAY_MS   # 1970-01-01 was a Thursday
+
+
+def anchor_start(anchor: str, ts_ms: int) -> int:
+    if anchor == "session":
+        off = VWAP_SESSION_HOUR * 3_600_000
+        return ts_ms - (ts_ms - off) % DAY_MS
+    return ts_ms - (ts_ms - _MONDAY_MS) % (7 * DAY_MS)
+
+
+def anchor_end(anchor: str, start_ms: int) -> int:
+    return start_ms + (DAY_MS if anchor == "session" else 7 * DAY_MS)
+
+
+def _iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+# sums: [volume, Σ v·(p - ref), Σ v·(p - ref)²]; rolling windows add the minute
+# expired through, anchored windows the anchor start and end
+V, SD, SD2 = 0, 1, 2
+
+
+class _Symbol:
+    __slots__ = ("ref", "last", "slots", "roll", "anch")
+
+    def __init__(self, ref: float, windows: dict, anchors: list, ts_ms: int):
+        self.ref = ref
+        self.last = ref
+        self.slots = {}    # minute → [v, sd, sd2]
+        now_min = ts_ms // 60_000
+        self.roll = {w: [0.0, 0.0, 0.0, now_min - m] for w, m in windows.items()}
+        self.anch = {a: [0.0, 0.0, 0.0, anchor_start(a, ts_ms), anchor_end(a, anchor_start(a, ts_ms))]
+                     for a in anchors}
+
+
+class VwapEngine:
+    """Rolling and anchored VWAP + bands from a trade feed."""
+
+    def __init__(self, windows: dict = VWAP_WINDOWS, anchors: list = VWAP_ANCHORS):
+        self.windows = dict(windows)
+        self.anchors = list(anchors)
+        self.horizon = max(self.windows.values(), default=0)   # minutes of slots kept
+        self.last_ids = {}    # symbol → newest trade id added
+        self.symbols = {}
+        self._touched = set()   # symbols traded since the last drain: all their windows moved
+        self._dirty = set()     # (symbol, timeframe) moved by expiry or a new anchor
+
+    def _state(self, symbol: str, price: float, ts_ms: int) -> _Symbol:
+        st = self.symbols.get(symbol)
+        if st is None:
+            st = self.symbols[symbol] = _Symbol(price, self.windows, self.anchors, ts_ms)
+        return st
+
+    # ---- hot path ----
+    def _fold(self, symbol: str, st: _Symbol, ts_ms: int, v: float, sd: float, sd2: float):
+        minute = ts_ms // 60_000
+        self._touched.add(symbol)
+        if self.windows:
+            slot = st.slots.get(minute)
+            if slot is None:
+                slot = st.slots[minute] = [0.0, 0.0, 0.0]
+            slot[V] += v
+            slot[SD] += sd
+            slot[SD2] += sd2
+            for sums in st.roll.values():
+                if minute > sums[3]:      # not already expired from this window
+                    sums[V] += v
+                    sums[SD] += sd
+                    sums[SD2] += sd2
+        for a, sums in st.anch.items():
+            if ts_ms >= sums[4]:          # first trade of a new session / week
+                start = anchor_start(a, ts_ms)
+                sums[:] = [0.0, 0.0, 0.0, start, anchor_end(a, start)]
+            elif ts_ms < sums[3]:
+                continue                  # late trade from the previous anchor
+            sums[V] += v
+            sums[SD] += sd
+            sums[SD2] += sd2
+
+    def add(self, symbol: str, ts_ms: int, price: float, qty: float, trade_id: int) -> bool:
+        if trade_id <= self.last_ids.get(symbol, -1):
+            return False
+        self.last_ids[symbol] = trade_id
+        st = self.symbols.get(symbol) or self._state(symbol, price, ts_ms)
+        st.last = price
+        d = price - st.ref
+        self._fold(symbol, st, ts_ms, qty, qty * d, qty * d * d)
+        return True
+
+    def add_trades(self, symbol: str, trades: list) -> int:
+        """/api/v3/trades payload; returns trades added. Folds once per minute, not per trade."""
+        last_id = self.last_ids.get(symbol, -1)
+        trades = [t for t in trades if t["id"] > last_id]
+        if not trades:
+            return 0
+        self.last_ids[symbol] = max(t["id"] for t in trades)
+        st = self.symbols.get(symbol) or self._state(symbol, float(trades[0]["price"]), trades[0]["time"])
+        ref, minute = st.ref, None
+        v = sd = sd2 = 0.0
+        for t in trades:
+            m = t["time"] // 60_000
+            if m != minute:
+                if minute is not None:
+                    self._fold(symbol, st, minute * 60_000, v, sd, sd2)
+                minute, v, sd, sd2 = m, 0.0, 0.0, 0.0
+            q, d = float(t["qty"]), float(t["price"]) - ref
+            v += q
+            sd += q * d
+            sd2 += q * d * d
+        self._fold(symbol, st, minute * 60_000, v, sd, sd2)
+        st.last = float(trades[-1]["price"])
+        return len(trades)
+
+    def seed(self, symbol: str, ts_ms: int, base_vol: float, quote_vol: float):
+        """Fold a pre-aggregated bucket (no within-bucket variance) starting at ts_ms."""
+        if base_vol <= 0:
+            return
+        price = quote_vol / base_vol
+        st = self._state(symbol, price, ts_ms)
+        d = price - st.ref
+        self._fold(symbol, st, ts_ms, base_vol, base_vol * d, base_vol * d * d)
+
+    # ---- expiry + output ----
+    def _expire(self, symbol: str, st: _Symbol, now_ms: int):
+        now_min = now_ms // 60_000
+        for w, sums in st.roll.items():
+            cutoff = now_min - self.windows[w]
+            if cutoff <= sums[3]:
+                continue
+            if cutoff - sums[3] > len(st.slots):
+                gone = [s for m, s in st.slots.items() if sums[3] < m <= cutoff]
+            else:
+                gone = [s for s in map(st.slots.get, range(sums[3] + 1, cutoff + 1)) if s]
+            for s in gone:
+                sums[V] -= s[V]
+                sums[SD] -= s[SD]
+                sums[SD2] -= s[SD2]
+            sums[3] = cutoff
+            if gone:
+                if sums[V] <= 1e-12:
+                    sums[V] = sums[SD] = sums[SD2] = 0.0
+                self._dirty.add((symbol, w))
+        if st.slots:
+            cutoff = now_min - self.horizon
+            for m in [m for m in st.slots if m <= cutoff]:
+                del st.slots[m]
+        for a, sums in st.anch.items():
+            start = anchor_start(a, now_ms)
+            if start > sums[3]:
+                sums[:] = [0.0, 0.0, 0.0, start, anchor_end(a, start)]
+                self._dirty.add((symbol, a))
+
+    def _row(self, symbol: str, tf: str, now_ms: int) -> dict:
+        st = self.symbols[symbol]
+        if tf in st.roll:
+            sums, start = st.roll[tf], now_ms - self.windows[tf] * 60_000
+        else:
+            sums = st.anch[tf]
+            start = sums[3]
+        v = sums[V]
+        row = {
+            "symbol": symbol,
+            "timeframe": tf,
+            "window_start": _iso(start),
+            "vwap": None, "stdev": None,
+            "upper_1": None, "lower_1": None, "upper_2": None, "lower_2": None,
+            "volume_base": v,
+            "volume_quote": st.ref * v + sums[SD],
+            "last_price": st.last,
+            "updated_at": _iso(now_ms),
+        }
+        if v > 0:
+            mean = sums[SD] / v
+            vwap = st.ref + mean
+            sd = math.sqrt(max(0.0, sums[SD2] / v - mean * mean))
+            row.update(vwap=vwap, stdev=sd, upper_1=vwap + sd, lower_1=vwap - sd,
+                       upper_2=vwap + 2 * sd, lower_2=vwap - 2 * sd)
+        return row
+
+    def drain(self, now_ms: int) -> list[dict]:
+        """Expire rolling windows to now_ms; rows for every window that changed since the last drain."""
+        for symbol, st in self.symbols.items():
+            self._expire(symbol, st, now_ms)
+        for symbol in self._touched:
+            self._dirty.update((symbol, tf) for tf in (*self.windows, *self.anchors))
+        rows = [self._row(symbol, tf, now_ms) for symbol, tf in self._dirty]
+        self._touched.clear()
+        self._dirty.clear()
+        return rows
+
+
+def seed_from_db(vw: VwapEngine, now_ms: int, table: str = "binance_trade_buckets") -> int:
+    """Fill vw from stored 1h buckets covering its longest window and anchors; returns rows read."""
+    from ingesters.db import get_supabase
+    sb = get_supabase()
+    since = min([now_ms - vw.horizon * 60_000] + [anchor_start(a, now_ms) for a in vw.anchors])
+    since -= since % 3_600_000
+    rows, offset = [], 0
+    while True:
+        page = (sb.table(table).select("symbol,bucket_start,base_vol,quote_vol")
+                .eq("resolution", "1h").gte("bucket_start", _iso(since))
+                .order("bucket_start").range(offset, offset + 999).execute()).data or []
+        rows += page
+        if len(page) < 1000:
+            break
+        offset += 1000
+    for r in rows:
+        start = int(datetime.fromisoformat(r["bucket_start"].replace("Z", "+00:00")).timestamp() * 1000)
+        vw.seed(r["symbol"], start, float(r["base_vol"] or 0), float(r["quote_vol"] or 0))
+    print(f"[vwap] seeded {len({r['symbol'] for r in rows})} symbols from {len(rows)} {table} 1h rows")
+    return len(rows)
+
+
+def warm_start(vw: VwapEngine, last_ids: dict, now_ms: int):
+    """Skip trades the bucket tables already hold, then seed from them."""
+    for symbol, last in last_ids.items():
+        vw.last_ids[symbol] = max(vw.last_ids.get(symbol, -1), int(last))
+    try:
+        seed_from_db(vw, now_ms)
+    except Exception as e:
+        print(f"[vwap] ⚠️ seed from DB failed, windows start empty: {e}")
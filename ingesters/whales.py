@@ -0,0 +1,214 @@
+# ingesters/whales.py
+"""
+Large-trade (whale print) detection on the spot trade feed.
+
+A taker sweeping the book shows up as a burst of aggTrades (one per price
+level) sharing side and timestamp. WhaleDetector groups consecutive prints of
+one side that land within WHALE_SWEEP_MS of each other into a sweep, and
+flags the sweep when its notional is above the symbol's threshold:
+
+    wd = WhaleDetector()
+    events = wd.add(symbol, ts_ms, price, qty, is_sell, first_id, last_id)
+    events += wd.flush()          # sweeps idle for WHALE_SWEEP_MS, call often
+
+The threshold is the WHALE_QUANTILE of recent sweep notionals (never below
+WHALE_MIN_NOTIONAL), tracked with the P² streaming estimator: five markers
+per symbol, no sample buffer. To follow changing activity, each symbol keeps
+two estimators and starts a fresh one every WHALE_WINDOW sweeps; the
+threshold comes from the older one until the new one has WHALE_WARMUP
+observations.
+
+Events are rows for binance_whale_trades, keyed by (symbol, first_trade_id).
+"""
+import os
+import time
+from datetime import datetime, timezone
+
+from ingesters.metrics import counter
+
+# ========= CONFIG =========
+WHALE_TABLE = "binance_whale_trades"
+WHALE_CONFLICT = "symbol,first_trade_id"
+WHALE_QUANTILE = float(os.getenv("WHALE_QUANTILE", "0.999"))
+WHALE_MIN_NOTIONAL = float(os.getenv("WHALE_MIN_NOTIONAL", "50000"))   # quote asset (USDT)
+WHALE_SWEEP_MS = int(os.getenv("WHALE_SWEEP_MS", "10"))
+WHALE_WINDOW = int(os.getenv("WHALE_WINDOW", "20000"))                  # sweeps per estimator
+WHALE_WARMUP = int(os.getenv("WHALE_WARMUP", "500"))
+
+WHALE_EVENTS = counter("tfe_whale_events_total", "Large trades / sweeps flagged", ["side"])
+
+
+class P2Quantile:
+    """Streaming quantile estimate in O(1) memory (Jain & Chlamtac's P² algorithm)."""
+
+    __slots__ = ("p", "n", "q", "pos", "want")
+
+    def __init__(self, p: float):
+        self.p = p
+        self.n = 0
+        self.q = []                       # marker heights; the first 5 observations until full
+        self.pos = [0, 1, 2, 3, 4]        # marker positions
+        self.want = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+
+    def add(self, x: float):
+        self.n += 1
+        q, pos, p = self.q, self.pos, self.p
+        if self.n <= 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0], k = x, 0
+        elif x >= q[4]:
+            q[4], k = x, 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        want = self.want
+        want[1] += p / 2
+        want[2] += p
+        want[3] += (1 + p) / 2
+        want[4] += 1
+        for i in (1, 2, 3):
+            d = want[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                s = 1 if d > 0 else -1
+                # parabolic prediction, falling back to linear when it leaves the bracket
+                h = q[i] + s / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + s) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - s) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1]))
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + s * (q[i + s] - q[i]) / (pos[i + s] - pos[i])
+                q[i] = h
+                pos[i] += s
+
+    def value(self) -> float | None:
+        if not self.q:
+            return None
+        if self.n <= 5:
+            return self.q[min(len(self.q) - 1, int(self.p * len(self.q)))]
+        return self.q[2]
+
+    def state(self) -> list:
+        return [self.n, list(self.q), list(self.pos), list(self.want)]
+
+    @classmethod
+    def from_state(cls, p: float, st: list) -> "P2Quantile":
+        e = cls(p)
+        e.n, e.q, e.pos, e.want = int(st[0]), [float(v) for v in st[1]], [int(v) for v in st[2]], \
+            [float(v) for v in st[3]]
+        return e
+
+
+def _iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+# sweep slots
+SIDE, FIRST_TS, LAST_TS, SEEN_AT, QTY, NOTIONAL, FIRST_PX, LAST_PX, PRINTS, FIRST_ID, LAST_ID = range(11)
+
+
+class WhaleDetector:
+    """Per-symbol sweep grouping plus adaptive notional threshold."""
+
+    def __init__(self, quantile: float = WHALE_QUANTILE, min_notional: float = WHALE_MIN_NOTIONAL,
+                 sweep_ms: int = WHALE_SWEEP_MS, window: int = WHALE_WINDOW, warmup: int = WHALE_WARMUP):
+        self.quantile = quantile
+        self.min_notional = min_notional
+        self.sweep_ms = sweep_ms
+        self.window = window
+        self.warmup = warmup
+        self.last_ids = {}     # symbol → newest trade id added
+        self._open = {}        # symbol → sweep being grouped
+        self._est = {}         # symbol → [current, previous or None]
+        self.flagged = 0
+
+    def threshold(self, symbol: str) -> float:
+        cur, prev = self._est.get(symbol) or (None, None)
+        src = cur if cur is not None and cur.n >= self.warmup else prev
+        v = src.value() if src is not None and src.n >= self.warmup else None
+        return max(self.min_notional, v or 0.0)
+
+    def _observe(self, symbol: str, notional: float):
+        est = self._est.get(symbol)
+        if est is None:
+            est = self._est[symbol] = [P2Quantile(self.quantile), None]
+        if est[0].n >= self.window:
+            est[1], est[0] = est[0], P2Quantile(self.quantile)
+        est[0].add(notional)
+
+    def _close(self, symbol: str, sw: list) -> dict | None:
+        notional = sw[NOTIONAL]
+        threshold = self.threshold(symbol)
+        self._observe(symbol, notional)
+        if notional < threshold:
+            return None
+        side = "SELL" if sw[SIDE] else "BUY"
+        self.flagged += 1
+        WHALE_EVENTS.labels(side).inc()
+        return {
+            "symbol": symbol,
+            "ts": _iso(sw[FIRST_TS]),
+            "side": side,
+            "notional": notional,
+            "qty": sw[QTY],
+            "vwap": notional / sw[QTY],
+            "price_first": sw[FIRST_PX],
+            "price_last": sw[LAST_PX],
+            "prints": sw[PRINTS],
+            "duration_ms": sw[LAST_TS] - sw[FIRST_TS],
+            "threshold": threshold,
+            "first_trade_id": sw[FIRST_ID],
+            "last_trade_id": sw[LAST_ID],
+            "detected_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    # ---- hot path ----
+    def add(self, symbol: str, ts_ms: int, price: float, qty: float, is_sell: bool,
+            first_id: int, last_id: int) -> list[dict]:
+        """Group one print; returns the event for the sweep it closed, if flagged."""
+        if last_id <= self.last_ids.get(symbol, -1):
+            return []
+        self.last_ids[symbol] = last_id
+        sw = self._open.get(symbol)
+        now = time.monotonic()
+        if sw is not None and sw[SIDE] == is_sell and ts_ms - sw[LAST_TS] <= self.sweep_ms:
+            sw[LAST_TS], sw[SEEN_AT] = ts_ms, now
+            sw[QTY] += qty
+            sw[NOTIONAL] += price * qty
+            sw[LAST_PX] = price
+            sw[PRINTS] += 1
+            sw[LAST_ID] = last_id
+            return []
+        self._open[symbol] = [is_sell, ts_ms, ts_ms, now, qty, price * qty, price, price, 1, first_id, last_id]
+        if sw is None:
+            return []
+        ev = self._close(symbol, sw)
+        return [ev] if ev else []
+
+    def flush(self, idle_ms: float | None = None) -> list[dict]:
+        """Close sweeps that received nothing for idle_ms (default WHALE_SWEEP_MS) of local time."""
+        cutoff = time.monotonic() - (self.sweep_ms if idle_ms is None else idle_ms) / 1000
+        events = []
+        for symbol in [s for s, sw in self._open.items() if sw[SEEN_AT] <= cutoff]:
+            ev = self._close(symbol, self._open.pop(symbol))
+            if ev:
+                events.append(ev)
+        return events
+
+    # ---- checkpointing ----
+    def state(self) -> dict:
+        return {
+            "last_ids": dict(self.last_ids),
+            "estimators": {s: [e.state() if e else None for e in est] for s, est in self._est.items()},
+        }
+
+    def restore(self, state: dict):
+        for symbol, last in (state.get("last_ids") or {}).items():
+            self.last_ids.setdefault(symbol, int(last))
+        for symbol, est in (state.get("estimators") or {}).items():
+            if symbol not in self._est:
+                self._est[symbol] = [P2Quantile.from_state(self.quantile, e) if e else None for e in est]
@@ -0,0 +1,376 @@
+# ingesters/writer.py
+"""
+Batched, backpressured Supabase writer.
+
+Ingesters hand rows to a TableWriter and move on; a background thread per
+table drains a bounded queue and writes in chunks once a batch is big enough
+or old enough. When the database falls behind the queue fills up and put()
+blocks, which slows producers down instead of growing memory without bound.
+
+    from ingesters.writer import get_writer
+    get_writer("binance_liquidations").put(row)
+    get_writer("orderflow_cvd", mode="upsert").put_many(rows)
+
+One writer per table per process (all callers share it, so they must agree on
+its options); close_all() runs at exit and flushes whatever is still queued.
+Where the rows go is up to the sink (ingesters/sinks.py): PostgREST by
+default, Postgres COPY when enabled.
+Chunks that still fail after retries go to a disk spool (ingesters/spool.py)
+and are replayed in order once the database accepts writes again.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+from ingesters import metrics
+from ingesters.sinks import make_sink
+from ingesters.spool import Spool
+
+# ========= CONFIG =========
+WRITER_QUEUE_ROWS = int(os.getenv("WRITER_QUEUE_ROWS", "50000"))   # bounded queue per table
+WRITER_BATCH_ROWS = int(os.getenv("WRITER_BATCH_ROWS", "1000"))    # flush when this many rows are queued...
+WRITER_MAX_AGE = float(os.getenv("WRITER_MAX_AGE", "1.0"))         # ...or the oldest queued row is this old (s)
+WRITER_MAX_RETRIES = int(os.getenv("WRITER_MAX_RETRIES", "4"))
+WRITER_SPOOL = os.getenv("WRITER_SPOOL", "1") == "1"               # spool failed chunks to disk
+SPOOL_RETRY_S = float(os.getenv("SPOOL_RETRY_S", "10"))            # how often to retry replaying the spool
+
+_FLUSH = object()
+
+
+def _event_epoch(value) -> float | None:
+    """Row event time (epoch ms/s or ISO string) as epoch seconds."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def _row_bytes(row: dict) -> int:
+    return len(json.dumps(row, default=str)) + 1
+
+
+def chunk_rows(rows: list, max_rows: int, max_bytes: int | None = None):
+    """Split rows into request-sized chunks bounded by row count and JSON size."""
+    if not max_bytes:
+        for i in range(0, len(rows), max_rows):
+            yield rows[i:i + max_rows]
+        return
+    chunk, size = [], 2
+    for row in rows:
+        n = _row_bytes(row)
+        if chunk and (len(chunk) >= max_rows or size + n > max_bytes):
+            yield chunk
+            chunk, size = [], 2
+        chunk.append(row)
+        size += n
+    if chunk:
+        yield chunk
+
+
+class TableWriter:
+    """Bounded queue + flush thread for one table.
+
+    mode is "insert", "upsert" or "merge"; with on_conflict set, upsert rows
+    in the same batch that share the conflict key are collapsed to the last
+    one (Postgres refuses to update one row twice in a single statement).
+    merge rows go to the table's merge_<table>(rows jsonb) function as-is
+    (merge_replace=True: rows that restart a stored row replace it, see
+    ingesters/sinks.py). sink defaults to make_sink(table, mode, on_conflict,
+    merge_replace=merge_replace). event_time names
+    the row field holding the exchange event time; when set, each committed
+    chunk reports end-to-end freshness (event time -> DB commit).
+
+    While the spool holds rows, new chunks are appended behind them rather
+    than written directly, so rows always reach the table in arrival order.
+    """
+
+    def __init__(self, table: str, mode: str = "insert", on_conflict: str | None = None,
+                 batch_rows: int = WRITER_BATCH_ROWS, max_age: float = WRITER_MAX_AGE,
+                 queue_rows: int = WRITER_QUEUE_ROWS, sink=None, spool: bool = WRITER_SPOOL,
+                 event_time: str | None = None, dedupe_on: str | None = None, merge_replace: bool = False):
+        if mode not in ("insert", "upsert", "merge"):
+            raise ValueError(f"mode must be 'insert', 'upsert' or 'merge', got {mode!r}")
+        self.table = table
+        self.mode = mode
+        self.on_conflict = on_conflict
+        # rows sharing these columns collapse to the latest one per chunk; needed when
+        # the same key is upserted twice in one batch (Postgres rejects that).
+        # merge rows are increments, so the merge function combines them instead.
+        self.dedupe_on = None if mode == "merge" else dedupe_on or on_conflict
+        self.batch_rows = batch_rows
+        self.max_age = max_age
+        self.event_time = event_time
+        self.opts = {"mode": mode, "on_conflict": on_conflict, "batch_rows": batch_rows, "max_age": max_age,
+                     "queue_rows": queue_rows, "sink": sink, "spool": spool, "event_time": event_time,
+                     "dedupe_on": dedupe_on, "merge_replace": merge_replace}
+        self.q = queue.Queue(maxsize=queue_rows)
+        self.sink = sink or make_sink(table, mode, on_conflict, merge_replace=merge_replace)
+        self.spool = Spool(table) if spool else None
+        if self.spool and mode == "insert":
+            print(f"[writer] ⚠️ {table}: insert mode with a spool; replayed chunks can duplicate rows "
+                  f"(upsert on a natural key instead)")
+        self._spooled = bool(self.spool and self.spool.pending())   # rows from a previous run count too
+        self._last_replay = 0.0
+
+        # metrics
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.flushes = 0
+        self.last_flush_at = None
+        self.last_error = None
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"writer-{table}", daemon=True)
+        self._thread.start()
+
+    # ---- producer side ----
+    def put(self, row: dict, timeout: float | None = None):
+        """Queue one row; blocks while the queue is full (backpressure)."""
+        if self._closed:
+            raise RuntimeError(f"writer for {self.table} is closed")
+        self.q.put(row, timeout=timeout)
+        self.enqueued += 1
+
+    def put_many(self, rows, timeout: float | None = None):
+        for row in rows:
+            self.put(row, timeout=timeout)
+
+    async def aput_many(self, rows):
+        """put_many() for event-loop callers: only hops to a thread when the queue is full."""
+        rows = list(rows)
+        for i, row in enumerate(rows):
+            try:
+                self.q.put_nowait(row)
+                self.enqueued += 1
+            except queue.Full:
+                await asyncio.to_thread(self.put_many, rows[i:])
+                return
+
+    async def aput(self, row: dict):
+        await self.aput_many([row])
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Write everything queued so far; returns False on timeout."""
+        done = threading.Event()
+        self.q.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def losses(self) -> int:
+        """Rows spooled or dropped so far (a mark for flush_committed)."""
+        return self.spooled + self.failed
+
+    def flush_committed(self, since: int, timeout: float | None = None) -> bool:
+        """flush(), then True only if every row queued so far reached the table.
+
+        since is losses() taken before the caller queued its rows; any row
+        spooled or dropped after that (by any producer) makes this False, as
+        does a timeout. Callers that checkpoint progress must not advance past
+        rows that are not in the database yet.
+        """
+        return self.flush(timeout) and not self._spooled and self.losses() == since
+
+    def close(self, timeout: float | None = 30):
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+
+    def stats(self) -> dict:
+        return {
+            "table": self.table,
+            "sink": self.sink.name,
+            "queue_depth": self.q.qsize(),
+            "queue_capacity": self.q.maxsize,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "spool_pending": self._spooled,
+            "flushes": self.flushes,
+            "last_flush_at": self.last_flush_at,
+            "last_error": self.last_error,
+        }
+
+    # ---- flush thread ----
+    def _run(self):
+        batch, first_at = [], None
+        while True:
+            if self._spooled and time.monotonic() - self._last_replay >= SPOOL_RETRY_S:
+                self._replay_spool()
+            timeout = self.max_age if first_at is None else max(0.0, first_at + self.max_age - time.monotonic())
+            if self._spooled:
+                timeout = min(timeout, SPOOL_RETRY_S)
+            try:
+                item = self.q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            waiter = None
+            if isinstance(item, tuple) and item and item[0] is _FLUSH:
+                waiter = item[1]
+            elif item is not None:
+                batch.append(item)
+                first_at = first_at or time.monotonic()
+                # drain whatever else is already waiting, up to a full batch
+                while len(batch) < self.batch_rows:
+                    try:
+                        nxt = self.q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(nxt, tuple) and nxt and nxt[0] is _FLUSH:
+                        waiter = nxt[1]
+                        break
+                    batch.append(nxt)
+
+            due = first_at is not None and time.monotonic() - first_at >= self.max_age
+            if batch and (waiter or due or len(batch) >= self.batch_rows):
+                self._write(batch)
+                batch, first_at = [], None
+            if waiter:
+                waiter.set()
+
+    def _dedupe(self, rows: list) -> list:
+        if not self.dedupe_on:
+            return rows
+        keys = [k.strip() for k in self.dedupe_on.split(",")]
+        latest = {}
+        for row in rows:
+            latest[tuple(row.get(k) for k in keys)] = row
+        return list(latest.values())
+
+    def _send(self, chunk: list):
+        with metrics.WRITE_SECONDS.labels(self.table, self.sink.name).time():
+            self.sink.write(chunk)
+        if self.event_time:
+            times = [t for t in (_event_epoch(chunk[0].get(self.event_time)),
+                                 _event_epoch(chunk[-1].get(self.event_time))) if t]
+            if times:
+                now = time.time()
+                metrics.FRESHNESS_SECONDS.labels(self.table).observe(max(0.0, now - min(times)))
+                last = metrics.LAST_EVENT_COMMITTED.labels(self.table)
+                last.set(max(last.value, max(times)))
+
+    def _write(self, rows: list):
+        for chunk in chunk_rows(self._dedupe(rows), self.sink.chunk_rows, self.sink.chunk_bytes):
+            if self._spooled:
+                # keep order: nothing overtakes rows already waiting on disk
+                self._to_spool(chunk)
+                continue
+            for attempt in range(WRITER_MAX_RETRIES + 1):
+                try:
+                    self._send(chunk)
+                    self.written += len(chunk)
+                    break
+                except Exception as e:
+                    self.last_error = str(e)
+                    if attempt == WRITER_MAX_RETRIES:
+                        if self.spool:
+                            print(f"[writer] ❌ {self.table}: spooling {len(chunk)} rows after "
+                                  f"{attempt + 1} attempts: {e}")
+                            self._to_spool(chunk)
+                            self._last_replay = time.monotonic()
+                        else:
+                            self.failed += len(chunk)
+                            print(f"[writer] ❌ {self.table}: dropped {len(chunk)} rows after "
+                                  f"{attempt + 1} attempts: {e}")
+                        break
+                    delay = min(30, 2 ** attempt) * random.uniform(0.5, 1.0)
+                    print(f"[writer] ⚠️ {self.table} write failed ({e}), retry in {delay:.1f}s")
+                    time.sleep(delay)
+        self.flushes += 1
+        self.last_flush_at = time.time()
+
+    def _to_spool(self, chunk: list):
+        try:
+            self.spool.append(chunk)
+            self.spooled += len(chunk)
+            self._spooled = True
+        except OSError as e:
+            self.failed += len(chunk)
+            print(f"[writer] ❌ {self.table}: spool write failed, dropped {len(chunk)} rows: {e}")
+
+    def _replay_spool(self):
+        self._last_replay = time.monotonic()
+        try:
+            n = self.spool.replay(self._send)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[writer] ⏳ {self.table}: spool replay paused ({e})")
+            return
+        self._spooled = False
+        self.replayed += n
+        self.written += n
+        if n:
+            print(f"[writer] ✅ {self.table}: replayed {n:,} spooled rows")
+
+
+# ========= REGISTRY =========
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(table: str, **opts) -> TableWriter:
+    """Process-wide writer for a table.
+
+    Later calls must pass the same options as the call that created it (or
+    leave them out); a mismatch raises ValueError instead of being ignored.
+    """
+    with _writers_lock:
+        w = _writers.get(table)
+        if w is None:
+            return _writers.setdefault(table, TableWriter(table, **opts))
+        clash = [f"{k}={v!r} (writer has {w.opts.get(k, '<unset>')!r})"
+                 for k, v in opts.items() if k not in w.opts or w.opts[k] != v]
+        if clash:
+            raise ValueError(f"get_writer({table!r}): options differ from the existing writer: {', '.join(clash)}")
+        return w
+
+
+def all_stats() -> list[dict]:
+    with _writers_lock:
+        writers = list(_writers.values())
+    return [w.stats() for w in writers]
+
+
+def _collect_metrics():
+    for st in all_stats():
+        t = st["table"]
+        metrics.ROWS_PRODUCED.labels(t).set(st["enqueued"])
+        metrics.ROWS_WRITTEN.labels(t).set(st["written"])
+        metrics.ROWS_FAILED.labels(t).set(st["failed"])
+        metrics.ROWS_SPOOLED.labels(t).set(st["spooled"])
+        metrics.WRITER_QUEUE_DEPTH.labels(t).set(st["queue_depth"])
+        metrics.WRITER_QUEUE_CAPACITY.labels(t).set(st["queue_capacity"])
+
+
+metrics.add_collector(_collect_metrics)
+
+
+def flush_all(timeout: float | None = 30):
+    with _writers_lock:
+        writers = list(_writers.values())
+    for w in writers:
+        w.flush(timeout)
+
+
+@atexit.register
+def close_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for w in writers:
+        w.close()
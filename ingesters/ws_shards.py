@@ -0,0 +1,109 @@
+# ingesters/ws_shards.py
+"""
+Sharded Binance combined-stream connections.
+
+Binance caps streams per connection (and URL length), so the universe is
+split into shards of SHARD_SIZE streams, each on its own reconnecting
+websocket:
+
+    shards = ShardSet("binance_orderbook", BINANCE_FSTREAM, handle, shard_size=50)
+    shards.start([f"{s}@depth10@500ms" for s in symbols])
+
+handle(stream, payload) is awaited for every frame in arrival order, so a
+slow handler backpressures its own shard only. start() again (e.g. after a
+listing) cancels the old shards and reconnects with the new split.
+"""
+import json
+import time
+import random
+import asyncio
+import websockets
+
+from ingesters.metrics import WS_MESSAGES, WS_RECONNECTS
+
+
+async def run_shard(name: str, shard_id: int, base_url: str, streams: list, on_message,
+                    idle_timeout: float = 60, stale_after: float = 180, max_queue: int = 500):
+    """Stream one shard forever with reconnect + exponential backoff."""
+    stream_url = f"{base_url}/stream?streams=" + "/".join(streams)
+
+    backoff = 5  # start retry delay
+    reconnect_count = 0
+    messages = WS_MESSAGES.labels(name, shard_id)
+
+    while True:
+        try:
+            async with websockets.connect(
+                stream_url,
+                ping_interval=60,
+                ping_timeout=20,
+                close_timeout=10,
+                max_queue=max_queue,
+            ) as ws:
+                print(f"✅ [{name}] connected shard {shard_id} ({len(streams)} streams)")
+
+                backoff = 5  # reset after success
+                reconnect_count = 0
+
+                # small delay so shards don't all subscribe in the same instant
+                await asyncio.sleep(random.uniform(0.1, 0.3))
+
+                last_message = time.time()
+                while True:
+                    try:
+                        msg = await asyncio.wait_for(ws.recv(), timeout=idle_timeout)
+                        data = json.loads(msg)
+                        await on_message(data.get("stream", ""), data.get("data", {}))
+                        messages.inc()
+                        last_message = time.time()
+
+                    except asyncio.TimeoutError:
+                        print(f"💤 [{name}] shard {shard_id} idle >{idle_timeout:.0f}s, sending ping...")
+                        await ws.ping()
+                        if time.time() - last_message > stale_after:
+                            print(f"⚠️ [{name}] shard {shard_id} no data >{stale_after:.0f}s, restarting connection")
+                            break
+
+                    except websockets.ConnectionClosed:
+                        print(f"⚠️ [{name}] shard {shard_id}: connection closed → reconnecting...")
+                        break
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reconnect_count += 1
+            WS_RECONNECTS.labels(name, shard_id).inc()
+            print(f"⚠️ [{name}] shard {shard_id} error: {e}, reconnect attempt #{reconnect_count}")
+
+            # randomized staggered delay to avoid hitting connection rate limits
+            delay = backoff + random.uniform(1, 4)
+            print(f"⏳ Waiting {delay:.1f}s before reconnect...")
+            await asyncio.sleep(delay)
+
+            backoff = min(backoff * 2, 60)  # exponential up to 60s
+
+
+class ShardSet:
+    """One run_shard task per SHARD_SIZE streams, restartable as the universe changes."""
+
+    def __init__(self, name: str, base_url: str, on_message, shard_size: int = 50, **shard_opts):
+        self.name = name
+        self.base_url = base_url
+        self.on_message = on_message
+        self.shard_size = shard_size
+        self.shard_opts = shard_opts
+        self.tasks = []
+
+    def start(self, streams: list):
+        """(Re)start shards for streams; must be called from the event loop."""
+        self.stop()
+        shards = [streams[i:i + self.shard_size] for i in range(0, len(streams), self.shard_size)]
+        for i, shard_streams in enumerate(shards):
+            self.tasks.append(asyncio.create_task(
+                run_shard(self.name, i + 1, self.base_url, shard_streams, self.on_message, **self.shard_opts)))
+        print(f"[{self.name}] {len(streams)} streams over {len(shards)} shard(s)")
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks.clear()
@@ -1,11 +1,10 @@
 import os, time, requests
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 LUNAR_API_KEY = os.getenv("LUNAR_API_KEY")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 BASE_URL = "https://lunarcrush.com/api4/public"
 HEADERS = {"Authorization": f"Bearer {LUNAR_API_KEY}"}
@@ -31,12 +30,15 @@ def upsert_categories(data):
         sb.table("social_categories").upsert(rows).execute()
         print(f"[✅] Upserted {len(rows)} category rows")
 
+def run_cycle():
+    print("📊 Fetching categories...")
+    cats = fetch_categories(limit=10)
+    upsert_categories(cats)
+
 def main():
     while True:
         try:
-            print("📊 Fetching categories...")
-            cats = fetch_categories(limit=10)
-            upsert_categories(cats)
+            run_cycle()
         except Exception as e:
             print(f"❌ Categories error: {e}")
         time.sleep(300)
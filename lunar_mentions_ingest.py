@@ -1,19 +1,15 @@
 import os
 import time
 import requests
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
 # ==============================
 # Environment Variables
 # ==============================
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 LUNAR_API_KEY = os.getenv("LUNAR_API_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY in environment variables")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 BASE_URL = "https://lunarcrush.com/api4/public"
 HEADERS = {"Authorization": f"Bearer {LUNAR_API_KEY}"}
@@ -57,12 +53,16 @@ def upsert_mentions(data):
 # ==============================
 # Main Loop (rate limited)
 # ==============================
+def run_cycle():
+    print("🔍 Fetching mentions...")
+    data = fetch_mentions(limit=20)
+    upsert_mentions(data)
+
+
 def main():
     while True:
         try:
-            print("🔍 Fetching mentions...")
-            data = fetch_mentions(limit=20)
-            upsert_mentions(data)
+            run_cycle()
 
         except requests.exceptions.HTTPError as e:
             print(f"❌ HTTP error: {e}")
@@ -1,11 +1,10 @@
 import os, time, requests
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 LUNAR_API_KEY = os.getenv("LUNAR_API_KEY")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 BASE_URL = "https://lunarcrush.com/api4/public"
 HEADERS = {"Authorization": f"Bearer {LUNAR_API_KEY}"}
@@ -31,12 +30,15 @@ def upsert_news(data):
         sb.table("social_news").upsert(rows).execute()
         print(f"[✅] Upserted {len(rows)} news rows")
 
+def run_cycle():
+    print("📰 Fetching news...")
+    news = fetch_news(limit=20)
+    upsert_news(news)
+
 def main():
     while True:
         try:
-            print("📰 Fetching news...")
-            news = fetch_news(limit=20)
-            upsert_news(news)
+            run_cycle()
         except Exception as e:
             print(f"❌ News error: {e}")
         time.sleep(600)
@@ -1,11 +1,10 @@
 import os, time, requests
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 LUNAR_API_KEY = os.getenv("LUNAR_API_KEY")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 BASE_URL = "https://lunarcrush.com/api4/public"
 HEADERS = {"Authorization": f"Bearer {LUNAR_API_KEY}"}
@@ -30,12 +29,15 @@ def upsert_trends(data, symbol):
         sb.table("social_trends").upsert(rows).execute()
         print(f"[✅] Upserted {len(rows)} trend rows for {symbol}")
 
+def run_cycle():
+    print("📈 Fetching trends...")
+    data = fetch_trends(symbol="LINK")
+    upsert_trends(data, "LINK")
+
 def main():
     while True:
         try:
-            print("📈 Fetching trends...")
-            data = fetch_trends(symbol="LINK")
-            upsert_trends(data, "LINK")
+            run_cycle()
         except Exception as e:
             print(f"❌ Trends error: {e}")
         time.sleep(900)
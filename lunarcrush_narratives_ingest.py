@@ -1,17 +1,16 @@
 import os
 import time
 import requests
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
 # ===== Config =====
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 LUNAR_API_KEY = os.getenv("LUNAR_API_KEY")
 
 HEADERS = {"Authorization": f"Bearer {LUNAR_API_KEY}"}
 BASE_URL = "https://lunarcrush.com/api4/public"
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 # ===== Fetch Functions =====
 def fetch_mentions(limit=20):
@@ -1,8 +1,10 @@
 import os
-import time
+import asyncio
 from datetime import datetime, timezone
-import requests
-from supabase import create_client, Client
+
+from ingesters.binance_http import BINANCE_FAPI, get_json, close_client
+from ingesters.symbols import PERP
+from ingesters.writer import get_writer
 
 # ========= ENV VARS (Railway) =========
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -10,44 +12,22 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 LIMIT_SYMBOLS = int(os.getenv("LIMIT_SYMBOLS", "0"))
 
 print("[boot] HAS_URL=", bool(SUPABASE_URL), "HAS_KEY=", bool(SUPABASE_KEY))
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 VENUE = "binance"
-BINANCE_FAPI = "https://fapi.binance.com"
 
 # Convert milliseconds to ISO timestamp
 def iso_from_ms(ms: int) -> str:
     return datetime.fromtimestamp(ms/1000, tz=timezone.utc).isoformat()
 
 # Get all USDT perpetual pairs
-def get_perp_symbols_usdt():
-    url = f"{BINANCE_FAPI}/fapi/v1/exchangeInfo"
-    r = requests.get(url, timeout=15)
-    r.raise_for_status()
-    info = r.json()
-    syms = []
-    for s in info.get("symbols", []):
-        if (
-            s.get("contractType") == "PERPETUAL"
-            and s.get("quoteAsset") == "USDT"
-            and s.get("status") == "TRADING"
-        ):
-            syms.append(s["symbol"])
-    syms = sorted(set(syms))
-    if LIMIT_SYMBOLS and LIMIT_SYMBOLS > 0:
-        syms = syms[:LIMIT_SYMBOLS]
+async def get_perp_symbols_usdt():
+    syms = await PERP.symbols(quote="USDT", status="TRADING", limit=LIMIT_SYMBOLS)
     print(f"[symbols] Found {len(syms)} USDT-PERP symbols.")
     return syms
 
 # Fetch funding rate
-def fetch_funding(symbol: str):
-    url = f"{BINANCE_FAPI}/fapi/v1/fundingRate"
-    r = requests.get(url, params={"symbol": symbol, "limit": 1}, timeout=10)
-    r.raise_for_status()
-    data = r.json()
+async def fetch_funding(symbol: str):
+    data = await get_json(f"{BINANCE_FAPI}/fapi/v1/fundingRate", params={"symbol": symbol, "limit": 1})
     if not data:
         return None
     item = data[-1]
@@ -59,11 +39,11 @@ def fetch_funding(symbol: str):
     }
 
 # Fetch open interest
-def fetch_open_interest(symbol: str):
-    url = f"{BINANCE_FAPI}/futures/data/openInterestHist"
-    r = requests.get(url, params={"symbol": symbol, "period": "5m", "limit": 1}, timeout=10)
-    r.raise_for_status()
-    data = r.json()
+async def fetch_open_interest(symbol: str):
+    data = await get_json(
+        f"{BINANCE_FAPI}/futures/data/openInterestHist",
+        params={"symbol": symbol, "period": "5m", "limit": 1},
+    )
     if not data:
         return None
     item = data[-1]
@@ -85,54 +65,45 @@ def fetch_open_interest(symbol: str):
         "open_interest": oi_usd,
     }
 
-# Generic upsert
+# Generic upsert through the shared writer (chunked, retried, spooled on failure)
 def upsert(table: str, rows: list, conflict_cols: list):
-    if not rows:
-        return
-    sb.table(table).upsert(rows, on_conflict=",".join(conflict_cols)).execute()
-
-def run():
-    symbols = get_perp_symbols_usdt()
-
-    funding_rows = []
-    oi_rows = []
-
-    for i, sym in enumerate(symbols, start=1):
-        try:
-            f = fetch_funding(sym)
-            if f: funding_rows.append(f)
-        except Exception as e:
-            print(f"[funding] {sym} error: {e}")
+    writer = get_writer(table, mode="upsert", on_conflict=",".join(conflict_cols))
+    writer.put_many(rows)
+    writer.flush()
+
+async def fetch_symbol(sym: str):
+    """Funding + OI for one symbol; errors are logged, never raised."""
+    f, oi = await asyncio.gather(fetch_funding(sym), fetch_open_interest(sym), return_exceptions=True)
+    if isinstance(f, Exception):
+        print(f"[funding] {sym} error: {f}")
+        f = None
+    if isinstance(oi, Exception):
+        print(f"[oi] {sym} error: {oi}")
+        oi = None
+    return f, oi
+
+async def run_cycle():
+    symbols = await get_perp_symbols_usdt()
+    # The shared client paces these against the Binance weight budget
+    results = await asyncio.gather(*(fetch_symbol(s) for s in symbols))
+
+    funding_rows = [f for f, _ in results if f]
+    oi_rows = [oi for _, oi in results if oi]
 
-        try:
-            oi = fetch_open_interest(sym)
-            if oi: oi_rows.append(oi)
-        except Exception as e:
-            print(f"[oi] {sym} error: {e}")
-
-        time.sleep(0.06)
-
-        # Batch upsert every 50 rows
-        if i % 50 == 0:
-            if funding_rows:
-                print(f"Upserting {len(funding_rows)} funding rows (batch)…")
-                upsert("funding_rates", funding_rows, ["funding_time","venue","symbol"])
-                funding_rows.clear()
-            if oi_rows:
-                print(f"Upserting {len(oi_rows)} OI rows (batch)…")
-                upsert("open_interest", oi_rows, ["oi_time","venue","symbol"])
-                oi_rows.clear()
-
-    # Final flush
     if funding_rows:
-        print(f"Upserting {len(funding_rows)} funding rows (final)…")
-        upsert("funding_rates", funding_rows, ["funding_time","venue","symbol"])
+        print(f"Upserting {len(funding_rows)} funding rows…")
+        await asyncio.to_thread(upsert, "funding_rates", funding_rows, ["funding_time","venue","symbol"])
     if oi_rows:
-        print(f"Upserting {len(oi_rows)} OI rows (final)…")
-        upsert("open_interest", oi_rows, ["oi_time","venue","symbol"])
+        print(f"Upserting {len(oi_rows)} OI rows…")
+        await asyncio.to_thread(upsert, "open_interest", oi_rows, ["oi_time","venue","symbol"])
 
     print("Done.")
 
-if __name__ == "__main__":
-    run()
+async def run():
+    try:
+        await run_cycle()
+    finally:
+        await close_client()
 
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -1,7 +1,8 @@
 import os
 import time
 import requests
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 from datetime import datetime, timezone
 
 # ========= ENV VARS =========
@@ -12,7 +13,7 @@ NANSEN_API_KEY = os.getenv("NANSEN_API_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY or not NANSEN_API_KEY:
     raise RuntimeError("Missing SUPABASE_URL, SUPABASE_KEY, or NANSEN_API_KEY")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 # ========= Nansen Endpoint =========
 # ✅ official docs: https://api.nansen.ai/smart-money/holdings
@@ -65,18 +66,21 @@ def upsert_holdings(data):
         sb.table("nansen_holdings").upsert(rows).execute()
         print(f"[upsert] {len(rows)} holdings rows")
 
+def run_cycle():
+    data = fetch_holdings()
+    if isinstance(data, dict) and "data" in data:
+        # Some Nansen APIs wrap results in {"data": [...]}
+        upsert_holdings(data["data"])
+    elif isinstance(data, list):
+        upsert_holdings(data)
+    else:
+        print("⚠️ Unexpected response format:", type(data), data)
+    print("✅ Done holdings.")
+
 def main():
     while True:
         try:
-            data = fetch_holdings()
-            if isinstance(data, dict) and "data" in data:
-                # Some Nansen APIs wrap results in {"data": [...]}
-                upsert_holdings(data["data"])
-            elif isinstance(data, list):
-                upsert_holdings(data)
-            else:
-                print("⚠️ Unexpected response format:", type(data), data)
-            print("✅ Done holdings.")
+            run_cycle()
         except Exception as e:
             print("❌ Error holdings job:", e)
         time.sleep(3600)  # Run every 1 hour
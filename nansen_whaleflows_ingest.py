@@ -2,7 +2,8 @@ import os
 import time
 import requests
 from datetime import datetime, timezone
-from supabase import create_client, Client
+from supabase import Client
+from ingesters.db import get_supabase
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
@@ -11,7 +12,7 @@ NANSEN_API_KEY = os.getenv("NANSEN_API_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY or not NANSEN_API_KEY:
     raise RuntimeError("Missing one of SUPABASE_URL, SUPABASE_KEY, or NANSEN_API_KEY")
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb: Client = get_supabase()
 
 NANSEN_URL = "https://api.nansen.ai/api/beta/smart-money/inflows"
 
@@ -47,12 +48,15 @@ def upsert_whale_flows(data):
         sb.table("nansen_whaleflows").upsert(rows).execute()
         print(f"[upsert] {len(rows)} whale flow rows")
 
+def run_cycle():
+    data = fetch_whale_flows()
+    upsert_whale_flows(data)
+    print("Done whale flows.")
+
 def main():
     while True:
         try:
-            data = fetch_whale_flows()
-            upsert_whale_flows(data)
-            print("Done whale flows.")
+            run_cycle()
         except Exception as e:
             print("Error whale flows job:", e)
         time.sleep(3600)
@@ -1,18 +1,15 @@
-import os
-from supabase import create_client
+from ingesters.db import get_supabase
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+sb = get_supabase()
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing Supabase credentials")
+def run():
+    print("[start] Refreshing materialized view...")
 
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
+    try:
+        res = sb.rpc("refresh_signal_market_structure_core_raw").execute()
+        print("[ok] View refreshed successfully:", res)
+    except Exception as e:
+        print("[error] Refresh failed:", e)
 
-print("[start] Refreshing materialized view...")
-
-try:
-    res = sb.rpc("refresh_signal_market_structure_core_raw").execute()
-    print("[ok] View refreshed successfully:", res)
-except Exception as e:
-    print("[error] Refresh failed:", e)
+if __name__ == "__main__":
+    run()
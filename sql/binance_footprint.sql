@@ -0,0 +1,36 @@
+-- Per-bar footprint / volume profile written by ingesters/footprint.py
+-- (REST aggregator and aggTrade stream). One row per symbol/resolution/bar;
+-- volumes are base-asset. Bin i covers
+--   [price_low + i * bin_width, price_low + (i + 1) * bin_width)
+-- and buy_vol[i] / sell_vol[i] (1-based in SQL: buy_vol[i + 1]) hold the taker
+-- buy / sell volume traded in it. Rows are full bar totals, upserted as the
+-- bar fills. POC is the midpoint of the busiest bin; VAL..VAH is the band
+-- around it holding FOOTPRINT_VALUE_AREA (default 70%) of the bar's volume.
+create table if not exists binance_footprint (
+    symbol          text        not null,
+    resolution      text        not null check (resolution in ('1m', '5m', '15m', '1h', '4h', '1d')),
+    bar_start       timestamptz not null,
+    bin_width       double precision not null,
+    price_low       double precision not null,
+    buy_vol         double precision[] not null,
+    sell_vol        double precision[] not null,
+    poc_price       double precision,
+    val_price       double precision,
+    vah_price       double precision,
+    volume          double precision not null default 0,
+    delta           double precision not null default 0,
+    trades          integer     not null default 0,
+    first_trade_id  bigint,
+    last_trade_id   bigint,
+    primary key (symbol, resolution, bar_start)
+);
+
+create index if not exists binance_footprint_res_time_idx
+    on binance_footprint (resolution, bar_start desc);
+
+-- the latest POC / value area per symbol and resolution, for the signal views
+create or replace view binance_footprint_latest as
+select distinct on (symbol, resolution)
+    symbol, resolution, bar_start, poc_price, val_price, vah_price, volume, delta
+from binance_footprint
+order by symbol, resolution, bar_start desc;
@@ -0,0 +1,36 @@
+-- Packed order book storage (ORDERBOOK_STORAGE=packed in
+-- ingesters/binance_orderbook_ingest.py): one row per symbol snapshot instead of
+-- one row per level. Index i of each array is depth level i + 1, best first, so
+-- a depth10 message is 1 row instead of 20.
+--
+-- Partitioned by day like binance_orderbook; retention_maintain() (see
+-- sql/partition_retention.sql) creates and drops the partitions.
+create table if not exists binance_orderbook_snapshots (
+    symbol      text        not null,
+    time        timestamptz not null,
+    bid_prices  double precision[] not null,
+    bid_qtys    double precision[] not null,
+    ask_prices  double precision[] not null,
+    ask_qtys    double precision[] not null,
+    primary key (symbol, time)
+) partition by range (time);
+
+create index if not exists binance_orderbook_snapshots_time_idx
+    on binance_orderbook_snapshots (time);
+
+select * from retention_maintain('binance_orderbook_snapshots', 'day', '7 days');
+
+-- Row-per-level view over both storage modes, shaped like binance_orderbook.
+-- Point readers of binance_orderbook (the agg/depth materialized views) here
+-- before switching ORDERBOOK_STORAGE to packed.
+create or replace view binance_orderbook_levels as
+select symbol, side, price, quantity, depth_level, time
+from binance_orderbook
+union all
+select s.symbol, 'BID', l.price, l.quantity, l.depth_level::int, s.time
+from binance_orderbook_snapshots s,
+     unnest(s.bid_prices, s.bid_qtys) with ordinality as l(price, quantity, depth_level)
+union all
+select s.symbol, 'ASK', l.price, l.quantity, l.depth_level::int, s.time
+from binance_orderbook_snapshots s,
+     unnest(s.ask_prices, s.ask_qtys) with ordinality as l(price, quantity, depth_level);
@@ -0,0 +1,23 @@
+-- Multi-resolution spot trade buckets written by ingesters/trade_buckets.py
+-- (REST aggregator and aggTrade stream). One row per symbol/resolution/bucket;
+-- volumes are quote-asset (price * qty), vwap = quote_vol / base_vol.
+create table if not exists binance_trade_buckets (
+    symbol        text        not null,
+    resolution    text        not null check (resolution in ('1m', '5m', '15m', '1h', '4h', '1d')),
+    bucket_start  timestamptz not null,
+    buy_vol       double precision not null default 0,
+    sell_vol      double precision not null default 0,
+    delta         double precision not null default 0,
+    buy_trades    integer     not null default 0,
+    sell_trades   integer     not null default 0,
+    quote_vol     double precision not null default 0,
+    base_vol      double precision not null default 0,
+    vwap          double precision,
+    primary key (symbol, resolution, bucket_start)
+);
+
+create index if not exists binance_trade_buckets_res_time_idx
+    on binance_trade_buckets (resolution, bucket_start desc);
+
+-- running cumulative delta at the end of each bucket (per symbol/resolution)
+alter table binance_trade_buckets add column if not exists cvd double precision;
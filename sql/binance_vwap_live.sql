@@ -0,0 +1,81 @@
+-- Live VWAP per symbol and window, written by ingesters/vwap.py (REST
+-- aggregator and aggTrade stream). One row per symbol/timeframe, upserted only
+-- when the window moved. timeframe is a rolling window ('1h', '4h', '24h') or an
+-- anchor ('session' = UTC day from VWAP_SESSION_HOUR, 'week' = from Monday);
+-- window_start is where the window currently begins. Bands are vwap ± 1 and 2
+-- volume-weighted standard deviations of trade price.
+create table if not exists binance_vwap_live (
+    symbol        text        not null,
+    timeframe     text        not null,
+    window_start  timestamptz not null,
+    vwap          double precision,
+    stdev         double precision,
+    upper_1       double precision,
+    lower_1       double precision,
+    upper_2       double precision,
+    lower_2       double precision,
+    volume_base   double precision not null default 0,
+    volume_quote  double precision not null default 0,
+    last_price    double precision,
+    updated_at    timestamptz not null default now(),
+    primary key (symbol, timeframe)
+);
+
+-- binance_vwap_agg used to be a materialized view refreshed in full by
+-- ingesters/refresh_vwap.py (removed). The trade buckets already carry
+-- per-bucket VWAP and volumes, so it becomes a plain view over them with the
+-- same contract: one row per symbol/timeframe, the latest bucket. Each row is
+-- an index lookup on the bucket primary key, driven by the symbols in
+-- binance_vwap_live. close_price is the symbol's last trade price, which is
+-- the close of that latest bucket. refresh_binance_vwap_agg() stays as a
+-- no-op for old callers.
+--
+-- Views built on the old materialized view would be lost with it, so the
+-- drop refuses to run while any exist: drop them, rerun this file, then
+-- recreate them.
+do $$
+declare
+    deps text;
+begin
+    if exists (select 1 from pg_matviews
+               where schemaname = current_schema() and matviewname = 'binance_vwap_agg') then
+        select string_agg(distinct v.oid::regclass::text, ', ') into deps
+        from pg_depend d
+        join pg_rewrite r on r.oid = d.objid
+        join pg_class v on v.oid = r.ev_class
+        where d.refobjid = 'binance_vwap_agg'::regclass
+          and v.oid <> d.refobjid;
+        if deps is not null then
+            raise exception 'binance_vwap_agg has dependent views (%); drop them, rerun, then recreate them', deps;
+        end if;
+        drop materialized view binance_vwap_agg;
+    end if;
+end $$;
+
+create or replace view binance_vwap_agg as
+select
+    l.symbol,
+    r.resolution   as timeframe,
+    b.bucket_start,
+    b.vwap,
+    b.base_vol     as volume_base,
+    b.quote_vol    as volume_quote,
+    l.last_price   as close_price
+from (
+    -- freshest last price per symbol, whichever windows are configured
+    select distinct on (symbol) symbol, last_price
+    from binance_vwap_live
+    order by symbol, updated_at desc
+) l
+cross join unnest(array['1m', '5m', '15m', '1h', '4h', '1d']) as r(resolution)
+cross join lateral (
+    select *
+    from binance_trade_buckets b
+    where b.symbol = l.symbol and b.resolution = r.resolution
+    order by b.bucket_start desc
+    limit 1
+) b;
+
+create or replace function refresh_binance_vwap_agg()
+returns void
+language plpgsql as $$ begin null; end; $$;
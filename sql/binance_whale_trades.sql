@@ -0,0 +1,28 @@
+-- Large spot prints and sweeps flagged by ingesters/whales.py (aggTrade stream).
+-- One row per sweep: consecutive same-side aggTrades within WHALE_SWEEP_MS,
+-- keyed by the first trade id so gap-fill replays upsert onto the same row.
+-- notional is quote-asset; threshold is the symbol's adaptive cutoff
+-- (WHALE_QUANTILE of recent sweep notionals, floored at WHALE_MIN_NOTIONAL)
+-- when the sweep closed.
+create table if not exists binance_whale_trades (
+    symbol          text        not null,
+    ts              timestamptz not null,
+    side            text        not null check (side in ('BUY', 'SELL')),
+    notional        double precision not null,
+    qty             double precision not null,
+    vwap            double precision,
+    price_first     double precision,
+    price_last      double precision,
+    prints          integer     not null default 1,
+    duration_ms     integer     not null default 0,
+    threshold       double precision,
+    first_trade_id  bigint      not null,
+    last_trade_id   bigint      not null,
+    detected_at     timestamptz not null default now(),
+    primary key (symbol, first_trade_id)
+);
+
+create index if not exists binance_whale_trades_ts_idx
+    on binance_whale_trades (ts desc);
+create index if not exists binance_whale_trades_symbol_ts_idx
+    on binance_whale_trades (symbol, ts desc);
@@ -0,0 +1,32 @@
+-- Natural keys for the stream tables that used to be plain inserts
+-- (binance_liquidations, binance_orderbook). Their writers now upsert on these
+-- keys, so a chunk the writer retries or replays from its spool
+-- (ingesters/spool.py, at-least-once) lands on the same rows instead of
+-- duplicating them.
+--
+-- Existing duplicates are removed first, keeping one row per key. Both keys
+-- contain the time column, so they are valid on partitioned tables. Run this
+-- after retention_partition_table(), which only carries the primary key over.
+
+-- !forceOrder@arr pushes at most one liquidation per symbol per second; the
+-- order itself has no id, so the event is identified by what it reports.
+delete from binance_liquidations
+where (tableoid, ctid) in (
+    select tableoid, ctid from (
+        select tableoid, ctid, row_number() over (
+            partition by symbol, time, side, price, quantity order by ctid) as n
+        from binance_liquidations) d
+    where n > 1);
+create unique index if not exists binance_liquidations_event_key
+    on binance_liquidations (symbol, time, side, price, quantity);
+
+-- one row per level of one depth snapshot
+delete from binance_orderbook
+where (tableoid, ctid) in (
+    select tableoid, ctid from (
+        select tableoid, ctid, row_number() over (
+            partition by symbol, time, side, depth_level order by ctid) as n
+        from binance_orderbook) d
+    where n > 1);
+create unique index if not exists binance_orderbook_level_key
+    on binance_orderbook (symbol, time, side, depth_level);
@@ -0,0 +1,4 @@
+-- Mark / index price on orderflow_cvd snapshots (binance_orderflow_cvd.py stream
+-- mode reads them from /fapi/v1/premiumIndex alongside the funding rate).
+alter table orderflow_cvd add column if not exists mark_price double precision;
+alter table orderflow_cvd add column if not exists index_price double precision;
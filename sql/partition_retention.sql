@@ -0,0 +1,144 @@
+-- Time-partitioned retention for the short-lived feed tables
+-- (ingesters/retention.py drives it; see RETENTION_TABLES there).
+--
+-- Instead of `delete ... where ts < cutoff`, each table is range-partitioned on
+-- its time column into hourly or daily partitions named <table>_pYYYYMMDD[HH].
+-- retention_maintain() creates the partitions covering [now - keep, now + ahead]
+-- and drops whole partitions that ended before now - keep: a catalog operation
+-- that neither bloats the table nor competes with ingest for row locks.
+-- A <table>_default partition catches out-of-range rows (clock skew, late
+-- backfills); its rows are moved into their partition once it is created.
+--
+-- One-off conversion of an existing table (copies only rows still in retention):
+--   select retention_partition_table('binance_orderbook', 'time', 'day', '7 days');
+--   select retention_partition_table('binance_trades_24h', 'ts', 'hour', '168 hours');
+--   select retention_partition_table('binance_market_cap', 'ts', 'day', '7 days');
+-- The primary key gains the time column if it lacks it (Postgres requires the
+-- partition key in every unique index). Views on the table must be dropped
+-- first and recreated after; otherwise the conversion rolls back untouched.
+
+create or replace function retention_maintain(parent text, step text, keep interval, ahead int default 2)
+returns table (created int, dropped int)
+language plpgsql as $$
+declare
+    unit interval := ('1 ' || step)::interval;
+    fmt text := case step when 'hour' then 'YYYYMMDDHH24' when 'day' then 'YYYYMMDD' end;
+    dflt text := parent || '_default';
+    col text;
+    s timestamptz;
+    part record;
+begin
+    if fmt is null then
+        raise exception 'step must be hour or day, got %', step;
+    end if;
+    perform set_config('TimeZone', 'UTC', true);
+    created := 0;
+    dropped := 0;
+
+    select a.attname into col
+    from pg_partitioned_table p
+    join pg_attribute a on a.attrelid = p.partrelid and a.attnum = p.partattrs[0]
+    where p.partrelid = parent::regclass;
+    if col is null then
+        raise exception '% is not partitioned; run retention_partition_table first', parent;
+    end if;
+
+    if to_regclass(dflt) is null then
+        execute format('create table %I partition of %I default', dflt, parent);
+    end if;
+
+    -- create missing partitions; rows already parked in the default move with them
+    s := date_trunc(step, now() - keep);
+    while s <= date_trunc(step, now()) + ahead * unit loop
+        if to_regclass(parent || '_p' || to_char(s, fmt)) is null then
+            execute format('create table %I (like %I including defaults including constraints)',
+                           parent || '_p' || to_char(s, fmt), parent);
+            execute format('with moved as (delete from %I where %I >= %L and %I < %L returning *) '
+                           'insert into %I select * from moved',
+                           dflt, col, s, col, s + unit, parent || '_p' || to_char(s, fmt));
+            execute format('alter table %I attach partition %I for values from (%L) to (%L)',
+                           parent, parent || '_p' || to_char(s, fmt), s, s + unit);
+            created := created + 1;
+        end if;
+        s := s + unit;
+    end loop;
+
+    -- drop partitions that ended before the retention cutoff
+    for part in
+        select c.relname
+        from pg_inherits i
+        join pg_class c on c.oid = i.inhrelid
+        where i.inhparent = parent::regclass and c.relname ~ ('^' || parent || '_p[0-9]+$')
+    loop
+        s := to_timestamp(substr(part.relname, length(parent) + 3), fmt);
+        if s + unit <= now() - keep then
+            execute format('drop table %I', part.relname);
+            dropped := dropped + 1;
+        end if;
+    end loop;
+
+    execute format('delete from %I where %I < %L', dflt, col, now() - keep);
+    return next;
+end;
+$$;
+
+
+create or replace function retention_partition_table(parent text, col text, step text, keep interval)
+returns void
+language plpgsql as $$
+declare
+    legacy text := parent || '_legacy';
+    pk text[];
+    pk_name text;
+    seq record;
+begin
+    if exists (select 1 from pg_partitioned_table where partrelid = parent::regclass) then
+        return;
+    end if;
+
+    select array_agg(a.attname::text order by array_position(i.indkey::int2[], a.attnum)) into pk
+    from pg_index i
+    join pg_attribute a on a.attrelid = i.indrelid and a.attnum = any(i.indkey)
+    where i.indrelid = parent::regclass and i.indisprimary;
+    select conname into pk_name from pg_constraint where conrelid = parent::regclass and contype = 'p';
+
+    -- the old table keeps its index names; move them aside so the new ones can take them
+    execute format('alter table %I rename to %I', parent, legacy);
+    if pk_name is not null then
+        execute format('alter table %I rename constraint %I to %I', legacy, pk_name, pk_name || '_legacy');
+    end if;
+    execute format('create table %I (like %I including defaults including constraints including identity) '
+                   'partition by range (%I)', parent, legacy, col);
+    if pk is not null then
+        if not col = any(pk) then
+            pk := pk || col;
+        end if;
+        execute format('alter table %I add primary key (%s)', parent,
+                       (select string_agg(quote_ident(c), ', ') from unnest(pk) c));
+    end if;
+    execute format('create index if not exists %I on %I (%I)', parent || '_' || col || '_part_idx', parent, col);
+
+    perform retention_maintain(parent, step, keep);
+    execute format('insert into %I overriding system value select * from %I where %I >= now() - %L::interval',
+                   parent, legacy, col, keep);
+
+    -- identity columns got fresh sequences; serial ones still belong to the old table
+    for seq in
+        select pg_get_serial_sequence(quote_ident(parent), a.attname) as name, a.attname
+        from pg_attribute a
+        where a.attrelid = parent::regclass and a.attidentity <> ''
+    loop
+        execute format('select setval(%L, coalesce((select max(%I) from %I), 0) + 1, false)',
+                       seq.name, seq.attname, parent);
+    end loop;
+    for seq in
+        select d.objid::regclass::text as name
+        from pg_depend d
+        join pg_class c on c.oid = d.objid
+        where d.refobjid = legacy::regclass and d.deptype = 'a' and c.relkind = 'S'
+    loop
+        execute format('alter sequence %s owned by none', seq.name);
+    end loop;
+    execute format('drop table %I', legacy);
+end;
+$$;
@@ -0,0 +1,180 @@
+-- Additive, idempotent merges for the trade bucket tables (writer mode="merge").
+--
+-- ingesters/trade_buckets.py emits increments, not totals: each row carries the
+-- volumes/counts of trades first_trade_id..last_trade_id that landed in the
+-- bucket since the previous drain. merge_<table>(rows jsonb) adds an increment
+-- onto the stored row only when it starts after the row's last_trade_id, so
+--   * a bucket filled over several polls or across a restart sums exactly,
+--   * a replayed chunk (writer retry, spool replay, re-run) is a no-op,
+-- without re-reading binance_trades. Increments for one key inside a chunk are
+-- summed first (ON CONFLICT cannot touch a row twice per statement).
+-- Rows written before this migration have no last_trade_id; the first merge
+-- replaces them, which is what the old overwrite did.
+--
+-- Rows without a first_trade_id are CVD corrections: a late trade in an older
+-- bucket shifts the running CVD of every bucket after it, and the engine
+-- re-sends those buckets' cvd alone. They only overwrite cvd, and only when
+-- their last_trade_id (the symbol's newest trade id when they were drained)
+-- is not behind the stored row's, so a correction never undoes a newer
+-- increment merged in the same or a later chunk.
+--
+-- replace => true (ingesters/binance_trades_agg_backfill.py, BACKFILL_REPLACE=1)
+-- rebuilds instead: an increment whose first_trade_id is at or before the
+-- stored row's first_trade_id starts the bucket over, so the stored row is
+-- deleted and the increment inserted; later increments add onto it as usual.
+
+alter table binance_trade_buckets add column if not exists first_trade_id bigint;
+alter table binance_trade_buckets add column if not exists last_trade_id bigint;
+alter table binance_trades_agg add column if not exists first_trade_id bigint;
+alter table binance_trades_agg add column if not exists last_trade_id bigint;
+alter table binance_trades_agg_5m add column if not exists first_trade_id bigint;
+alter table binance_trades_agg_5m add column if not exists last_trade_id bigint;
+
+-- conflict targets for the legacy tables
+create unique index if not exists binance_trades_agg_symbol_bucket_uidx
+    on binance_trades_agg (symbol, bucket_15m);
+create unique index if not exists binance_trades_agg_5m_symbol_bucket_uidx
+    on binance_trades_agg_5m (symbol, bucket_5m);
+
+
+drop function if exists merge_binance_trade_buckets(jsonb);
+create or replace function merge_binance_trade_buckets(rows jsonb, replace boolean default false) returns void
+language sql as $$
+    delete from binance_trade_buckets as t
+    using (
+        select symbol, resolution, bucket_start, min(first_trade_id) as first_trade_id
+        from jsonb_populate_recordset(null::binance_trade_buckets, rows)
+        where replace and first_trade_id is not null
+        group by symbol, resolution, bucket_start
+    ) r
+    where t.symbol = r.symbol and t.resolution = r.resolution and t.bucket_start = r.bucket_start
+      and t.first_trade_id >= r.first_trade_id;
+
+    insert into binance_trade_buckets as t (
+        symbol, resolution, bucket_start, buy_vol, sell_vol, delta, buy_trades, sell_trades,
+        quote_vol, base_vol, vwap, cvd, first_trade_id, last_trade_id)
+    select symbol, resolution, bucket_start,
+           sum(buy_vol), sum(sell_vol), sum(delta), sum(buy_trades), sum(sell_trades),
+           sum(quote_vol), sum(base_vol), sum(quote_vol) / nullif(sum(base_vol), 0),
+           (array_agg(cvd order by last_trade_id desc))[1],
+           min(first_trade_id), max(last_trade_id)
+    from jsonb_populate_recordset(null::binance_trade_buckets, rows)
+    where first_trade_id is not null
+    group by symbol, resolution, bucket_start
+    on conflict (symbol, resolution, bucket_start) do update set
+        buy_vol     = excluded.buy_vol     + case when t.last_trade_id is null then 0 else t.buy_vol end,
+        sell_vol    = excluded.sell_vol    + case when t.last_trade_id is null then 0 else t.sell_vol end,
+        delta       = excluded.delta       + case when t.last_trade_id is null then 0 else t.delta end,
+        buy_trades  = excluded.buy_trades  + case when t.last_trade_id is null then 0 else t.buy_trades end,
+        sell_trades = excluded.sell_trades + case when t.last_trade_id is null then 0 else t.sell_trades end,
+        quote_vol   = excluded.quote_vol   + case when t.last_trade_id is null then 0 else t.quote_vol end,
+        base_vol    = excluded.base_vol    + case when t.last_trade_id is null then 0 else t.base_vol end,
+        vwap = (excluded.quote_vol + case when t.last_trade_id is null then 0 else t.quote_vol end)
+             / nullif(excluded.base_vol + case when t.last_trade_id is null then 0 else t.base_vol end, 0),
+        cvd = excluded.cvd,
+        first_trade_id = coalesce(t.first_trade_id, excluded.first_trade_id),
+        last_trade_id = excluded.last_trade_id
+    where t.last_trade_id is null or excluded.first_trade_id > t.last_trade_id;
+
+    update binance_trade_buckets as t set cvd = c.cvd
+    from (
+        select distinct on (symbol, resolution, bucket_start) symbol, resolution, bucket_start, cvd, last_trade_id
+        from jsonb_populate_recordset(null::binance_trade_buckets, rows)
+        where first_trade_id is null
+        order by symbol, resolution, bucket_start, last_trade_id desc
+    ) c
+    where t.symbol = c.symbol and t.resolution = c.resolution and t.bucket_start = c.bucket_start
+      and (t.last_trade_id is null or t.last_trade_id <= c.last_trade_id);
+$$;
+
+
+drop function if exists merge_binance_trades_agg(jsonb);
+create or replace function merge_binance_trades_agg(rows jsonb, replace boolean default false) returns void
+language sql as $$
+    delete from binance_trades_agg as t
+    using (
+        select symbol, bucket_15m, min(first_trade_id) as first_trade_id
+        from jsonb_populate_recordset(null::binance_trades_agg, rows)
+        where replace and first_trade_id is not null
+        group by symbol, bucket_15m
+    ) r
+    where t.symbol = r.symbol and t.bucket_15m = r.bucket_15m
+      and t.first_trade_id >= r.first_trade_id;
+
+    insert into binance_trades_agg as t (
+        symbol, bucket_15m, bucket_1h, bucket_1d, buy_vol, sell_vol, delta,
+        bullish_trades, bearish_trades, cvd, first_trade_id, last_trade_id)
+    select symbol, bucket_15m, bucket_1h, bucket_1d,
+           sum(buy_vol), sum(sell_vol), sum(delta), sum(bullish_trades), sum(bearish_trades),
+           (array_agg(cvd order by last_trade_id desc))[1],
+           min(first_trade_id), max(last_trade_id)
+    from jsonb_populate_recordset(null::binance_trades_agg, rows)
+    where first_trade_id is not null
+    group by symbol, bucket_15m, bucket_1h, bucket_1d
+    on conflict (symbol, bucket_15m) do update set
+        buy_vol        = excluded.buy_vol        + case when t.last_trade_id is null then 0 else t.buy_vol end,
+        sell_vol       = excluded.sell_vol       + case when t.last_trade_id is null then 0 else t.sell_vol end,
+        delta          = excluded.delta          + case when t.last_trade_id is null then 0 else t.delta end,
+        bullish_trades = excluded.bullish_trades + case when t.last_trade_id is null then 0 else t.bullish_trades end,
+        bearish_trades = excluded.bearish_trades + case when t.last_trade_id is null then 0 else t.bearish_trades end,
+        cvd = excluded.cvd,
+        first_trade_id = coalesce(t.first_trade_id, excluded.first_trade_id),
+        last_trade_id = excluded.last_trade_id
+    where t.last_trade_id is null or excluded.first_trade_id > t.last_trade_id;
+
+    update binance_trades_agg as t set cvd = c.cvd
+    from (
+        select distinct on (symbol, bucket_15m) symbol, bucket_15m, cvd, last_trade_id
+        from jsonb_populate_recordset(null::binance_trades_agg, rows)
+        where first_trade_id is null
+        order by symbol, bucket_15m, last_trade_id desc
+    ) c
+    where t.symbol = c.symbol and t.bucket_15m = c.bucket_15m
+      and (t.last_trade_id is null or t.last_trade_id <= c.last_trade_id);
+$$;
+
+
+drop function if exists merge_binance_trades_agg_5m(jsonb);
+create or replace function merge_binance_trades_agg_5m(rows jsonb, replace boolean default false) returns void
+language sql as $$
+    delete from binance_trades_agg_5m as t
+    using (
+        select symbol, bucket_5m, min(first_trade_id) as first_trade_id
+        from jsonb_populate_recordset(null::binance_trades_agg_5m, rows)
+        where replace and first_trade_id is not null
+        group by symbol, bucket_5m
+    ) r
+    where t.symbol = r.symbol and t.bucket_5m = r.bucket_5m
+      and t.first_trade_id >= r.first_trade_id;
+
+    insert into binance_trades_agg_5m as t (
+        symbol, bucket_5m, buy_vol, sell_vol, delta,
+        bullish_trades, bearish_trades, cvd, first_trade_id, last_trade_id)
+    select symbol, bucket_5m,
+           sum(buy_vol), sum(sell_vol), sum(delta), sum(bullish_trades), sum(bearish_trades),
+           (array_agg(cvd order by last_trade_id desc))[1],
+           min(first_trade_id), max(last_trade_id)
+    from jsonb_populate_recordset(null::binance_trades_agg_5m, rows)
+    where first_trade_id is not null
+    group by symbol, bucket_5m
+    on conflict (symbol, bucket_5m) do update set
+        buy_vol        = excluded.buy_vol        + case when t.last_trade_id is null then 0 else t.buy_vol end,
+        sell_vol       = excluded.sell_vol       + case when t.last_trade_id is null then 0 else t.sell_vol end,
+        delta          = excluded.delta          + case when t.last_trade_id is null then 0 else t.delta end,
+        bullish_trades = excluded.bullish_trades + case when t.last_trade_id is null then 0 else t.bullish_trades end,
+        bearish_trades = excluded.bearish_trades + case when t.last_trade_id is null then 0 else t.bearish_trades end,
+        cvd = excluded.cvd,
+        first_trade_id = coalesce(t.first_trade_id, excluded.first_trade_id),
+        last_trade_id = excluded.last_trade_id
+    where t.last_trade_id is null or excluded.first_trade_id > t.last_trade_id;
+
+    update binance_trades_agg_5m as t set cvd = c.cvd
+    from (
+        select distinct on (symbol, bucket_5m) symbol, bucket_5m, cvd, last_trade_id
+        from jsonb_populate_recordset(null::binance_trades_agg_5m, rows)
+        where first_trade_id is null
+        order by symbol, bucket_5m, last_trade_id desc
+    ) c
+    where t.symbol = c.symbol and t.bucket_5m = c.bucket_5m
+      and (t.last_trade_id is null or t.last_trade_id <= c.last_trade_id);
+$$;
@@ -0,0 +1,231 @@
+"""
+Single-process job supervisor.
+
+Runs the registered ingesters and signal jobs as asyncio tasks in one
+interpreter instead of one Python process per Procfile entry: supabase,
+openai and pandas are imported once, and every job shares the same Supabase
+client and pooled Binance HTTP client.
+
+  python supervisor.py                      # every job
+  python supervisor.py --group streams      # one or more groups (comma-separated)
+  python supervisor.py --jobs orderflow_cvd # explicit job names
+  python supervisor.py --list
+
+Per-job overrides: JOB_EVERY_<NAME>=<seconds>, SUPERVISOR_DISABLE=name,name
+TRADES_SOURCE=stream|rest picks the aggTrade stream or the REST trade pollers.
+ORDERFLOW_SOURCE=stream|rest does the same for orderflow_cvd.
+"""
+import os
+import sys
+import time
+import random
+import signal
+import asyncio
+import inspect
+import argparse
+import importlib
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from ingesters import metrics
+
+# ========= CONFIG =========
+STREAM_MAX_BACKOFF = float(os.getenv("SUPERVISOR_STREAM_MAX_BACKOFF", "300"))
+# Jobs start spread over this many seconds so they don't all hit the DB at boot
+STARTUP_SPREAD = float(os.getenv("SUPERVISOR_STARTUP_SPREAD", "30"))
+DISABLED = {j.strip() for j in os.getenv("SUPERVISOR_DISABLE", "").split(",") if j.strip()}
+# Trade tables come from either the aggTrade stream or the REST pollers, never both
+TRADES_SOURCE = os.getenv("TRADES_SOURCE", "stream")
+TRADE_POLLERS = {"binance_trades", "binance_trades_24h", "binance_trades_agg"}
+DISABLED |= TRADE_POLLERS if TRADES_SOURCE == "stream" else {"binance_trades_stream"}
+ORDERFLOW_SOURCE = os.getenv("ORDERFLOW_SOURCE", "stream")
+DISABLED |= {"orderflow_cvd"} if ORDERFLOW_SOURCE == "stream" else {"orderflow_cvd_stream"}
+
+
+@dataclass
+class Job:
+    name: str
+    target: str              # "module:function"; sync or async, imported on first run
+    group: str
+    every: float | None      # seconds between cycle starts; None = long-running stream
+    jitter: float = 0.0      # max random delay added before each cycle
+
+    @property
+    def cadence(self):
+        override = os.getenv(f"JOB_EVERY_{self.name.upper()}")
+        return float(override) if override else self.every
+
+
+# ========= REGISTRY =========
+JOBS = [
+    # ---- long-running websocket streams ----
+    Job("binance_orderbook", "ingesters.binance_orderbook_ingest:main", "streams", None),
+    Job("binance_liquidations", "binance_liquidations_ingest:listen", "streams", None),
+    Job("binance_trades_stream", "ingesters.binance_trades_stream:main", "streams", None),
+    # futures aggTrade windows + premiumIndex snapshot every ORDERFLOW_EVERY seconds
+    Job("orderflow_cvd_stream", "binance_orderflow_cvd:stream", "streams", None),
+
+    # ---- Binance REST pollers ----
+    # the Procfile's funding_oi process ran binance_market_ingest.py; main.py was never deployed
+    Job("funding_oi", "binance_market_ingest:run_cycle", "binance", 300, jitter=15),
+    Job("orderflow_cvd", "binance_orderflow_cvd:run_cycle", "binance", 300, jitter=15),
+    Job("binance_trades", "ingesters.binance_trades_ingest:ingest_trades", "binance", 300, jitter=15),
+    Job("binance_trades_24h", "ingesters.binance_trades_24h:ingest_trades", "binance", 300, jitter=15),
+    # writes binance_trades_agg, binance_trades_agg_5m and binance_trade_buckets
+    Job("binance_trades_agg", "ingesters.binance_trades_agg_ingest:run_cycle", "binance", 60, jitter=5),
+    Job("binance_ohlcv", "ingesters.binance_ohlcv_with_rsi:run_cycle", "binance", 900, jitter=30),
+    Job("binance_marketcap", "ingesters.binance_marketcap_ingest:run_cycle", "binance", 1800, jitter=30),
+
+    # ---- third-party data ----
+    Job("market", "coingecko_market_ingest:run_cycle", "external", 3600, jitter=60),
+    Job("nansen_whaleflows", "nansen_whaleflows_ingest:run_cycle", "external", 3600, jitter=60),
+    Job("nansen_holdings", "nansen_holdings_ingest:run_cycle", "external", 3600, jitter=60),
+    Job("lunar_sentiment", "lunarcrush_sentiment_ingest:main", "external", 1800, jitter=60),
+    Job("lunar_narratives", "lunarcrush_narratives_ingest:main", "external", 300, jitter=30),
+    Job("lunar_news", "lunar_news_ingest:run_cycle", "external", 600, jitter=30),
+    Job("lunar_trends", "lunar_trends_ingest:run_cycle", "external", 900, jitter=30),
+    Job("lunar_influencers", "lunar_influencers_ingest:run_cycle", "external", 1200, jitter=30),
+    Job("lunar_mentions", "lunar_mentions_ingest:run_cycle", "external", 300, jitter=30),
+    Job("lunar_categories", "lunar_categories_ingest:run_cycle", "external", 300, jitter=30),
+    Job("debank_holdings", "debank_holdings_ingest:run_cycle", "external", 3600, jitter=60),
+    Job("etherscan_holdings", "etherscan_holdings_ingest:run_cycle", "external", 3600, jitter=60),
+    Job("coinapi", "ingesters.coinapi_ingest:run_cycle", "external", 300, jitter=15),
+    Job("coinglass", "ingesters.coinglass_ingest:ingest_all", "external", 1800, jitter=60),
+    Job("coinglass_liquidations", "coinglass_liquidations_ingest:run_cycle", "external", 1800, jitter=60),
+    Job("droptabs", "ingesters.droptabs_ingest:run_all", "external", 3600, jitter=60),
+
+    # ---- signals / AI enrichment / view refreshes ----
+    # the lookback-window AI jobs insert, so their cadence matches the lookback
+    Job("ai_signals", "ai_signal_job:run_ai_signals", "signals", 6 * 3600, jitter=60),
+    Job("ai_signals_funding", "ai_signals.ai_signals_funding:run_ai_signals", "signals", 6 * 3600, jitter=60),
+    Job("unlock_ai", "ai_signals.ai_signal_unlock_liquidity:run_job", "signals", 3600, jitter=60),
+    Job("ai_signals_core", "ai_signals.ai_signals_core_ingest:run_cycle", "signals", 600, jitter=30),
+    Job("ai_signals_midlong", "ai_signals.ai_signals_midlong_ingest:run_cycle", "signals", 600, jitter=30),
+    Job("shortterm_signals", "ai_signals.shortterm_signals:run", "signals", 300, jitter=15),
+    Job("daybias", "ai_signals.daybias_signals:run", "signals", 3600, jitter=60),
+    Job("signal_fast_engine_ai_summary", "ai_signals.signal_fast_engine_ai_summary:main", "signals", 300, jitter=15),
+    Job("refresh_market_structure", "refresh_market_structure:run", "signals", 300, jitter=15),
+]
+
+
+def resolve(target: str):
+    module, func = target.split(":")
+    return getattr(importlib.import_module(module), func)
+
+
+# ========= RUNNERS =========
+async def run_periodic(job: Job, executor: ThreadPoolExecutor):
+    """Run job.target every job.cadence seconds; a cycle never overlaps the previous one."""
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(random.uniform(0, STARTUP_SPREAD))
+    fn = None
+    while True:
+        await asyncio.sleep(random.uniform(0, job.jitter))
+        started = time.monotonic()
+        try:
+            if fn is None:
+                fn = resolve(job.target)
+            if inspect.iscoroutinefunction(fn):
+                await fn()
+            else:
+                await loop.run_in_executor(executor, fn)
+            print(f"[supervisor] ✅ {job.name} done in {time.monotonic() - started:.1f}s")
+            metrics.JOB_RUNS.labels(job.name, "ok").inc()
+            metrics.JOB_LAST_SUCCESS.labels(job.name).set(time.time())
+        except Exception as e:
+            print(f"[supervisor] ❌ {job.name} failed after {time.monotonic() - started:.1f}s: {e}")
+            metrics.JOB_RUNS.labels(job.name, "error").inc()
+
+        elapsed = time.monotonic() - started
+        metrics.JOB_CYCLE_SECONDS.labels(job.name).observe(elapsed)
+        if elapsed > job.cadence:
+            metrics.JOB_OVERRUNS.labels(job.name).inc()
+            print(f"[supervisor] ⚠️ {job.name} overran its {job.cadence:.0f}s cadence ({elapsed:.0f}s)")
+        await asyncio.sleep(max(0.0, job.cadence - elapsed))
+
+
+async def run_stream(job: Job):
+    """Keep a long-running coroutine alive, restarting it with backoff if it dies."""
+    backoff = 5
+    while True:
+        started = time.monotonic()
+        try:
+            await resolve(job.target)()
+            print(f"[supervisor] ⚠️ stream {job.name} returned, restarting")
+        except Exception as e:
+            print(f"[supervisor] ❌ stream {job.name} crashed: {e}")
+        metrics.STREAM_RESTARTS.labels(job.name).inc()
+        if time.monotonic() - started > STREAM_MAX_BACKOFF:
+            backoff = 5  # it ran fine for a while; don't punish a one-off crash
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, STREAM_MAX_BACKOFF)
+
+
+def select_jobs(groups=None, names=None) -> list[Job]:
+    jobs = [j for j in JOBS if j.name not in DISABLED]
+    if groups:
+        jobs = [j for j in jobs if j.group in groups]
+    if names:
+        unknown = set(names) - {j.name for j in JOBS}
+        if unknown:
+            raise SystemExit(f"Unknown job(s): {', '.join(sorted(unknown))}")
+        jobs = [j for j in jobs if j.name in names]
+    return jobs
+
+
+async def supervise(jobs: list[Job]):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    # one thread per sync job: a slow job can never starve another of a worker
+    sync_jobs = [j for j in jobs if j.every is not None]
+    executor = ThreadPoolExecutor(max_workers=max(1, len(sync_jobs)), thread_name_prefix="job")
+
+    metrics.start_server()
+
+    tasks = []
+    for job in jobs:
+        coro = run_stream(job) if job.every is None else run_periodic(job, executor)
+        tasks.append(asyncio.create_task(coro, name=job.name))
+    print(f"[supervisor] 🚀 running {len(tasks)} jobs: {', '.join(j.name for j in jobs)}")
+
+    await stop.wait()
+    print("[supervisor] 🛑 shutting down...")
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    from ingesters.binance_http import close_client
+    await close_client()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--group", help="comma-separated groups to run")
+    parser.add_argument("--jobs", help="comma-separated job names to run")
+    parser.add_argument("--list", action="store_true", help="print the job registry and exit")
+    args = parser.parse_args(argv)
+
+    groups = {g.strip() for g in args.group.split(",")} if args.group else None
+    names = {n.strip() for n in args.jobs.split(",")} if args.jobs else None
+    jobs = select_jobs(groups, names)
+
+    if args.list:
+        for j in jobs:
+            every = "stream" if j.every is None else f"every {j.cadence:.0f}s"
+            print(f"{j.group:<9} {j.name:<30} {every:<12} {j.target}")
+        return
+
+    if not jobs:
+        raise SystemExit("No jobs selected")
+    asyncio.run(supervise(jobs))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,51 @@
+"""Snapshot/diff sync rules of ingesters/local_book.py for spot and futures."""
+from ingesters.local_book import LocalBook
+
+
+def snapshot(last_update_id):
+    return {"lastUpdateId": last_update_id, "bids": [["99", "1"]], "asks": [["101", "1"]]}
+
+
+def test_spot_drops_event_ending_on_snapshot():
+    book = LocalBook("BTCUSDT", market="spot")
+    book.apply({"U": 95, "u": 100, "b": [["99", "5"]], "a": []})
+    book.apply({"U": 101, "u": 105, "b": [["98", "2"]], "a": []})
+    assert book.load_snapshot(snapshot(100))
+    assert book.synced and book.last_update_id == 105
+    # u == lastUpdateId was already in the snapshot, 101..105 applied
+    assert book.top(10)[0] == [(99.0, 1.0), (98.0, 2.0)]
+
+
+def test_spot_continuity_and_gap():
+    book = LocalBook("BTCUSDT", market="spot")
+    assert book.load_snapshot(snapshot(100))
+    assert book.apply({"U": 101, "u": 103, "b": [], "a": []})
+    assert book.apply({"U": 100, "u": 103, "b": [], "a": []})      # duplicate
+    assert not book.apply({"U": 105, "u": 107, "b": [], "a": []})  # 104 missing
+    assert not book.synced
+
+
+def test_spot_first_event_must_straddle():
+    book = LocalBook("BTCUSDT", market="spot")
+    book.apply({"U": 102, "u": 105, "b": [], "a": []})
+    assert not book.load_snapshot(snapshot(100))
+
+
+def test_perp_keeps_event_ending_on_snapshot():
+    book = LocalBook("BTCUSDT", market="perp")
+    book.apply({"U": 90, "u": 99, "pu": 89, "b": [], "a": []})
+    book.apply({"U": 95, "u": 100, "pu": 99, "b": [["99", "5"]], "a": []})
+    book.apply({"U": 101, "u": 104, "pu": 100, "b": [], "a": [["101", "0"]]})
+    assert book.load_snapshot(snapshot(100))
+    assert book.synced and book.last_update_id == 104
+    assert book.top(10) == ([(99.0, 5.0)], [])
+
+
+def test_perp_continuity_and_gap():
+    book = LocalBook("BTCUSDT", market="perp")
+    book.apply({"U": 98, "u": 102, "pu": 97, "b": [], "a": []})
+    assert book.load_snapshot(snapshot(100))
+    assert book.apply({"U": 100, "u": 102, "pu": 99, "b": [], "a": []})   # already applied
+    assert book.apply({"U": 103, "u": 106, "pu": 102, "b": [], "a": []})
+    assert not book.apply({"U": 108, "u": 110, "pu": 107, "b": [], "a": []})
+    assert not book.synced
@@ -0,0 +1,83 @@
+"""sql/partition_retention.sql against a real Postgres; skipped unless PG_DSN points at a scratch database."""
+import os
+import uuid
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+PG_DSN = os.getenv("PG_DSN")
+pytestmark = pytest.mark.skipif(not PG_DSN, reason="PG_DSN not set")
+
+SQL_PATH = os.path.join(os.path.dirname(__file__), "..", "sql", "partition_retention.sql")
+
+
+@pytest.fixture
+def conn():
+    with psycopg.connect(PG_DSN, autocommit=True) as c:
+        with open(SQL_PATH) as f:
+            c.execute(f.read())
+        yield c
+
+
+@pytest.fixture
+def table(conn):
+    """An unpartitioned table with 72 hours of history, one row a minute."""
+    name = f"_retention_test_{uuid.uuid4().hex[:8]}"
+    conn.execute(f"CREATE TABLE {name} (id bigserial, symbol text, ts timestamptz NOT NULL, PRIMARY KEY (symbol, id))")
+    conn.execute(f"""
+        INSERT INTO {name} (symbol, ts)
+        SELECT 'BTCUSDT', now() - make_interval(mins => m) FROM generate_series(0, 72 * 60 - 1) m
+    """)
+    yield name
+    conn.execute(f"DROP TABLE IF EXISTS {name} CASCADE")
+
+
+def _partitions(conn, table):
+    return conn.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = %s::regclass", (table,)).fetchone()[0]
+
+
+def test_partition_table_creates_partitions_and_keeps_retained_rows(conn, table):
+    conn.execute("SELECT retention_partition_table(%s, 'ts', 'hour', '24 hours')", (table,))
+    n, = conn.execute(f"SELECT count(*) FROM {table}").fetchone()
+    assert _partitions(conn, table) >= 25          # 24h back + the default + a couple ahead
+    assert 24 * 60 <= n <= 25 * 60
+    pk = conn.execute("""
+        SELECT array_agg(a.attname::text ORDER BY a.attname)
+        FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = %s::regclass AND i.indisprimary
+    """, (table,)).fetchone()[0]
+    assert pk == ["id", "symbol", "ts"]            # the partition key joins the primary key
+    # converting twice is a no-op, and serial ids keep counting
+    conn.execute("SELECT retention_partition_table(%s, 'ts', 'hour', '24 hours')", (table,))
+    new_id, = conn.execute(f"INSERT INTO {table} (symbol, ts) VALUES ('ETHUSDT', now()) RETURNING id").fetchone()
+    assert new_id > 72 * 60
+
+
+def test_maintain_attaches_new_partition_and_moves_default_rows(conn, table):
+    conn.execute("SELECT retention_partition_table(%s, 'ts', 'hour', '24 hours')", (table,))
+    conn.execute(f"INSERT INTO {table} (symbol, ts) VALUES ('BTCUSDT', now() + interval '5 hours')")
+    assert conn.execute(f"SELECT count(*) FROM {table}_default").fetchone()[0] == 1
+    before = _partitions(conn, table)
+
+    created, dropped = conn.execute(
+        "SELECT * FROM retention_maintain(%s, 'hour', '24 hours', 6)", (table,)).fetchone()
+    assert created >= 3 and dropped == 0
+    assert _partitions(conn, table) == before + created
+    assert conn.execute(f"SELECT count(*) FROM {table}_default").fetchone()[0] == 0
+    assert conn.execute(f"SELECT count(*) FROM {table} WHERE ts > now() + interval '4 hours'").fetchone()[0] == 1
+
+
+def test_maintain_drops_expired_partitions(conn, table):
+    conn.execute("SELECT retention_partition_table(%s, 'ts', 'hour', '24 hours')", (table,))
+    before = _partitions(conn, table)
+    created, dropped = conn.execute(
+        "SELECT * FROM retention_maintain(%s, 'hour', '6 hours', 2)", (table,)).fetchone()
+    n, oldest_age = conn.execute(f"SELECT count(*), extract(epoch FROM now() - min(ts)) FROM {table}").fetchone()
+    assert dropped >= 17
+    assert _partitions(conn, table) == before + created - dropped
+    assert n <= 7 * 60 + 1 and oldest_age <= 7 * 3600
+
+
+def test_maintain_rejects_unpartitioned_table(conn, table):
+    with pytest.raises(psycopg.errors.RaiseException):
+        conn.execute("SELECT * FROM retention_maintain(%s, 'hour', '24 hours')", (table,))
@@ -0,0 +1,63 @@
+"""PgCopySink against a real Postgres; skipped unless PG_DSN points at a scratch database."""
+import os
+import uuid
+from decimal import Decimal
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+PG_DSN = os.getenv("PG_DSN")
+pytestmark = pytest.mark.skipif(not PG_DSN, reason="PG_DSN not set")
+
+from ingesters.sinks import PgCopySink  # noqa: E402
+
+
+@pytest.fixture
+def conn():
+    with psycopg.connect(PG_DSN, autocommit=True) as c:
+        yield c
+
+
+@pytest.fixture
+def table(conn):
+    name = f"_sink_test_{uuid.uuid4().hex[:8]}"
+    yield name
+    conn.execute(f"DROP TABLE IF EXISTS {name}")
+    conn.execute(f"DROP TYPE IF EXISTS {name}_side")
+
+
+def test_binary_copy_upsert_covers_column_types(conn, table):
+    conn.execute(f"""
+        CREATE TABLE {table} (
+            symbol text, trade_id bigint, venue varchar(16), price numeric, qty double precision,
+            is_buyer_maker boolean, ts timestamptz, day date, meta jsonb, ref uuid,
+            prices double precision[], tags text[],
+            PRIMARY KEY (symbol, trade_id))
+    """)
+    ref = uuid.uuid4()
+    rows = [{
+        "symbol": "BTCUSDT", "trade_id": i, "venue": 7, "price": 65000.5 + i, "qty": 0.01,
+        "is_buyer_maker": i % 2 == 0, "ts": "2026-01-02T03:04:05Z", "day": "2026-01-02",
+        "meta": {"i": i}, "ref": str(ref), "prices": [1, 2.5, None], "tags": ["a", "b"],
+    } for i in range(500)]
+    sink = PgCopySink(table, mode="upsert")
+    assert sink.binary
+    sink.write(rows)
+    sink.write([dict(rows[0], qty=2.0, tags=["c"])])
+
+    n, = conn.execute(f"SELECT count(*) FROM {table}").fetchone()
+    got = conn.execute(f"SELECT venue, price, qty, meta, ref, prices, tags, day::text, ts "
+                       f"FROM {table} WHERE trade_id = 0").fetchone()
+    assert n == 500
+    assert got[:8] == ("7", Decimal("65000.5"), 2.0, {"i": 0}, ref, [1.0, 2.5, None], ["c"], "2026-01-02")
+    assert got[8].isoformat().startswith("2026-01-02T03:04:05")
+
+
+def test_unknown_type_falls_back_to_text_copy(conn, table):
+    conn.execute(f"CREATE TYPE {table}_side AS ENUM ('BUY', 'SELL')")
+    conn.execute(f"CREATE TABLE {table} (id bigint primary key, side {table}_side, qty float8)")
+    sink = PgCopySink(table, mode="insert")
+    assert not sink.binary
+    sink.write([{"id": 1, "side": "BUY", "qty": 1.5}, {"id": 2, "side": "SELL", "qty": None}])
+    assert conn.execute(f"SELECT id, side::text, qty FROM {table} ORDER BY id").fetchall() == \
+        [(1, "BUY", 1.5), (2, "SELL", None)]
@@ -0,0 +1,114 @@
+"""sql/trade_bucket_merge.sql against a real Postgres; skipped unless PG_DSN points at a scratch database."""
+import os
+import json
+import uuid
+
+import pytest
+
+from ingesters.trade_buckets import TradeBuckets, bucket_rows, agg_rows
+
+psycopg = pytest.importorskip("psycopg")
+PG_DSN = os.getenv("PG_DSN")
+pytestmark = pytest.mark.skipif(not PG_DSN, reason="PG_DSN not set")
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), "..", "sql")
+T0 = 1_700_000_000_000 - 1_700_000_000_000 % 86_400_000
+# the legacy tables predate sql/; just the columns the merge functions touch
+LEGACY = """
+CREATE TABLE binance_trades_agg (symbol text, bucket_15m timestamptz, bucket_1h timestamptz, bucket_1d timestamptz,
+    buy_vol float8, sell_vol float8, delta float8, bullish_trades int, bearish_trades int, cvd float8);
+CREATE TABLE binance_trades_agg_5m (symbol text, bucket_5m timestamptz,
+    buy_vol float8, sell_vol float8, delta float8, bullish_trades int, bearish_trades int, cvd float8);
+"""
+
+
+@pytest.fixture
+def conn():
+    """A throwaway schema holding the bucket tables and their merge functions."""
+    schema = f"_merge_test_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(PG_DSN, autocommit=True) as c:
+        c.execute(f"CREATE SCHEMA {schema}")
+        c.execute(f"SET search_path = {schema}")
+        c.execute(LEGACY)
+        for name in ("binance_trade_buckets.sql", "trade_bucket_merge.sql"):
+            with open(os.path.join(SQL_DIR, name)) as f:
+                c.execute(f.read())
+        yield c
+        c.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+def merge(conn, rows, replace=False, table="binance_trade_buckets"):
+    conn.execute(f"SELECT merge_{table}(%s::jsonb, replace => %s)", (json.dumps(rows), replace))
+
+
+def stored(conn):
+    cur = conn.execute("""
+        SELECT bucket_start, buy_vol, sell_vol, buy_trades, sell_trades, base_vol, cvd, first_trade_id, last_trade_id
+        FROM binance_trade_buckets WHERE resolution = '1m' ORDER BY bucket_start
+    """)
+    return [tuple(r) for r in cur.fetchall()]
+
+
+def drained(tb, trades):
+    """1m bucket rows for trades [(id, ms offset, qty, is_sell)] at price 100."""
+    for i, dt, qty, sell in trades:
+        tb.add("BTCUSDT", T0 + dt, 100.0, qty, sell, i)
+    return bucket_rows({"1m": tb.drain()["1m"]})
+
+
+def test_increments_sum_and_replay_is_noop(conn):
+    tb = TradeBuckets({"1m": 60_000})
+    first = drained(tb, [(1, 0, 1.0, False), (2, 1_000, 2.0, True)])
+    second = drained(tb, [(3, 2_000, 1.0, False)])
+    merge(conn, first)
+    merge(conn, second)
+    once = stored(conn)
+    assert once == [(once[0][0], 200.0, 200.0, 2, 1, 4.0, 0.0, 1, 3)]
+    merge(conn, first)              # writer retry / spool replay
+    merge(conn, second + second)    # duplicated within a chunk
+    assert stored(conn) == once
+
+
+def test_overlapping_increment_is_rejected(conn):
+    merge(conn, drained(TradeBuckets({"1m": 60_000}), [(1, 0, 1.0, False), (2, 1_000, 1.0, False)]))
+    before = stored(conn)
+    # a second engine that restarted without its checkpoint re-sends ids 2..3
+    merge(conn, drained(TradeBuckets({"1m": 60_000}), [(2, 1_000, 1.0, False), (3, 2_000, 1.0, False)]))
+    assert stored(conn) == before
+
+
+def test_replace_rebuilds_partial_bucket(conn):
+    trades = [(i, i * 10, 1.0, i % 2 == 0) for i in range(1, 300)]
+    merge(conn, drained(TradeBuckets({"1m": 60_000}), trades[119:200]))   # ids 120..200 only
+    full = drained(TradeBuckets({"1m": 60_000}), trades)
+    merge(conn, full)
+    assert stored(conn)[0][-2:] == (120, 200)                             # plain merge cannot repair it
+    merge(conn, full, replace=True)
+    repaired = stored(conn)
+    assert repaired[0][3:5] == (150, 149) and repaired[0][-2:] == (1, 299)
+    merge(conn, full, replace=True)                                       # and replaying the repair is a no-op
+    assert stored(conn) == repaired
+
+
+def test_cvd_correction_never_undoes_a_newer_increment(conn):
+    tb = TradeBuckets({"1m": 60_000})
+    merge(conn, drained(tb, [(1, 0, 1.0, False), (2, 61_000, 2.0, True)]))
+    assert [r[6] for r in stored(conn)] == [100.0, -100.0]
+    late = drained(tb, [(3, 1_000, 3.0, False)])                          # late buy in minute 0
+    assert [r["first_trade_id"] for r in late] == [3, None]
+    merge(conn, late)
+    assert [r[6] for r in stored(conn)] == [400.0, 200.0]
+    # a correction drained before minute 1's trade (id 2) was merged
+    merge(conn, [dict(late[1], cvd=-999.0, last_trade_id=1)])
+    assert [r[6] for r in stored(conn)] == [400.0, 200.0]
+
+
+def test_legacy_agg_merge_is_idempotent(conn):
+    tb = TradeBuckets({"15m": 900_000})
+    for i in range(1, 4):
+        tb.add("BTCUSDT", T0 + i * 1_000, 100.0, 1.0, i == 2, i)
+    rows = agg_rows(tb.drain())
+    merge(conn, rows, table="binance_trades_agg")
+    merge(conn, rows, table="binance_trades_agg")
+    got = conn.execute("SELECT buy_vol, sell_vol, bullish_trades, bearish_trades, last_trade_id FROM binance_trades_agg").fetchall()
+    assert [tuple(r) for r in got] == [(200.0, 100.0, 2, 1, 3)]
@@ -0,0 +1,128 @@
+"""TradeBuckets increments: columnar vs per-trade adds, split drains, late-trade CVD corrections."""
+import random
+
+import pytest
+
+from ingesters.trade_buckets import TradeBuckets, bucket_rows
+
+T0 = 1_700_000_000_000 - 1_700_000_000_000 % 86_400_000   # a UTC midnight
+
+
+def trades(n=3000, symbols=("BTCUSDT", "ETHUSDT"), seed=7):
+    """/trades-shaped dicts over ~3 hours, ids increasing per symbol."""
+    rnd = random.Random(seed)
+    out, ids = [], {s: 1000 for s in symbols}
+    ts = T0
+    for _ in range(n):
+        ts += rnd.randint(0, 7_000)
+        s = rnd.choice(symbols)
+        ids[s] += rnd.randint(1, 3)
+        out.append((s, {"id": ids[s], "time": ts, "price": f"{rnd.uniform(90, 110):.2f}",
+                        "qty": f"{rnd.uniform(0.001, 2):.4f}", "isBuyerMaker": rnd.random() < 0.5}))
+    return out
+
+
+def add_each(tb, items):
+    for s, t in items:
+        tb.add_trades(s, [t])
+
+
+def add_columns(tb, items):
+    tb.add_arrays([s for s, _ in items], [t["time"] for _, t in items], [float(t["price"]) for _, t in items],
+                  [float(t["qty"]) for _, t in items], [t["isBuyerMaker"] for _, t in items],
+                  [t["id"] for _, t in items])
+
+
+def by_key(rows):
+    return {(r["symbol"], r["resolution"], r["bucket_start"]): r for r in rows}
+
+
+def assert_rows_equal(a, b):
+    a, b = by_key(a), by_key(b)
+    assert a.keys() == b.keys()
+    for k in a:
+        for col, v in a[k].items():
+            assert b[k][col] == (pytest.approx(v) if isinstance(v, float) else v), (k, col)
+
+
+def summed(drains):
+    """Fold per-drain increments into one row per bucket, as the merge functions do."""
+    out = {}
+    for rows in drains:
+        for r in rows:
+            if r["first_trade_id"] is None:
+                continue
+            k = (r["symbol"], r["resolution"], r["bucket_start"])
+            cur = out.get(k)
+            if cur is None:
+                out[k] = dict(r)
+                continue
+            assert r["first_trade_id"] > cur["last_trade_id"]   # increments never overlap
+            for col in ("buy_vol", "sell_vol", "delta", "buy_trades", "sell_trades", "quote_vol", "base_vol"):
+                cur[col] += r[col]
+            cur["vwap"] = cur["quote_vol"] / cur["base_vol"]
+            cur["cvd"], cur["last_trade_id"] = r["cvd"], r["last_trade_id"]
+    return list(out.values())
+
+
+def test_add_arrays_matches_add_trades():
+    items = trades()
+    a, b = TradeBuckets(), TradeBuckets()
+    add_each(a, items)
+    add_columns(b, items)
+    assert_rows_equal(bucket_rows(a.drain()), bucket_rows(b.drain()))
+
+
+def test_incremental_drains_sum_to_one_drain():
+    items = trades()
+    whole, split = TradeBuckets(), TradeBuckets()
+    add_each(whole, items)
+    drains = []
+    for i in range(0, len(items), 250):
+        add_each(split, items[i:i + 250])
+        drains.append(bucket_rows(split.drain()))
+    assert_rows_equal(bucket_rows(whole.drain()), summed(drains))
+
+
+def test_replayed_trades_are_skipped():
+    items = trades(500)
+    tb = TradeBuckets()
+    add_each(tb, items)
+    tb.drain()
+    add_each(tb, items)
+    add_columns(tb, items)
+    assert tb.drain() == {r: [] for r in tb.resolutions}
+
+
+def test_aggtrade_counts_every_trade_in_range():
+    a, b = TradeBuckets(), TradeBuckets()
+    a.add("BTCUSDT", T0, 100.0, 3.0, False, 12, 10)
+    a.add("BTCUSDT", T0 + 1, 100.0, 1.0, True, 13, 13)
+    b.add_arrays("BTCUSDT", [T0, T0 + 1], [100.0, 100.0], [3.0, 1.0], [False, True], [12, 13], [10, 13])
+    ra, rb = bucket_rows(a.drain()), bucket_rows(b.drain())
+    assert_rows_equal(ra, rb)
+    row, = [r for r in ra if r["resolution"] == "1m"]
+    assert (row["buy_trades"], row["sell_trades"], row["first_trade_id"]) == (3, 1, 10)
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_late_trade_corrects_cvd_of_later_buckets(columnar):
+    tb = TradeBuckets({"1m": 60_000})
+    add = (lambda s, t: add_columns(tb, [(s, t)])) if columnar else (lambda s, t: tb.add_trades(s, [t]))
+    trade = lambda i, ts, qty, sell: {"id": i, "time": ts, "price": "100", "qty": str(qty), "isBuyerMaker": sell}
+    add("BTCUSDT", trade(1, T0 + 1_000, 1, False))       # minute 0: +100
+    add("BTCUSDT", trade(2, T0 + 61_000, 2, True))       # minute 1: -200
+    add("BTCUSDT", trade(3, T0 + 121_000, 1, False))     # minute 2: +100
+    first = {r["bucket_start"]: r["cvd"] for r in bucket_rows(tb.drain())}
+    assert list(first.values()) == [100.0, -100.0, 0.0]
+
+    # a buy for minute 0 arrives after minute 2 was written (a higher id, like a gap fill)
+    add("BTCUSDT", trade(4, T0 + 2_000, 3, False))       # minute 0: +300
+    rows = bucket_rows(tb.drain())
+    inc = [r for r in rows if r["first_trade_id"] is not None]
+    fixes = {r["bucket_start"]: r for r in rows if r["first_trade_id"] is None}
+    assert [(r["delta"], r["cvd"]) for r in inc] == [(300.0, 400.0)]
+    assert sorted(fixes) == sorted(list(first)[1:])
+    assert [fixes[k]["cvd"] for k in sorted(fixes)] == [200.0, 300.0]
+    assert all(r["buy_vol"] == r["sell_vol"] == r["buy_trades"] == 0 and r["last_trade_id"] == 4
+               for r in fixes.values())